@@ -0,0 +1,272 @@
+# BatchEval.py - evaluates many positions at once with NumPy: winners, valid moves, next keys and threats
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from Bitboard import GetLayout
+from BatchRollout import HasLines
+
+
+def Pack(masks1, masks2):
+    '''
+    Returns the boards given as the bitboards of player 1 and of player 2 (see Bitboard.BitboardLayout)
+    as one (N, 2) uint64 array, the input of BatchEval. Raises a ValueError if a bitboard does not fit in
+    64 bits.
+    '''
+    try:
+        return numpy.column_stack((numpy.asarray(masks1, dtype=numpy.uint64),
+                                   numpy.asarray(masks2, dtype=numpy.uint64)))
+    except OverflowError:
+        raise ValueError('Bitboards wider than 64 bits, the board is too large for BatchEval')
+
+
+def PackGames(games):
+    '''
+    Returns the boards of Connect4 games as an (N, 2) uint64 array, and the players to move as an int8 array.
+    Raises a ValueError if a board has more than 64 bits (columns * (rows+1)).
+    '''
+    for layout in set(game.layout for game in games):
+        if layout.columns * layout.height > 64:
+            raise ValueError('Board too large for BatchEval: {}x{}'.format(layout.rows, layout.columns))
+    boards = Pack([game.masks[1] for game in games], [game.masks[2] for game in games])
+    players = numpy.array([game.GetCurrentPlayer() for game in games], dtype=numpy.int8)
+    return boards, players
+
+
+def BitCounts(masks):
+    '''
+    Returns the number of bits set in each element of a uint64 array, with word-wide arithmetic only
+    (no table lookup): the bits are summed in pairs, nibbles, then bytes
+    '''
+    masks = masks - ((masks >> numpy.uint64(1)) & numpy.uint64(0x5555555555555555))
+    masks = (masks & numpy.uint64(0x3333333333333333)) + ((masks >> numpy.uint64(2)) & numpy.uint64(0x3333333333333333))
+    masks = (masks + (masks >> numpy.uint64(4))) & numpy.uint64(0x0f0f0f0f0f0f0f0f)
+    return ((masks * numpy.uint64(0x0101010101010101)) >> numpy.uint64(56)).astype(numpy.int8)
+
+
+# multiplying a single bit mask by DE_BRUIJN moves a distinct 6 bits sequence to the top bits for each of
+# the 64 bits: the bit index of the mask without looking at its bits one by one
+DE_BRUIJN = numpy.uint64(0x03f79d71b4cb0a89) if numpy is not None else None
+
+
+def DeBruijnIndex(bit):
+    '''
+    The top 6 bits of bit * DE_BRUIJN, a single bit mask, as computed on uint64 arrays
+    '''
+    return ((bit * 0x03f79d71b4cb0a89) & 0xffffffffffffffff) >> 58
+
+
+class BatchEval(object):
+    '''
+    BatchEval: vectorized queries on a batch of positions of the same board size.
+
+    The N positions are an (N, 2) uint64 array, the bitboards of player 1 and player 2 of each position
+    (see Pack and PackGames), and every query is a few operations on whole arrays instead of one Connect4
+    object and a few Python calls per position. The columns of a position must be filled from the bottom
+    up, as in a game. The players to move, an array of 1 and 2, default to the ones of games started by
+    player 1: player 1 after an even number of pieces, player 2 after an odd one.
+
+    The Zobrist keys are computed 16 bits of each bitboard at a time: keyTables[player - 1][chunk][value]
+    is the XOR of the numbers of the bits set in value, shifted to the chunk. Array lookups cost several
+    times a word-wide operation, so the other queries only use arithmetic and logical operations, but
+    for the Zobrist number of the playable cell of each column, found by its de Bruijn index.
+    Evaluate works on blockSize positions at a time, whatever the size of the batch.
+    Requires numpy, and boards of at most 64 bits (columns * (rows+1) <= 64).
+    '''
+    def __init__(self, rows=6, columns=7, n=4, blockSize=32768):
+        if numpy is None:
+            raise Exception('BatchEval requires numpy')
+        layout = GetLayout(rows, columns)
+        size = columns * layout.height
+        if size > 64:
+            raise Exception('Board too large for BatchEval: {}x{}'.format(rows, columns))
+        self.layout = layout
+        self.n = n
+        self.blockSize = blockSize
+
+        # zobrist numbers of the single bit masks, by their de Bruijn index: (p - 1) * 64 + DeBruijnIndex(bit)
+        self.moveNumbers = numpy.zeros(128, dtype=numpy.uint64)
+        for player in (1, 2):
+            for index in xrange(size):
+                self.moveNumbers[(player - 1) * 64 + DeBruijnIndex(1 << index)] = layout.zobrist[player][index]
+        self.chunks = (size + 15) // 16
+        values = numpy.arange(1 << 16, dtype=numpy.uint64)
+        self.keyTables = numpy.zeros((2, self.chunks, 1 << 16), dtype=numpy.uint64)
+        for player in (1, 2):
+            numbers = layout.zobrist[player] + [0] * (16 * self.chunks - size)
+            for chunk in xrange(self.chunks):
+                table = self.keyTables[player - 1, chunk]
+                for bit in xrange(16):
+                    table ^= numpy.uint64(numbers[chunk * 16 + bit]) * ((values >> numpy.uint64(bit)) & numpy.uint64(1))
+
+        self.bottomMask = numpy.uint64(sum(layout.bottomMasks))
+        self.fullMask = numpy.uint64(layout.fullMask)
+        self.columnMasks = [numpy.uint64(mask) for mask in layout.columnMasks]
+
+    def _Masks(self, boards):
+        '''
+        The bitboards of player 1 and of player 2, as contiguous little-endian arrays (the keys are looked
+        up 16 bits at a time, and strided columns are several times slower to operate on)
+        '''
+        boards = numpy.asarray(boards, dtype='<u8')
+        return numpy.ascontiguousarray(boards[:, 0]), numpy.ascontiguousarray(boards[:, 1])
+
+    def Evaluate(self, boards, players=None):
+        '''
+        Returns (winners, valid moves, next keys, threats) of the positions, see the methods of the same name
+        '''
+        boards = numpy.asarray(boards, dtype=numpy.uint64)
+        if players is not None:
+            players = numpy.asarray(players)
+        count = len(boards)
+        columns = self.layout.columns
+        winners = numpy.empty(count, dtype=numpy.int8)
+        # column by column, as _Moves and _Lines compute them, returned transposed
+        valid = numpy.empty((columns, count), dtype=bool)
+        nextKeys = numpy.empty((columns, count), dtype=numpy.uint64)
+        threats = numpy.empty((2, count), dtype=numpy.int8)
+        # block by block, so that the arrays of the intermediate results stay in the processor cache
+        for start in xrange(0, count, self.blockSize):
+            block = slice(start, start + self.blockSize)
+            masks1, masks2 = self._Masks(boards[block])
+            blockPlayers = self._Players(masks1, masks2) if players is None else players[block]
+            self._Moves(masks1, masks2, blockPlayers, valid[:, block], nextKeys[:, block])
+            playable = self._Playable(masks1, masks2)
+            threats[0, block], lines1 = self._Lines(masks1, playable)
+            threats[1, block], lines2 = self._Lines(masks2, playable)
+            winners[block] = numpy.where(lines1, 1, numpy.where(lines2, 2, 0))
+        return winners, valid.T, nextKeys.T, threats.T
+
+    def Players(self, boards):
+        '''
+        Returns the players to move of games started by player 1, an int8 array
+        '''
+        return self._Players(*self._Masks(boards))
+
+    def Winners(self, boards):
+        '''
+        Returns the winner of each position as an int8 array, 1 or 2, or 0 if there is none
+        (1 if both players have a line, as Connect4 does)
+        '''
+        return self._Winners(*self._Masks(boards))
+
+    def ValidMoves(self, boards):
+        '''
+        Returns which columns can be played in each position, an (N, columns) bool array
+        '''
+        return self._ValidMoves(*self._Masks(boards))
+
+    def Keys(self, boards):
+        '''
+        Returns the Zobrist key of each position (see Connect4.GetKey), a uint64 array
+        '''
+        return self._Keys(*self._Masks(boards))
+
+    def NextKeys(self, boards, players=None):
+        '''
+        Returns the key of each position after each move of the player to move (see Connect4.GetNextKey),
+        an (N, columns) uint64 array, 0 for the columns that are full
+        '''
+        masks1, masks2 = self._Masks(boards)
+        if players is None:
+            players = self._Players(masks1, masks2)
+        return self._Moves(masks1, masks2, players)[1]
+
+    def Threats(self, boards):
+        '''
+        Returns the number of immediate threats of each player in each position: the columns where the
+        player would complete a line with its next piece. An (N, 2) int8 array, the threats of player 1
+        then of player 2, whoever is to move.
+        '''
+        return self._Threats(*self._Masks(boards))
+
+    def _Players(self, masks1, masks2):
+        # the players alternate, player 2 moves after an odd number of pieces
+        return (BitCounts(masks1 | masks2) & 1) + 1
+
+    def _Winners(self, masks1, masks2):
+        winners = numpy.zeros(len(masks1), dtype=numpy.int8)
+        winners[HasLines(masks2, self.layout, self.n)] = 2
+        winners[HasLines(masks1, self.layout, self.n)] = 1
+        return winners
+
+    def _Playable(self, masks1, masks2):
+        '''
+        The lowest empty cell of each column: adding the bottom bits carries over the pieces
+        '''
+        return ((masks1 | masks2) + self.bottomMask) & self.fullMask
+
+    def _ValidMoves(self, masks1, masks2):
+        playable = self._Playable(masks1, masks2)
+        valid = numpy.empty((self.layout.columns, len(masks1)), dtype=bool)
+        for column, columnMask in enumerate(self.columnMasks):
+            numpy.not_equal(playable & columnMask, 0, out=valid[column])
+        return valid.T
+
+    def _Keys(self, masks1, masks2):
+        keys = numpy.zeros(len(masks1), dtype=numpy.uint64)
+        for masks, tables in ((masks1, self.keyTables[0]), (masks2, self.keyTables[1])):
+            chunks = masks.view('<u2').reshape(len(masks), 4)
+            for chunk in xrange(self.chunks):
+                keys ^= tables[chunk].take(chunks[:, chunk])
+        return keys
+
+    def _Moves(self, masks1, masks2, players, valid=None, nextKeys=None):
+        '''
+        Returns the valid moves and the next keys, which both start from the playable cell of each column.
+        valid and nextKeys, (columns, N) arrays, are filled if given.
+        '''
+        keys = self._Keys(masks1, masks2)
+        playable = self._Playable(masks1, masks2)
+        offsets = (numpy.asarray(players, dtype=numpy.uint64) - numpy.uint64(1)) * numpy.uint64(64)
+        if valid is None:
+            valid = numpy.empty((self.layout.columns, len(masks1)), dtype=bool)
+            nextKeys = numpy.empty((self.layout.columns, len(masks1)), dtype=numpy.uint64)
+        for column, columnMask in enumerate(self.columnMasks):
+            cells = playable & columnMask
+            numpy.not_equal(cells, 0, out=valid[column])
+            cells *= DE_BRUIJN
+            cells >>= numpy.uint64(58)
+            cells += offsets
+            numpy.bitwise_xor(keys, self.moveNumbers.take(cells.view(numpy.int64)), out=nextKeys[column])
+            nextKeys[column] *= valid[column]
+        return valid.T, nextKeys.T
+
+    def _Threats(self, masks1, masks2):
+        playable = self._Playable(masks1, masks2)
+        threats = numpy.empty((2, len(masks1)), dtype=numpy.int8)
+        for player, masks in enumerate((masks1, masks2)):
+            threats[player] = self._Lines(masks, playable)[0]
+        return threats.T
+
+    def _Lines(self, masks, playable):
+        '''
+        Returns the number of playable cells completing a line of the masks, and whether the masks have a
+        line already: both come from the cells with n - 1 pieces in a row before them, in a direction.
+        The cells of a segment crossing a padding bit or the ends of the board are never all set, as in
+        HasLines.
+        '''
+        n = self.n
+        cells = numpy.zeros(masks.shape, dtype=numpy.uint64)
+        lines = numpy.zeros(masks.shape, dtype=numpy.uint64)
+        for shift in self.layout.shifts:
+            # above[i] and below[i]: the cell has i pieces in a row after it, or before it, in the direction
+            above = [None] * n
+            below = [None] * n
+            below[1] = masks << numpy.uint64(shift)
+            for i in xrange(2, n):
+                below[i] = below[i - 1] & (masks << numpy.uint64(i * shift))
+            cells |= below[n - 1]
+            lines |= below[n - 1] & masks
+            if shift == 1:
+                # vertical: the cells above a playable cell are empty
+                continue
+            above[1] = masks >> numpy.uint64(shift)
+            for i in xrange(2, n):
+                above[i] = above[i - 1] & (masks >> numpy.uint64(i * shift))
+            cells |= above[n - 1]
+            for i in xrange(1, n - 1):
+                cells |= above[i] & below[n - 1 - i]
+        return BitCounts(cells & playable), lines != 0
@@ -0,0 +1,94 @@
+# BatchRollout.py - plays many random games from the same position at once with NumPy
+
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def HasLines(masks, layout, n):
+    '''
+    Vectorized BitboardLayout.HasLine: masks is a numpy uint64 array of bitboards, returns a bool array
+    telling which of them have n consecutive bits set in any of the four directions
+    '''
+    found = numpy.zeros(masks.shape, dtype=bool)
+    for shift in layout.shifts:
+        # m has a bit set where length bits are set in a row: two overlapping rows of length make one of
+        # up to 2 * length, so n takes log2(n) steps instead of n - 1
+        m = masks
+        length = 1
+        while length < n:
+            step = min(length, n - length)
+            m = m & (m >> numpy.uint64(step * shift))
+            length += step
+        found |= m != 0
+    return found
+
+
+class BatchRollout(object):
+    '''
+    BatchRollout: random playouts of a batch of games in lockstep.
+
+    The games all start from the same position, so the player to move is the same for every game at every
+    step. Each game is a pair of uint64 bitboards (see Bitboard.BitboardLayout) plus its column heights,
+    and a random valid column is drawn for all the games still running with a few array operations.
+    Requires numpy, and boards of at most 64 bits (columns * (rows+1) <= 64).
+    '''
+    def __init__(self, size=64, seed=None):
+        if numpy is None:
+            raise Exception('BatchRollout requires numpy')
+        self.size = size
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.random = numpy.random.RandomState(seed)
+
+    def Run(self, game, maxDepth=None):
+        '''
+        Play self.size random games from the game position, for at most maxDepth moves each.
+        Returns (wins of player 1, wins of player 2, draws); games stopped by maxDepth count as draws.
+        '''
+        layout = game.layout
+        if layout.columns * layout.height > 64:
+            raise Exception('Board too large for BatchRollout: {}x{}'.format(layout.rows, layout.columns))
+        n = game.GetNConscecutivesToWin()
+        size = self.size
+
+        masks = [None,
+                 numpy.full(size, game.masks[1], dtype=numpy.uint64),
+                 numpy.full(size, game.masks[2], dtype=numpy.uint64)]
+        heights = numpy.tile(numpy.array(game.heights, dtype=numpy.int64), (size, 1))
+        # bit index of the bottom cell of each column
+        columnBase = numpy.arange(layout.columns, dtype=numpy.int64) * layout.height
+        winners = numpy.zeros(size, dtype=numpy.int8)
+        running = numpy.ones(size, dtype=bool)
+        games = numpy.arange(size)
+
+        if maxDepth is None:
+            maxDepth = layout.rows * layout.columns
+        playerId = game.GetCurrentPlayer()
+        for _ in xrange(maxDepth):
+            # pick a random valid column for each game, a full board ends the game
+            valid = heights < layout.rows
+            scores = self.random.random_sample(heights.shape) + 1.0
+            scores *= valid
+            moves = scores.argmax(axis=1)
+            running &= valid.any(axis=1)
+            if not running.any():
+                break
+
+            rows = heights[games, moves]
+            bits = numpy.left_shift(numpy.uint64(1), (columnBase[moves] + rows).astype(numpy.uint64))
+            bits *= running.astype(numpy.uint64)
+            masks[playerId] |= bits
+            heights[games, moves] += running
+
+            won = running & HasLines(masks[playerId], layout, n)
+            winners[won] = playerId
+            running &= ~won
+            playerId = playerId % 2 + 1
+
+        wins1 = int(numpy.count_nonzero(winners == 1))
+        wins2 = int(numpy.count_nonzero(winners == 2))
+        return wins1, wins2, size - wins1 - wins2
@@ -0,0 +1,361 @@
+#!/usr/bin/python
+
+# Benchmark.py - measures the throughput of the game engine and of the MCTS simulation, and compares the
+# results with a saved baseline
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+from Connect4 import Connect4
+from LogConfig import ConfigureLogging
+from MctsPlayer import MctsPlayer
+from NodeTable import NodeTable, WIN, LOSE
+import BatchRollout
+import BatchEval
+
+# positions GetMove is timed on, as the moves played from the empty board
+REFERENCE_POSITIONS = [
+    ('opening', []),
+    # not solved within 20000 solver nodes
+    ('midgame', [4, 1, 4, 5, 3, 4, 4, 1, 4, 3, 2, 1, 5, 3]),
+    # few enough empty cells to be solved by the endgame solver
+    ('endgame', [3, 3, 2, 4, 4, 2, 5, 1, 1, 5, 6, 0, 0, 6, 3, 3, 1, 0, 2, 5, 1, 4, 4, 2, 3, 0, 0, 1]),
+]
+
+# units of the results where lower is better, higher is better for the others
+LOWER_IS_BETTER = ('bytes', 'ms')
+
+
+def MakeReferencePosition(moves):
+    game = Connect4(None, None)
+    for move in moves:
+        game.Move(game.GetCurrentPlayer(), move)
+    return game
+
+
+def MakePositions(count, seed):
+    '''
+    Build a list of reproducible mid-game positions by playing random moves from the empty board.
+    Games that end before reaching the target ply are discarded.
+    '''
+    rand = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = Connect4(None, None)
+        plies = rand.randint(4, 20)
+        for _ in xrange(plies):
+            validMoves = game.GetValidMoves()
+            if game.GetWinner() is not None or len(validMoves) == 0:
+                break
+            game.Move(game.GetCurrentPlayer(), rand.choice(validMoves))
+        else:
+            positions.append(game)
+    return positions
+
+
+def Measure(func, repeat, rounds=3):
+    '''
+    Call func() repeat times, rounds times, return the number of calls per second of the fastest round
+    (the slower ones measure the other loads of the machine as well)
+    '''
+    elapsed = float('inf')
+    for _ in xrange(rounds):
+        beginTime = time.time()
+        for _ in xrange(repeat):
+            func()
+        elapsed = min(elapsed, time.time() - beginTime)
+    return repeat / elapsed if elapsed > 0 else float('inf')
+
+
+def BenchPrimitives(positions, repeat):
+    results = []
+
+    def RunMoves():
+        for game in positions:
+            copiedGame = game.Copy()
+            copiedGame.Move(copiedGame.GetCurrentPlayer(), copiedGame.GetValidMoves()[0])
+    results.append(('Copy+Move', Measure(RunMoves, repeat) * len(positions), 'ops/s'))
+
+    def RunMoveUndo():
+        for game in positions:
+            game.Move(game.GetCurrentPlayer(), game.GetValidMoves()[0])
+            game.Undo()
+    results.append(('Move+Undo', Measure(RunMoveUndo, repeat) * len(positions), 'ops/s'))
+
+    def RunGetWinner():
+        for game in positions:
+            game.GetWinner()
+    results.append(('GetWinner', Measure(RunGetWinner, repeat) * len(positions), 'ops/s'))
+
+    def RunGetValidMoves():
+        for game in positions:
+            game.GetValidMoves()
+    results.append(('GetValidMoves', Measure(RunGetValidMoves, repeat) * len(positions), 'ops/s'))
+
+    def RunGetNextState():
+        for game in positions:
+            game.GetNextState(game.GetCurrentPlayer(), game.GetValidMoves()[0])
+    results.append(('GetNextState', Measure(RunGetNextState, repeat) * len(positions), 'ops/s'))
+
+    def RunGetNextKey():
+        for game in positions:
+            game.GetNextKey(game.GetCurrentPlayer(), game.GetValidMoves()[0])
+    results.append(('GetNextKey', Measure(RunGetNextKey, repeat) * len(positions), 'ops/s'))
+
+    def RunCopy():
+        for game in positions:
+            game.Copy()
+    results.append(('Copy', Measure(RunCopy, repeat) * len(positions), 'ops/s'))
+    return results
+
+
+def BenchNodeTable(count, repeat, seed):
+    '''
+    Measure the memory used per node (from the growth of the peak resident size, so run it first)
+    and the NodeTable.Update rate
+    '''
+    rand = random.Random(seed)
+    keys = [rand.getrandbits(63) for _ in xrange(count)]
+    beginRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    table = NodeTable()
+    for key in keys:
+        node = table.Expand(key)
+        # realistic counts, beyond the small int cache
+        node.totals, node.wins, node.draws, node.loses = 1000, 400, 300, 300
+    bytesPerNode = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - beginRss) * 1024.0 / count
+
+    path = [table.Lookup(key) for key in keys[:20]]
+    def RunUpdates():
+        for node in path:
+            table.Update(node, WIN)
+            table.Update(node, LOSE)
+    return [('Node memory', bytesPerNode, 'bytes'),
+            ('NodeTable.Update', Measure(RunUpdates, repeat * 100) * len(path) * 2, 'ops/s')]
+
+
+def BenchSimulate(seconds, seed, size=None):
+    '''
+    Measure MctsPlayer.Simulate from the empty board, size is (rows, columns, n) or None for the standard game
+    '''
+    random.seed(seed)
+    if size is None:
+        game = Connect4(None, None)
+        name = 'Simulate'
+    else:
+        rows, columns, n = size
+        game = Connect4(None, None, rows=rows, columns=columns, n=n)
+        name = 'Simulate {}x{}x{}'.format(rows, columns, n)
+    player = MctsPlayer(1)
+    count = 0
+    beginTime = time.time()
+    while time.time() - beginTime < seconds:
+        # Simulate plays on the game and takes its moves back
+        player.Simulate(game)
+        count += 1
+    return [(name, count / (time.time() - beginTime), 'sims/s')]
+
+
+def BenchRollouts(seconds, seed, batchSize):
+    '''
+    Measure the random rollouts played from the empty board per second, one game at a time through
+    Connect4.Move/GetWinner, then with BatchRollout
+    '''
+    rand = random.Random(seed)
+    game = Connect4(None, None)
+    count = 0
+    beginTime = time.time()
+    while time.time() - beginTime < seconds:
+        validMoves = game.GetValidMoves()
+        while game.GetWinner() is None and len(validMoves) > 0:
+            game.Move(game.GetCurrentPlayer(), rand.choice(validMoves))
+            validMoves = game.GetValidMoves()
+        game.Undo(len(game.moves))
+        count += 1
+    results = [('Rollout', count / (time.time() - beginTime), 'games/s')]
+
+    if BatchRollout.numpy is not None:
+        batch = BatchRollout.BatchRollout(batchSize, seed)
+        count = 0
+        beginTime = time.time()
+        while time.time() - beginTime < seconds:
+            batch.Run(game)
+            count += batchSize
+        results.append(('BatchRollout x{}'.format(batchSize), count / (time.time() - beginTime), 'games/s'))
+        
+        player = MctsPlayer(1, rollout='batch', batchSize=batchSize)
+        count = 0
+        beginTime = time.time()
+        while time.time() - beginTime < seconds:
+            player.Simulate(game)
+            count += 1
+        results.append(('Simulate batch', count / (time.time() - beginTime), 'sims/s'))
+    return results
+
+
+def EvaluateGame(game):
+    '''
+    What BatchEval.Evaluate computes for one position, with the Connect4 methods
+    '''
+    player = game.GetCurrentPlayer()
+    validMoves = game.GetValidMoves()
+    return (game.GetWinner(), validMoves, [game.GetNextKey(player, move) for move in validMoves],
+            len(game.GetWinningMoves(1)), len(game.GetWinningMoves(2)))
+
+
+def BenchEvaluate(positions, repeat, count):
+    '''
+    Measure the positions evaluated per second (winner, valid moves, next keys and threats), one Connect4
+    object at a time, then count at a time with BatchEval (the reference positions over and over)
+    '''
+    def RunGames():
+        for game in positions:
+            EvaluateGame(game)
+    results = [('Evaluate', Measure(RunGames, repeat) * len(positions), 'positions/s')]
+
+    if BatchEval.numpy is not None:
+        boards, _ = BatchEval.PackGames(positions)
+        boards = boards[BatchEval.numpy.arange(count) % len(positions)]
+        evaluator = BatchEval.BatchEval()
+        results.append(('BatchEval x{}'.format(count), Measure(lambda: evaluator.Evaluate(boards), 1) * count,
+                        'positions/s'))
+    return results
+
+
+def BenchGetMove(iterations, repeat, seed):
+    '''
+    Measure the latency of MctsPlayer.GetMove with a fixed number of simulations on each reference
+    position, from a fresh player each time, in milliseconds per move (the fastest of repeat moves,
+    each searched with the same seed)
+    '''
+    results = []
+    for name, moves in REFERENCE_POSITIONS:
+        game = MakeReferencePosition(moves)
+        elapsed = float('inf')
+        for _ in xrange(repeat):
+            random.seed(seed)
+            player = MctsPlayer(game.GetCurrentPlayer(), iterations=iterations, verbose=False)
+            beginTime = time.time()
+            player.GetMove(game, game.GetValidMoves())
+            elapsed = min(elapsed, time.time() - beginTime)
+        results.append(('GetMove {}'.format(name), elapsed * 1000, 'ms'))
+    return results
+
+
+def BenchWorkers(seconds, workerCounts):
+    '''
+    Measure the root-parallel search throughput for each number of workers
+    '''
+    results = []
+    game = Connect4(None, None)
+    for workers in workerCounts:
+        player = MctsPlayer(1, time=seconds, workers=workers)
+        try:
+            if workers > 1:
+                player.pool = multiprocessing.Pool(workers)    # do not count the pool start up
+            count = player.Search(game)
+        finally:
+            player.Close()
+        results.append(('Search x{}'.format(workers), count / seconds, 'sims/s'))
+    return results
+
+
+def SaveResults(path, results, args):
+    '''
+    Write the results as JSON, with the settings they were measured with
+    '''
+    with open(path, 'w') as f:
+        json.dump({
+            'date': datetime.datetime.now().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'settings': vars(args),
+            'results': dict((name, {'value': value, 'unit': unit}) for name, value, unit in results),
+        }, f, indent=2, sort_keys=True)
+
+
+def CompareResults(results, baseline, tolerance):
+    '''
+    Compare the results with the ones of a baseline file written by SaveResults.
+    Returns (name, value, baseline value, relative change, regressed) for the results in both, where
+    the change is positive when the result is better, and regressed tells if it is worse by more than
+    the tolerance (a fraction)
+    '''
+    comparison = []
+    for name, value, unit in results:
+        base = baseline['results'].get(name)
+        if base is None or base['unit'] != unit or not base['value']:
+            continue
+        change = (value - base['value']) / float(base['value'])
+        if unit in LOWER_IS_BETTER:
+            change = -change
+        comparison.append((name, value, base['value'], change, change < -tolerance))
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Benchmark the Connect4 engine and the MCTS simulation.')
+    parser.add_argument('--positions', type=int, default=50,
+                        help = 'Number of reference positions (default=%(default)s)')
+    parser.add_argument('--repeat', type=int, default=100,
+                        help = 'Number of passes over the reference positions (default=%(default)s)')
+    parser.add_argument('--simtime', type=float, default=5,
+                        help = 'Seconds spent measuring MctsPlayer.Simulate (default=%(default)s)')
+    parser.add_argument('--workers', default='',
+                        help = 'Comma separated worker counts to measure the root-parallel search with, e.g. 1,2,4')
+    parser.add_argument('--sizes', default='',
+                        help = 'Comma separated board sizes to measure MctsPlayer.Simulate with, as rowsxcolumnsxN, '
+                        + 'e.g. 6x7x4,7x8x4,8x9x4,6x7x5')
+    parser.add_argument('--batch', type=int, default=64,
+                        help = 'Number of games per batch rollout (default=%(default)s)')
+    parser.add_argument('--evalsize', type=int, default=100000,
+                        help = 'Number of positions per BatchEval.Evaluate call (default=%(default)s)')
+    parser.add_argument('--getmove', type=int, default=1000,
+                        help = 'Number of simulations of the GetMove latency measures, 0 to skip them (default=%(default)s)')
+    parser.add_argument('--seed', type=int, default=1234,
+                        help = 'Random seed (default=%(default)s)')
+    parser.add_argument('--output',
+                        help = 'Write the results to this JSON file, e.g. to use as a baseline')
+    parser.add_argument('--baseline',
+                        help = 'JSON file written by --output to compare the results with. '
+                        + 'The exit status is 1 if a result regressed by more than the tolerance')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help = 'Relative regression allowed against the baseline (default=%(default)s)')
+    args = parser.parse_args()
+    ConfigureLogging()
+
+    results = BenchNodeTable(200000, args.repeat, args.seed)
+    positions = MakePositions(args.positions, args.seed)
+    results += BenchPrimitives(positions, args.repeat) + BenchSimulate(args.simtime, args.seed)
+    results += BenchRollouts(args.simtime, args.seed, args.batch)
+    results += BenchEvaluate(positions, args.repeat, args.evalsize)
+    for size in filter(None, args.sizes.split(',')):
+        results += BenchSimulate(args.simtime, args.seed, tuple(int(x) for x in size.split('x')))
+    if args.getmove > 0:
+        results += BenchGetMove(args.getmove, 3, args.seed)
+    if args.workers:
+        results += BenchWorkers(args.simtime, [int(w) for w in args.workers.split(',')])
+    if args.output:
+        SaveResults(args.output, results, args)
+    
+    if args.baseline is None:
+        for name, value, unit in results:
+            print '{:<20} {:>14,.{}f} {}'.format(name, value, 2 if unit == 'ms' else 0, unit)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        units = dict((name, unit) for name, _, unit in results)
+        regressions = 0
+        for name, value, base, change, regressed in CompareResults(results, baseline, args.tolerance):
+            decimals = 2 if units[name] == 'ms' else 0
+            print '{:<20} {:>14,.{}f} {:<6} baseline {:>14,.{}f} {:>+7.1f}%{}'.format(
+                name, value, decimals, units[name], base, decimals, change * 100, '  REGRESSION' if regressed else '')
+            regressions += regressed
+        if regressions:
+            print '{} regression(s) beyond {:.0f}%'.format(regressions, args.tolerance * 100)
+            sys.exit(1)
@@ -0,0 +1,117 @@
+# Bitboard.py - bit layout shared by all boards of the same size
+
+import random
+import struct
+import zlib
+
+class BitboardLayout(object):
+    '''
+    BitboardLayout: maps board cells to bit positions.
+
+    Each column takes RowSize()+1 consecutive bits, from the bottom row up. The extra bit on top of
+    each column is always 0 and stops the shifts below from wrapping a line into the next column:
+
+          Column 0, Column 1, ...
+    (pad)    6        13
+    Row 5    5        12
+    ...
+    Row 0    0         7
+
+    A board is then represented by one integer mask per player. The four line directions are
+    bit shifts: 1 (vertical), rows+1 (horizontal), rows+2 (diagonal) and rows (anti-diagonal).
+    
+    The layout also holds the Zobrist table: zobrist[playerId][bit index] is a random number, and the key
+    of a board is the XOR of the numbers of all the pieces on it. The table is seeded with the CRC-32 of
+    the board size, an integer: a string seed would go through hash(), which changes with the hash
+    randomization (python -R, PYTHONHASHSEED) and between 32 and 64 bits builds. So keys are the same
+    in every process and every run. checksum, the CRC-32 of the table, is stored in the files holding
+    keys (opening books, node statistics) to reject the ones written with other keys.
+    Keys are 63 bits so that they stay plain ints in Python 2.
+    '''
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+        self.height = rows + 1
+        self.shifts = (1, self.height, self.height + 1, self.height - 1)
+
+        # bottom cell of each column, and all the playable cells of each column
+        self.bottomMasks = [1 << (c * self.height) for c in xrange(columns)]
+        self.columnMasks = [((1 << rows) - 1) << (c * self.height) for c in xrange(columns)]
+        self.fullMask = 0
+        for mask in self.columnMasks:
+            self.fullMask |= mask
+        
+        rand = random.Random(zlib.crc32('zobrist-{}x{}'.format(rows, columns)) & 0xffffffff)
+        size = columns * self.height
+        self.zobrist = [None] + [[rand.getrandbits(63) for _ in xrange(size)] for _ in xrange(2)]
+        numbers = self.zobrist[1] + self.zobrist[2]
+        self.checksum = zlib.crc32(struct.pack('<{}Q'.format(len(numbers)), *numbers)) & 0xffffffff
+
+    def Bit(self, row, column):
+        return 1 << (column * self.height + row)
+    
+    def Index(self, row, column):
+        return column * self.height + row
+    
+    def GetKey(self, masks):
+        '''
+        Compute the Zobrist key of the board from scratch
+        '''
+        key = 0
+        for player in (1, 2):
+            mask = masks[player]
+            table = self.zobrist[player]
+            index = 0
+            while mask:
+                if mask & 1:
+                    key ^= table[index]
+                mask >>= 1
+                index += 1
+        return key
+
+    def HasLine(self, mask, n):
+        '''
+        Returns True if mask has n consecutive bits set in any of the four directions
+        '''
+        for shift in self.shifts:
+            m = mask
+            for i in xrange(1, n):
+                m &= mask >> (i * shift)
+                if not m:
+                    break
+            if m:
+                return True
+        return False
+
+    def HasLineThrough(self, mask, bit, n):
+        '''
+        Returns True if mask has n consecutive bits set on a line going through bit.
+        Only the four lines through bit are walked, so this is the check to use right after a move.
+        '''
+        for shift in self.shifts:
+            count = 1
+            b = bit >> shift
+            while b & mask:
+                count += 1
+                b >>= shift
+            b = bit << shift
+            while b & mask:
+                count += 1
+                b <<= shift
+            if count >= n:
+                return True
+        return False
+
+
+_layouts = {}
+
+def GetLayout(rows, columns):
+    '''
+    Returns the (shared) layout for a board of the given size
+    '''
+    key = (rows, columns)
+    layout = _layouts.get(key)
+    if layout is None:
+        layout = BitboardLayout(rows, columns)
+        _layouts[key] = layout
+    return layout
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+# BuildBook.py - builds an opening book (see OpeningBook) by searching every position of the first plies
+
+import argparse
+import json
+import multiprocessing
+import random
+from Connect4 import Connect4
+from LogConfig import ConfigureLogging
+from MctsPlayer import MctsPlayer
+from OpeningBook import WriteBook
+
+
+def EnumeratePositions(plies, rows=6, columns=7, n=4):
+    '''
+    All the positions reached within the given number of plies from the empty board, where the game is
+    not over, once each
+    '''
+    positions = []
+    seen = set()
+    layer = [Connect4(None, None, rows=rows, columns=columns, n=n)]
+    for ply in xrange(plies + 1):
+        nextLayer = []
+        for game in layer:
+            if game.GetKey() in seen or game.GetWinner() is not None or not game.HasSpaceToMove():
+                continue
+            seen.add(game.GetKey())
+            game.presenter = None
+            positions.append(game)
+            if ply < plies:
+                for move in game.GetValidMoves():
+                    nextGame = game.Copy()
+                    nextGame.Move(nextGame.GetCurrentPlayer(), move)
+                    nextLayer.append(nextGame)
+        layer = nextLayer
+    return positions
+
+
+def SearchPosition(args):
+    '''
+    Search one position with a fresh MctsPlayer, returns its book entry (key, move, wins, draws, totals)
+    '''
+    game, options, seed = args
+    random.seed(seed)
+    playerId = game.GetCurrentPlayer()
+    player = MctsPlayer(playerId, **dict(options, verbose=False))
+    try:
+        move = player.GetMove(game, game.GetValidMoves())
+    finally:
+        player.Close()
+    # no statistics if the solver found the move
+    node = player.nodes.Lookup(game.GetNextKey(playerId, move))
+    if node is None:
+        return game.GetKey(), move, 0, 0, 0
+    return game.GetKey(), move, node.wins, node.draws, node.totals
+
+
+def BuildBook(path, plies, options, rows=6, columns=7, n=4, processes=None, seed=None):
+    '''
+    Search every position within plies from the empty board with MctsPlayer(**options), in a pool of
+    processes, and write the book. Returns the number of positions.
+    '''
+    rand = random.Random(seed)
+    tasks = [(game, options, rand.getrandbits(32)) for game in EnumeratePositions(plies, rows, columns, n)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        entries = pool.map(SearchPosition, tasks)
+    finally:
+        pool.terminate()
+        pool.join()
+    WriteBook(path, entries, rows, columns, n)
+    return len(entries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Build an opening book by searching every position of the first plies.')
+    parser.add_argument('--plies', type=int, default=4,
+                        help = 'Positions up to this number of plies from the empty board are searched (default=%(default)s)')
+    parser.add_argument('--time', type=float,
+                        help = 'Time allowed per position in seconds (default=30 unless --iterations is given)')
+    parser.add_argument('--iterations', type=int,
+                        help = 'Number of simulations per position')
+    parser.add_argument('--options',
+                        help = 'Other MctsPlayer options, as JSON, e.g. \'{"uct": "graph"}\'')
+    parser.add_argument('--rows', type=int, default=6,
+                        help = 'Number of rows of the board (default=%(default)s)')
+    parser.add_argument('--columns', type=int, default=7,
+                        help = 'Number of columns of the board (default=%(default)s)')
+    parser.add_argument('--connect', type=int, default=4,
+                        help = 'Number of pieces in a row to win (default=%(default)s)')
+    parser.add_argument('--processes', type=int,
+                        help = 'Number of positions searched in parallel (default: number of CPUs)')
+    parser.add_argument('--output', default='OpeningBook.bin',
+                        help = 'Book file (default=%(default)s)')
+    parser.add_argument('--seed', type=int,
+                        help = 'Random seed')
+    args = parser.parse_args()
+    ConfigureLogging()
+
+    options = json.loads(args.options) if args.options else {}
+    if args.time is not None:
+        options['time'] = args.time
+    if args.iterations is not None:
+        options['iterations'] = args.iterations
+    count = BuildBook(args.output, args.plies, options, args.rows, args.columns, args.connect,
+                      args.processes, args.seed)
+    print 'Wrote {} positions to {}'.format(count, args.output)
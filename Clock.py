@@ -0,0 +1,9 @@
+# Clock.py - monotonic clock for measuring search budgets
+
+try:
+    from time import monotonic      # Python 3
+except ImportError:
+    try:
+        from monotonic import monotonic     # optional package for Python 2
+    except ImportError:
+        from time import time as monotonic
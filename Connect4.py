@@ -4,14 +4,16 @@
 
 import argparse
 from HumanPlayer import HumanPlayer
-from MctsPlayer import MctsPlayer
-import logging.config
-import copy
+from MctsPlayer import MctsPlayer, TextProgress
+from SearchStats import JsonLineWriter
+from GameRecord import GameRecordWriter, MakeRecord
+from LogConfig import ConfigureLogging
+import logging
 from TextPresenter import TextPresenter
-import datetime
+from Bitboard import GetLayout
+from LineIndex import GetLineIndex
 import time
 
-logging.config.fileConfig('Logging.conf')
 logger = logging.getLogger('connect4.game')
 
 
@@ -21,6 +23,9 @@ class Connect4(object):
     
     Two players are identified as 1 and 2
     
+    The board has rows x columns locations (6x7 by default) and a player needs n pieces in a row to win
+    (4 by default).
+    
     Board layout is defined as:
             Column 0, Column 1, ... Column N
     Row M
@@ -50,22 +55,47 @@ class Connect4(object):
     corresponding element will have value x. If a location is not occupied, the corresponding element will
     have character space, or ' '.
     GetDiag(index) and GetAntiDiag(index) are similar to GetRow.
+    
+    Internally the board is kept as bitboards (see Bitboard.BitboardLayout): masks[playerId] has a bit
+    set for every location taken by the player, and heights[column] is the number of pieces in the column.
+    The board property rebuilds the list of columns described above.
+    
+    moves lists the columns played since the game was created, in order: Undo takes them back, so a
+    search can play moves on the board in place and restore it instead of copying it.
     '''
-    def __init__(self, p1, p2, board=None, current_player=1, presenter=None):
+    def __init__(self, p1, p2, board=None, current_player=1, presenter=None, rows=6, columns=7, n=4):
         self.p1 = p1
         self.p2 = p2
         
         # size of the board
-        self.size = [6,7]   # 6 rows, 7 columns
+        self.size = [rows, columns]
+        if rows < 1 or columns < 1:
+            raise Exception('Invalid board size: {}x{}'.format(rows, columns))
+        # number of pieces in a row to win
+        if n < 2:
+            raise Exception('Invalid number of pieces in a row to win', n)
+        self.n = n
         #print('New game - players: {}, {}'.format(p1, p2))
         
-        if board is None:
-            # initialize the board [[],[],...[]], each element list represents a column
-            self.board = [[] for _ in xrange(self.ColumnSize())]
-        else:
-            # make a copy of the board given
+        self.layout = GetLayout(self.RowSize(), self.ColumnSize())
+        # the layout and the line index are computed once per (rows, columns, n) and shared by all the games
+        # cells of every row, diagonal and antidiagonal, and the winning segments
+        self.lines = GetLineIndex(self.RowSize(), self.ColumnSize(), self.GetNConscecutivesToWin())
+        
+        # masks[1] and masks[2] are the bitboards of player 1 and 2 (masks[0] is unused)
+        self.masks = [0, 0, 0]
+        self.heights = [0] * self.ColumnSize()
+        if board is not None:
             self.ValidateBoard(board)
-            self.board = copy.deepcopy(board)
+            for c in xrange(len(board)):
+                for r in xrange(len(board[c])):
+                    self.masks[board[c][r]] |= self.layout.Bit(r, c)
+                self.heights[c] = len(board[c])
+        
+        # the winner is updated by Move, only the lines through the new piece are checked
+        self.winner = None if board is None else self._ComputeWinner()
+        # Zobrist key of the board, updated by Move
+        self.key = 0 if board is None else self.layout.GetKey(self.masks)
         
         # player 1 expects to make a move
         self.current_player = current_player
@@ -78,16 +108,31 @@ class Connect4(object):
         
         # remember the last move
         self.lastMove = None
+        # the columns played, see Undo, and the index of the move that made the winner, if any
+        self.moves = []
+        self.winnerPly = None
     
     def Copy(self):
         '''
         Make a copy of itself.
         '''
-        newGame = Connect4(self.p1, self.p2, current_player=self.current_player, presenter=self.presenter)
-        for i in xrange(len(self.board)):
-            newGame.board[i] = self.board[i][:]     # make a copy
+        newGame = Connect4(self.p1, self.p2, current_player=self.current_player, presenter=self.presenter,
+                           rows=self.size[0], columns=self.size[1], n=self.n)
+        newGame.masks = self.masks[:]
+        newGame.heights = self.heights[:]
+        newGame.winner = self.winner
+        newGame.key = self.key
         newGame.lastMove = self.lastMove
+        newGame.moves = self.moves[:]
+        newGame.winnerPly = self.winnerPly
         return newGame
+    
+    @property
+    def board(self):
+        '''
+        The board as a list of columns, each column being the list of player IDs from the bottom up
+        '''
+        return [self.GetColumn(i) for i in xrange(self.ColumnSize())]
         
     def RowSize(self):
         return self.size[0]
@@ -96,28 +141,49 @@ class Connect4(object):
     def DiagRange(self):
         return xrange(-self.RowSize()+1, self.ColumnSize())
     
-    def Play(self):
-        moveCount = 0
+    def Play(self, verbose=True, recorder=None):
+        '''
+        Play the game until it is over, returns the ID of the winner or None for a tie.
+        If verbose is False, the game is played headless: nothing is presented nor printed.
+        If recorder is given, it is called with the record of the game once it is over (see GameRecord).
+        Each player is told to ponder (see Player.Ponder) while its opponent thinks.
+        '''
+        try:
+            return self._Play(verbose, recorder)
+        finally:
+            for player in (self.p1, self.p2):
+                if player is not None:
+                    player.StopPondering()
+    
+    def _Play(self, verbose, recorder):
         beginTime = time.time()
+        # the starting position and what happened since, for the game record
+        start = self.board
+        first = self.current_player
+        startPly = len(self.moves)
+        moveTimes = []
+        moveStats = []
         
         while True:
-            if self.presenter is not None:
+            if verbose and self.presenter is not None:
                 self.presenter.Present(self)
                 
             winner = self.GetWinner()
-            if winner is not None:
-                player = self.GetPlayerFromId(winner)
-                print "Game over. {} wins".format(player)
-                endTime = time.time()
-                self.LogGame(winner, moveCount, endTime-beginTime)
-                return
-            if not self.HasSpaceToMove():
-                print "Game over. It's a tie"
-                endTime = time.time()
-                self.LogGame(None, moveCount, endTime-beginTime)
-                return
+            if winner is not None or not self.HasSpaceToMove():
+                if verbose:
+                    if winner is not None:
+                        print "Game over. {} wins".format(self.GetPlayerFromId(winner))
+                    else:
+                        print "Game over. It's a tie"
+                if recorder is not None:
+                    recorder(MakeRecord(self, start, first, self.moves[startPly:], moveTimes, moveStats, winner,
+                                        time.time() - beginTime))
+                return winner
             player = self.GetPlayerFromId(self.current_player)
+            # the opponent may think while the player does
+            self.GetPlayerFromId(self.GetNextPlayer()).Ponder(self)
         
+            moveBeginTime = time.time()
             while True:
                 move = player.GetMove(self, self.GetValidMoves())
                 try:
@@ -125,8 +191,10 @@ class Connect4(object):
                     break
                 except Exception:
                     print 'Invalid move {}'.format(move)
-            
-            moveCount += 1
+            moveTimes.append(time.time() - moveBeginTime)
+            logger.debug('Move: Player %s, Column %s, Board: %s %s', player.GetID(), move, self.masks[1], self.masks[2])
+            stats = player.GetSearchStats()
+            moveStats.append(stats.ToDict() if stats is not None else None)
                             
     def GetPlayerFromId(self, playerId):
         if not self.IsValidPlayer(playerId):
@@ -140,31 +208,65 @@ class Connect4(object):
         Return a list of valid moves. If there is no more valid move,
         returns empty list 
         '''
-        validMoves = []
-        for i in xrange(self.ColumnSize()):
-            col = self.GetColumn(i)
-            if len(col) < self.RowSize():
-                validMoves.append(i)
-        return validMoves
+        rowSize = self.RowSize()
+        return [i for i, height in enumerate(self.heights) if height < rowSize]
 
     def Move(self, player, column):
         '''
         Move: player makes a move
         player (1 or 2) puts a piece in column (0 to 6 inclusive)
+        The simulations play millions of moves: nothing is logged here, see MctsPlayer trace for them
         '''
-        logger.debug('Move: Player %s, Column %s', player, column)
-        logger.debug('Board: %s', self.board)
         if not self.IsCurrentPlayer(player):
             raise Exception ('Not player', player, '\'s turn')
         if not self.IsValidMove(column):
             raise Exception ('Invalid move', column, self.board)
-        col = self.GetColumn(column)
-        col.append(player)
-        logger.debug("Board: {}".format(self.board))
+        row = self.heights[column]
+        bit = self.layout.Bit(row, column)
+        self.masks[player] |= bit
+        self.heights[column] += 1
+        self.key ^= self.layout.zobrist[player][self.layout.Index(row, column)]
+        if self.winner is None and self.layout.HasLineThrough(self.masks[player], bit, self.GetNConscecutivesToWin()):
+            self.winner = player
+            self.winnerPly = len(self.moves)
         
+        self.moves.append(column)
         self.lastMove = column
         self.current_player = self.GetNextPlayer()        
     
+    def Undo(self, count=1):
+        '''
+        Undo: take back the last count moves played with Move, the player of the first of them is to
+        move again. Returns the column of the last move taken back.
+        '''
+        moves = self.moves
+        if count < 1:
+            raise Exception('Invalid number of moves to undo', count)
+        if count > len(moves):
+            raise Exception('No move to undo')
+        layout = self.layout
+        height = layout.height
+        zobrist = layout.zobrist
+        heights = self.heights
+        masks = self.masks
+        player = self.current_player
+        key = self.key
+        for _ in xrange(count):
+            column = moves.pop()
+            player = player % 2 + 1
+            heights[column] -= 1
+            index = column * height + heights[column]
+            masks[player] ^= 1 << index
+            key ^= zobrist[player][index]
+        self.key = key
+        self.current_player = player
+        if self.winnerPly is not None and self.winnerPly >= len(moves):
+            self.winner = None
+            self.winnerPly = None
+        # the move before, unless it was played before the game was created
+        self.lastMove = moves[-1] if moves else None
+        return column
+    
     def GetNextState(self, player, column):
         '''
         Returns the board state as tuple of tuples (list is not hashable) if player makes the move
@@ -174,17 +276,39 @@ class Connect4(object):
             raise Exception ('Invalid move', column, self.board)
 
         stateList = []        
-        for i in xrange(len(self.board)):
+        for i in xrange(self.ColumnSize()):
+            col = self.GetColumn(i)
             if i == column:
-                currCol = self.GetColumn(i)
-                col = currCol[:]
                 col.append(player)
-            else:
-                col = self.GetColumn(i)
             stateList.append(tuple(col))
         states = tuple(stateList)
         return states
-        
+    
+    def GetKey(self):
+        '''
+        Returns the Zobrist key of the board (see Bitboard.BitboardLayout)
+        '''
+        return self.key
+    
+    def GetNextKey(self, player, column):
+        '''
+        Returns the key of the board if player makes the move, without touching the board
+        '''
+        if not self.IsValidMove(column):
+            raise Exception ('Invalid move', column, self.board)
+        return self.key ^ self.layout.zobrist[player][self.layout.Index(self.heights[column], column)]
+
+    def GetWinningMoves(self, player):
+        '''
+        Returns the valid moves that would complete a line of player, whoever is to move
+        (see LineIndex.threatMasks)
+        '''
+        threatMasks = self.lines.threatMasks
+        height = self.layout.height
+        mask = self.masks[player]
+        return [column for column in self.GetValidMoves()
+                if any(mask & m == m for m in threatMasks[column * height + self.heights[column]])]
+
     def IsValidMove(self, column):
         '''
         IsValidMove: check whether the move is valid (column is 0-based)
@@ -192,18 +316,14 @@ class Connect4(object):
         '''
         if column >= self.ColumnSize() or column < 0:
             return False
-        col = self.GetColumn(column)
-        return len(col) < self.RowSize()
+        return self.heights[column] < self.RowSize()
     
     def GetLastMove(self):
         '''
         If there are moves, return the last move in (row,column)
         '''
-        if self.lastMove is not None:
-            col = self.GetColumn(self.lastMove)
-            for i in reversed(xrange(len(col))):
-                if self.IsValidPlayer(col[i]):
-                    return (i, self.lastMove)
+        if self.lastMove is not None and self.heights[self.lastMove] > 0:
+            return (self.heights[self.lastMove] - 1, self.lastMove)
         return None
                 
             
@@ -212,26 +332,25 @@ class Connect4(object):
         Return value at location (row, col). If a player has taken it, returns the ID of the player;
         Otherwise returns ' '
         '''
-        column = self.GetColumn(col)
-        if row < len(column):
-            return column[row]
+        if col >= self.ColumnSize() or col < 0:
+            raise Exception('Invalid column', col)
+        if row < self.heights[col]:
+            return 1 if self.masks[1] & self.layout.Bit(row, col) else 2
         return ' '
             
     def GetColumn(self, index):
-        return self._GetColumnImpl(self.board, index)
-    
-    def _GetColumnImpl(self, board, index):
+        '''
+        Returns a new list with the player IDs in the column, from the bottom up
+        '''
         if index >= self.ColumnSize() or index < 0:
             raise Exception('Invalid column', index)
-        return board[index]
+        mask = self.masks[1]
+        return [1 if mask & self.layout.Bit(r, index) else 2 for r in xrange(self.heights[index])]
         
     def GetRow(self, index):
         if index >= self.RowSize() or index < 0:
             raise Exception('Invalid row', index)
-        row = []
-        for i in xrange(self.ColumnSize()):
-            row.append(self.GetValue(index, i))
-        return row
+        return self._GetValues(self.lines.rowBits[index])
     
     def GetDiag(self, index):
 #     Diag[-M] = [(rM, c0)]
@@ -241,50 +360,30 @@ class Connect4(object):
 #     Diag[1]  = [(r0, c1), (r1, c2), ..., (rx, cx+1)] where x = min(M, N-1)
 #     ...
 #     Diag[N]  = [(r0, cN)]
-        if index not in self.DiagRange():
+        bits = self.lines.diagBits.get(index)
+        if bits is None:
             raise Exception('Invalid diagonal', index)
-        M = self.RowSize() - 1
-        N = self.ColumnSize() - 1
-        if index < 0:
-            r = -index
-            c = 0
-            nElem = min(M+index, N) + 1
-        else:
-            r = 0
-            c = index
-            nElem = min(M, N-index) + 1
-        diag = []
-        for _ in xrange(nElem):
-            diag.append(self.GetValue(r,c))
-            r = r+1
-            c = c+1
-        return diag
+        return self._GetValues(bits)
     
     def GetAntiDiag(self,index):
-        if index not in self.DiagRange():
-            raise Exception('Invalid antidiagonal {}. Expect {}'.format(index, self.DiagRange()))
 #     AntiDiag[-M] = [(r0, c0)]
 #     ...
 #     AntiDiag[-1] = [(rM-1, c0), (rM-2, c1), ..., (rx, cx)] where x = min(M-1, N)
 #     AntiDiag[0]  = [(rM, c0), (rM-1, c1), ..., (rx, cx)]   where x = min(M, N)
 #     AntiDiag[1]  = [(rM, c1), r(M-1, c2), ..., (rx, cx)]   where x = min(M, N-1)
 #     AntiDiag[N]  = [(rM, cN)]
-        M = self.RowSize()-1
-        N = self.ColumnSize()-1
-        if index < 0:
-            r = M+index
-            c = 0
-            nElem = min(M+index, N) + 1
-        else:
-            r = M
-            c = index
-            nElem = min(M, N-index) + 1
-        adiag = []
-        for _ in xrange(nElem):
-            adiag.append(self.GetValue(r,c))
-            r = r - 1
-            c = c + 1
-        return adiag
+        bits = self.lines.antiDiagBits.get(index)
+        if bits is None:
+            raise Exception('Invalid antidiagonal {}. Expect {}'.format(index, self.DiagRange()))
+        return self._GetValues(bits)
+    
+    def _GetValues(self, bits):
+        '''
+        Values (see GetValue) of the cells given by their bits, from a LineIndex line
+        '''
+        mask1 = self.masks[1]
+        mask2 = self.masks[2]
+        return [1 if mask1 & bit else 2 if mask2 & bit else ' ' for bit in bits]
         
     def IsCurrentPlayer(self, player):
         return player == self.current_player
@@ -310,16 +409,17 @@ class Connect4(object):
                     raise Exception('Invalid value at ({},{}): {}. Expect 1 or 2'.format(i,j,col[j]))
                 
     def GetNConscecutivesToWin(self):
-        return 4
+        return self.n
         
     def GetWinnerInLine(self, valueList):
         '''
-        Check whether the list of values indicate a winner (4 conscecutive values).
-        If so, returns it (if both players have 4 conscecutives, the first one detected is considered 
+        Check whether the list of values indicate a winner (GetNConscecutivesToWin() conscecutive values).
+        If so, returns it (if both players have enough conscecutives, the first one detected is considered 
         the winner). Otherwise returns None 
         '''
         winner = None
-        if len(valueList) >= self.GetNConscecutivesToWin():
+        n = self.GetNConscecutivesToWin()
+        if len(valueList) >= n:
             potential_winner = None
             conscecutives = 0
             for i in xrange(len(valueList)):
@@ -339,10 +439,10 @@ class Connect4(object):
                     potential_winner = v
                     conscecutives = 1
                     
-                if conscecutives == 4:
+                if conscecutives == n:
                     break
                 
-            if potential_winner is not None and conscecutives >= 4:
+            if potential_winner is not None and conscecutives >= n:
                 winner = potential_winner
 
         return winner
@@ -351,6 +451,24 @@ class Connect4(object):
         '''
         Get the winner of the game, if there is one, otherwise None.
         '''
+        return self.winner
+    
+    def _ComputeWinner(self):
+        '''
+        Compute the winner from the whole bitboards
+        '''
+        n = self.GetNConscecutivesToWin()
+        if self.layout.HasLine(self.masks[1], n):
+            return 1
+        if self.layout.HasLine(self.masks[2], n):
+            return 2
+        return None
+    
+    def GetWinnerFullScan(self):
+        '''
+        Get the winner by scanning every column, row, diagonal and antidiagonal with GetWinnerInLine.
+        This is the reference implementation for GetWinner; it is much slower.
+        '''
         for i in xrange(self.ColumnSize()):
             line = self.GetColumn(i)
             winner = self.GetWinnerInLine(line)
@@ -373,45 +491,37 @@ class Connect4(object):
                 return winner
     
     def HasSpaceToMove(self):
-        for i in xrange(self.ColumnSize()):
-            col = self.GetColumn(i)
-            if len(col) < self.RowSize():
+        rowSize = self.RowSize()
+        for height in self.heights:
+            if height < rowSize:
                 return True
         return False    
                 
-    def LogGame(self, winnerId, moves, timeElapsed):
-        with open('Connect4.log', 'a+') as f:
-            f.write('{}\n'.format(datetime.datetime.now()))
-            if winnerId is not None:
-                if winnerId == 1:
-                    winner = self.p1
-                    loser = self.p2
-                    loserId = 2
-                else:
-                    winner = self.p2
-                    loser = self.p1
-                    loserId = 1
-                f.write('Win: Player {}: {}\n'.format(winnerId, winner))
-                f.write('Lose: Player {}: {}\n'.format(loserId, loser))
-            else:
-                f.write('Tie\n')
-                f.write('Player 1: {}\n'.format(self.p1))
-                f.write('Player 2: {}\n'.format(self.p2))
-            f.write('Duration: {:.2f} seconds. Move count: {}\n\n'.format(timeElapsed, moves))
-                    
-            
-    
-def MakePlayer(player, timeAllowed, playerId):
+
+def MakePlayer(player, timeAllowed, playerId, workers=1, iterations=None, earlyStop=False, book=None, stats=None,
+               ponder=False, trace=None, record=False):
     '''
     Instantiate a Player based on the input string:
     h or human: HumanPlayer
     m or mcts:  MctsPlayer
     Raise exception otherwise
+    An MctsPlayer searches for timeAllowed seconds and/or the given number of iterations, 30 seconds if neither is given.
+    It plays the moves of the opening book file book, if given, while the positions are in it.
+    The statistics of its searches are appended to the file stats as JSON lines, if given (see SearchStats).
+    With record, they are collected for the game records even without a stats file.
+    With ponder, it keeps searching while the opponent thinks (in a thread of this process: this only
+    helps against a human, an mcts opponent in the same game loses the time the pondering takes).
+    With trace, every trace-th simulation of its searches is logged to the connect4.trace logger.
     '''
     if player == 'h' or player == 'human':
         return HumanPlayer(playerId)
     elif player == 'm' or player == 'mcts':
-        return MctsPlayer(playerId, time=timeAllowed)
+        if timeAllowed is None and iterations is None:
+            timeAllowed = 30
+        return MctsPlayer(playerId, time=timeAllowed, iterations=iterations, earlyStop=earlyStop,
+                          workers=workers, progress=TextProgress(), book=book,
+                          stats=JsonLineWriter(stats) if stats is not None else record, ponder=ponder,
+                          trace=trace)
     raise Exception("Unknown Player type", player)
     
 
@@ -428,19 +538,58 @@ if __name__ == '__main__':
                         help = 'Specify Player 1. h=human or m=mcts (default=%(default)s)')
     parser.add_argument('--p2', '--player2', choices=['m', 'mcts', 'h', 'human'], default='mcts',
                         help = 'Specify Player 2. m=mcts or h=human (default=%(default)s)')
-    parser.add_argument('--p1time', type=int, default=30, 
-                        help = 'Time allowed in seconds if player 1 is mcts')
-    parser.add_argument('--p2time', type=int, default=30, 
-                        help = 'Time allowed in seconds if player 2 is mcts')
+    parser.add_argument('--p1time', type=float, 
+                        help = 'Time allowed in seconds if player 1 is mcts (default=30 unless --p1iterations is given)')
+    parser.add_argument('--p2time', type=float, 
+                        help = 'Time allowed in seconds if player 2 is mcts (default=30 unless --p2iterations is given)')
+    parser.add_argument('--p1iterations', type=int, 
+                        help = 'Number of simulations per move if player 1 is mcts')
+    parser.add_argument('--p2iterations', type=int, 
+                        help = 'Number of simulations per move if player 2 is mcts')
+    parser.add_argument('--earlystop', action='store_true', 
+                        help = 'Let mcts players stop searching once their best move cannot be overtaken')
+    parser.add_argument('--p1workers', type=int, default=1, 
+                        help = 'Number of processes searching in parallel if player 1 is mcts (default=%(default)s)')
+    parser.add_argument('--p2workers', type=int, default=1, 
+                        help = 'Number of processes searching in parallel if player 2 is mcts (default=%(default)s)')
+    parser.add_argument('--book', 
+                        help = 'Opening book file used by the mcts players (see BuildBook.py)')
+    parser.add_argument('--ponder', action='store_true', 
+                        help = 'Let mcts players search while their opponent thinks (useful against a human only)')
+    parser.add_argument('--stats', 
+                        help = 'File the mcts players append the statistics of each search to, as JSON lines')
+    parser.add_argument('--trace', type=int, 
+                        help = 'Log every TRACE-th simulation of the mcts players, with its moves and result')
+    parser.add_argument('--logconfig', 
+                        help = 'Logging configuration file (default=Logging.conf next to the program)')
+    parser.add_argument('--record', default='Connect4.jsonl', 
+                        help = 'File the game record is appended to, as a JSON line, an empty value not to record the game '
+                               '(default=%(default)s)')
+    parser.add_argument('--rows', type=int, default=6, 
+                        help = 'Number of rows of the board (default=%(default)s)')
+    parser.add_argument('--columns', type=int, default=7, 
+                        help = 'Number of columns of the board (default=%(default)s)')
+    parser.add_argument('--connect', type=int, default=4, 
+                        help = 'Number of pieces in a row to win (default=%(default)s)')
     
     
     parser.add_argument('-v', '--version', action='version', version='%(prog)s 0.1')
     args = parser.parse_args()
+    ConfigureLogging(args.logconfig)
     
-    player1 = MakePlayer(args.p1, args.p1time, 1)
-    player2 = MakePlayer(args.p2, args.p2time, 2)
+    player1 = MakePlayer(args.p1, args.p1time, 1, args.p1workers, args.p1iterations, args.earlystop, args.book,
+                         args.stats, args.ponder, args.trace, bool(args.record))
+    player2 = MakePlayer(args.p2, args.p2time, 2, args.p2workers, args.p2iterations, args.earlystop, args.book,
+                         args.stats, args.ponder, args.trace, bool(args.record))
     
-    game = Connect4(player1, player2)
+    game = Connect4(player1, player2, rows=args.rows, columns=args.columns, n=args.connect)
     
-    game.Play()
+    recorder = GameRecordWriter(args.record) if args.record else None
+    try:
+        game.Play(recorder=recorder)
+    finally:
+        if recorder is not None:
+            recorder.Close()
+        player1.Close()
+        player2.Close()
     
@@ -0,0 +1,116 @@
+# GameRecord.py - game records as JSON lines: buffered, multi-process safe writes and a streaming reader
+
+import datetime
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# version of the record format, incremented when a field changes meaning
+RECORD_VERSION = 1
+
+
+def MakeRecord(game, start, first, moves, moveTimes, moveStats, winner, seconds):
+    '''
+    Returns the record of a game played from the board start (a list of columns, see Connect4.board),
+    first being the player to move there:
+    version, date
+    players: the names of player 1 and player 2
+    board: the size of the board and the number of pieces in a row to win (rows, columns, n)
+    start, first: the starting position, so that the game can be replayed (see Replay)
+    moves: the columns played, in order
+    moveTimes: the seconds taken by each move
+    moveStats: the search statistics of each move (see SearchStats.ToDict), None if it was not searched
+               (book, solved or human move) or if the player does not collect statistics (stats option
+               of MctsPlayer)
+    winner: 1, 2 or None for a tie
+    seconds: the duration of the game
+    '''
+    return {
+        'version': RECORD_VERSION,
+        'date': datetime.datetime.now().isoformat(),
+        'players': [str(game.p1), str(game.p2)],
+        'board': {'rows': game.RowSize(), 'columns': game.ColumnSize(), 'n': game.GetNConscecutivesToWin()},
+        'start': start,
+        'first': first,
+        'moves': moves,
+        'moveTimes': [round(t, 4) for t in moveTimes],
+        'moveStats': moveStats,
+        'winner': winner,
+        'seconds': round(seconds, 3),
+    }
+
+
+def Replay(record, p1=None, p2=None):
+    '''
+    Returns the Connect4 game of the record, with its moves played
+    '''
+    # imported here, Connect4 imports this module
+    from Connect4 import Connect4
+    board = record['board']
+    game = Connect4(p1, p2, record['start'], current_player=record['first'],
+                    rows=board['rows'], columns=board['columns'], n=board['n'])
+    for move in record['moves']:
+        game.Move(game.GetCurrentPlayer(), move)
+    return game
+
+
+class GameRecordWriter(object):
+    '''
+    Callback for Connect4.Play appending the game records to a file, one JSON line each.
+
+    The records are buffered and written bufferSize at a time, in a single write to the file opened
+    in append mode and locked: processes writing records to the same file never mix their lines, and
+    a record is either in the file or not at all. Close (or Flush) writes the buffered records.
+    '''
+    def __init__(self, path, bufferSize=64):
+        self.path = path
+        self.bufferSize = bufferSize
+        self.lines = []
+
+    def __call__(self, record):
+        self.lines.append(json.dumps(record, sort_keys=True) + '\n')
+        if len(self.lines) >= self.bufferSize:
+            self.Flush()
+
+    def Flush(self):
+        if not self.lines:
+            return
+        data = ''.join(self.lines)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            # a write may be partial, e.g. interrupted by a signal: the lock keeps the rest in place
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
+        self.lines = []
+
+    def Close(self):
+        self.Flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.Close()
+
+
+def ReadGameRecords(path):
+    '''
+    Iterate over the records of a file written by GameRecordWriter, one line at a time, so that the file
+    is never loaded as a whole. A last line without its end of line, from a writer killed in the middle
+    of a write, is skipped.
+    '''
+    with open(path) as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            if line.strip():
+                yield json.loads(line)
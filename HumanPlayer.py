@@ -2,10 +2,8 @@
 
 from Player import Player
 
-import logging.config
-from pyparsing import col
+import logging
 
-logging.config.fileConfig('Logging.conf')
 logger = logging.getLogger('connect4.player.HumanPlayer')
 
 class HumanPlayer(Player):
@@ -14,7 +12,7 @@ class HumanPlayer(Player):
     '''
     def __init__(self, playerId):
         super(HumanPlayer,self).__init__(playerId)
-        logger.debug('Player {}: Human player instantiated'.format(playerId))
+        logger.debug('Player %s: Human player instantiated', playerId)
     
     def __str__(self):
         return '{} - Human'.format(self.GetID())
@@ -0,0 +1,103 @@
+# LineIndex.py - the lines of a board and the winning segments through each cell, built once per board size
+
+from Bitboard import GetLayout
+
+
+class LineIndex(object):
+    '''
+    LineIndex: static description of the lines of a board, see Connect4 for the row, diagonal and
+    antidiagonal numbering.
+
+    rows[r], columns[c], diags[index] and antiDiags[index] are the (row, column) cells of each line, and
+    rowBits, columnBits, diagBits and antiDiagBits the bits of the same cells (see Bitboard.BitboardLayout).
+    A segment is n consecutive cells of a line, i.e. a possible win: segments[i] lists its cells,
+    segmentMasks[i] is its bitboard, and cellSegments[(row, column)] lists the segments going through the cell.
+    
+    Indexed by the bit index of a cell (see Bitboard.BitboardLayout.Index), threatMasks lists the masks of the
+    other cells of each segment through the cell: a player owning all the cells of one of them wins by
+    playing the cell. cellWeights is the number of segments through the cell, i.e. how many wins it can
+    take part in (0 for the padding bits).
+    '''
+    def __init__(self, rows, columns, n):
+        self.rowSize = rows
+        self.columnSize = columns
+        self.n = n
+        layout = GetLayout(rows, columns)
+        M = rows - 1
+
+        self.rows = [[(r, c) for c in xrange(columns)] for r in xrange(rows)]
+        self.columns = [[(r, c) for r in xrange(rows)] for c in xrange(columns)]
+        self.diags = {}
+        self.antiDiags = {}
+        for index in xrange(-rows + 1, columns):
+            if index < 0:
+                r, c = -index, 0
+            else:
+                r, c = 0, index
+            diag = []
+            while r < rows and c < columns:
+                diag.append((r, c))
+                r, c = r + 1, c + 1
+            self.diags[index] = diag
+
+            if index < 0:
+                r, c = M + index, 0
+            else:
+                r, c = M, index
+            antiDiag = []
+            while r >= 0 and c < columns:
+                antiDiag.append((r, c))
+                r, c = r - 1, c + 1
+            self.antiDiags[index] = antiDiag
+
+        def Bits(cells):
+            return [layout.Bit(r, c) for r, c in cells]
+        self.rowBits = [Bits(line) for line in self.rows]
+        self.columnBits = [Bits(line) for line in self.columns]
+        self.diagBits = dict((index, Bits(line)) for index, line in self.diags.iteritems())
+        self.antiDiagBits = dict((index, Bits(line)) for index, line in self.antiDiags.iteritems())
+
+        self.segments = []
+        self.segmentMasks = []
+        self.cellSegments = dict(((r, c), []) for r in xrange(rows) for c in xrange(columns))
+        for line in self.Lines():
+            for start in xrange(len(line) - n + 1):
+                segment = line[start:start + n]
+                mask = 0
+                for r, c in segment:
+                    mask |= layout.Bit(r, c)
+                    self.cellSegments[(r, c)].append(len(self.segments))
+                self.segments.append(segment)
+                self.segmentMasks.append(mask)
+        
+        size = columns * layout.height
+        self.threatMasks = [[] for _ in xrange(size)]
+        self.cellWeights = [0] * size
+        for (r, c), segmentIds in self.cellSegments.iteritems():
+            index = layout.Index(r, c)
+            bit = layout.Bit(r, c)
+            self.threatMasks[index] = [self.segmentMasks[i] ^ bit for i in segmentIds]
+            self.cellWeights[index] = len(segmentIds)
+
+    def Lines(self):
+        '''
+        All the lines of the board: columns, rows, diagonals and antidiagonals
+        '''
+        lines = self.columns + self.rows
+        lines += [self.diags[i] for i in sorted(self.diags)]
+        lines += [self.antiDiags[i] for i in sorted(self.antiDiags)]
+        return lines
+
+
+_lineIndexes = {}
+
+def GetLineIndex(rows, columns, n):
+    '''
+    Returns the (shared) line index for a board of the given size and number of pieces in a row to win
+    '''
+    key = (rows, columns, n)
+    lineIndex = _lineIndexes.get(key)
+    if lineIndex is None:
+        lineIndex = LineIndex(rows, columns, n)
+        _lineIndexes[key] = lineIndex
+    return lineIndex
@@ -0,0 +1,17 @@
+# LogConfig.py - logging configuration of the command line tools
+
+import logging.config
+import os
+
+# Logging.conf, next to the modules, so that the tools can be run from any directory
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Logging.conf')
+
+
+def ConfigureLogging(path=None):
+    '''
+    Configure the logging from a logging.config file, Logging.conf by default.
+    The modules only create their loggers when imported, the command line tools call this from their
+    main: a program embedding the modules keeps its own configuration, and worker processes don't read
+    the file again. The loggers created before the call are left enabled.
+    '''
+    logging.config.fileConfig(path or DEFAULT_CONFIG, disable_existing_loggers=False)
@@ -2,18 +2,34 @@
 from __future__ import division     # otherwise 5/2 = 2
 
 from Player import Player
+from NodeTable import NodeTable, Node, WIN, DRAW, LOSE
+from BatchRollout import BatchRollout
+from Solver import Solver, MAX_ENTRIES as SOLVER_MAX_ENTRIES
+from OpeningBook import OpeningBook
+from SearchStats import SearchStats
+from Clock import monotonic
 
-import logging.config
-import time
+import logging
+import multiprocessing
+import random
+import threading
 from math import log
 from math import sqrt
 from math import ceil
 from random import choice
 import copy
+import os
 import sys
 
-logging.config.fileConfig('Logging.conf')
 logger = logging.getLogger('connect4.player.MctsPlayer')
+# sampled simulations, see the trace option
+traceLogger = logging.getLogger('connect4.trace')
+
+# number of simulations between two checks for an early stop
+EARLY_STOP_INTERVAL = 100
+
+# rough cost of a simulation in solver nodes, to turn an iteration budget into a solver budget
+SOLVER_NODES_PER_SIMULATION = 100
 
 class MctsPlayer(Player):
     '''
@@ -21,166 +37,788 @@ class MctsPlayer(Player):
     '''
     def __init__(self, playerId, **kwargs):
         super(MctsPlayer,self).__init__(playerId)
-        logger.debug('Player {}: Mcts player instantiated'.format(playerId))
+        logger.debug('Player %s: Mcts player instantiated', playerId)
         
         # parameters
-        self.simTime = kwargs.get('time', 30)       # simulation time, in seconds
+        # search budget: the search stops at the first of simIterations simulations and simTime seconds
+        # (None: no limit). Without an iteration budget, the time budget defaults to 30 seconds.
+        self.simIterations = kwargs.get('iterations')
+        self.simTime = kwargs.get('time', 30 if self.simIterations is None else None)
+        if self.simTime is None and self.simIterations is None:
+            raise Exception('MctsPlayer needs a time or an iteration budget')
         self.simDepth = kwargs.get('depth', 100)    # maximum depth to simulate
+        # stop the search once the best move can't be overtaken within the budget left
+        self.earlyStop = kwargs.get('earlyStop', False)
+        # progress callback, called as progress(player, simulationCount, elapsed, done) when the search
+        # starts, about every progressInterval seconds, and when it is done (see TextProgress)
+        self.progress = kwargs.get('progress')
+        self.progressInterval = kwargs.get('progressInterval', 1)
+        self.workers = kwargs.get('workers', 1)     # number of processes searching in parallel
+        self.reuse = kwargs.get('reuse', True)      # keep the subtree of the actual moves for the next search
+        self.verbose = kwargs.get('verbose', True)  # print the statistics of each search
+        
+        # selection policy:
+        # tree:  UCT over the child states, the parent count being the sum of the children counts
+        # graph: the states form a graph where transpositions share their statistics. The exploration term
+        #        uses the number of simulations through each edge and the parent's own visit count
+        self.uct = kwargs.get('uct', 'tree')
+        if self.uct not in ('tree', 'graph'):
+            raise Exception('Unknown UCT policy', self.uct)
+        
+        # rollout policy, played from the new node of each simulation:
+        # random: one game with random moves
+        # batch:  batchSize random games at once, see BatchRollout (requires numpy)
+        # heuristic: one game where a player wins when it can, blocks the opponent's immediate win,
+        #            and otherwise plays cells weighted by the number of wins they can take part in
+        #            (see _HeuristicMove)
+        self.rollout = kwargs.get('rollout', 'random')
+        if self.rollout in ('random', 'heuristic'):
+            self.batchRollout = None
+        elif self.rollout == 'batch':
+            self.batchRollout = BatchRollout(kwargs.get('batchSize', 64))
+        else:
+            raise Exception('Unknown rollout policy', self.rollout)
+        
+        # MCTS-Solver: the states where the game is over are proven wins or losses, and the proofs are
+        # propagated up the tree (a move to a proven win proves a loss for the opponent, moves that all
+        # lead to proven losses prove a win). Proven losses are not selected any more, proven wins always
+        # are, and the search stops once the root is proven
+        self.prove = kwargs.get('prove', True)
+        self.rootProven = False
+        
+        # endgame solver (see Solver): positions with at most solveEmpty empty cells are solved exactly,
+        # whatever it takes. Before that, the solver gets solveFraction of the move budget, and the
+        # search runs only if the position is not solved, with the budget the solver left.
+        # solveEntries bounds the solver's transposition table, kept between moves
+        if kwargs.get('solve', True):
+            self.solver = Solver(kwargs.get('solveEntries', SOLVER_MAX_ENTRIES))
+        else:
+            self.solver = None
+        self.solveEmpty = kwargs.get('solveEmpty', 16)
+        self.solveFraction = kwargs.get('solveFraction', 0.1)
+        
+        # opening book file (see OpeningBook): the positions in the book are not searched
+        book = kwargs.get('book')
+        self.book = OpeningBook(book) if book is not None else None
+        
+        # pondering: search on the opponent's time, in a background thread, from the position the opponent
+        # moves in (see Ponder). The statistics of the states after the opponent's actual move are then
+        # reused by the next search, so it needs reuse. At most ponderIterations simulations (None: no
+        # limit) are run per opponent move. The thread shares the interpreter lock with the opponent if
+        # it plays in the same process: pondering only adds thinking time against a human or a bot
+        # running in another process. Against a bot in the same process (Connect4.Play with two
+        # MctsPlayers) it takes its CPU time from the opponent's search instead, and it is not a way to
+        # add thinking time in headless self-play: Tournament rejects it
+        self.ponder = kwargs.get('ponder', False)
+        self.ponderIterations = kwargs.get('ponderIterations')
+        self.ponderThread = None
+        self.ponderStop = None
+        # simulations run by the last pondering
+        self.ponderCount = 0
         
-        # Dictionaries from (player, board_state) to winning count and visited count respectively, where
-        # player: the id of the player whose move results in the board state
-        # board_state: the state of the board
-        # wins: the number of times the player wins when enter into this state
-        # totals: the number of times the (player, board_state) has been simulated 
-        self.wins = {}
-        self.totals = {}
-        self.loses = {}
-        self.draws = {}
+        # parameters given to the players of the worker processes
+        self.workerArgs = dict(kwargs, workers=1)
+        self.workerArgs.pop('progress', None)
+        self.workerArgs.pop('book', None)
+        self.workerArgs.pop('cache', None)
+        self.workerArgs.pop('ponder', None)
+        self.workerArgs['stats'] = bool(kwargs.get('stats'))
+        self.pool = None
         
-        self.depth = 0
+        # duration of the last search, in seconds
+        self.searchTime = 0
+        
+        # sampled tracing, to debug a search: every trace-th simulation (None: none) is logged to the
+        # connect4.trace logger, at INFO level, with the moves it played and its result
+        self.trace = kwargs.get('trace')
+        self.traceCount = 0
+        
+        # Statistics of the simulated states, indexed by the state key (game.GetNextKey).
+        # maxNodes bounds the number of states kept (None: unbounded)
+        self.nodes = NodeTable(kwargs.get('maxNodes'))
+        
+        # node statistics file (see NodeTable.Save): the statistics are loaded from it if it exists, kept
+        # across moves and games instead of pruned (maxNodes bounds them), and saved back by SaveCache and
+        # Close, the cacheNodes most simulated nodes simulated at least cacheMinTotals times
+        self.cache = kwargs.get('cache')
+        self.cacheNodes = kwargs.get('cacheNodes')
+        self.cacheMinTotals = kwargs.get('cacheMinTotals', 1)
+        if self.cache is not None and os.path.exists(self.cache):
+            count = self.nodes.Merge(self.cache)
+            logger.debug('Player %s: %s nodes loaded from %s', playerId, count, self.cache)
+        
+        # search instrumentation (see SearchStats): with stats True or a callback, each search fills
+        # self.stats, and GetMove calls stats(player, self.stats) after searching (e.g. a
+        # SearchStats.JsonLineWriter). Without, self.stats is None and the simulations skip it
+        stats = kwargs.get('stats')
+        self.collectStats = bool(stats)
+        self.statsCallback = stats if callable(stats) else None
+        self.stats = None
+    
+    def GetSearchStats(self):
+        return self.stats
     
     def __str__(self):
-        return '{} - Mcts({})'.format(self.GetID(), self.simTime)
+        if self.simIterations is None:
+            return '{} - Mcts({})'.format(self.GetID(), self.simTime)
+        if self.simTime is None:
+            return '{} - Mcts({} sims)'.format(self.GetID(), self.simIterations)
+        return '{} - Mcts({}, {} sims)'.format(self.GetID(), self.simTime, self.simIterations)
     
     def GetMove(self, game, validMoves):
         '''
         Returns the move computed with MCTS algorithm
         '''
+        self.StopPondering()
+        # the book and solved moves are not searched
+        self.stats = None
+        
         if validMoves is None or len(validMoves) == 0:
             return
         
         if len(validMoves) == 1:
             return validMoves[0]
         
-        simulationCount = 0
-        beginTime = time.time()
-        currTime = time.time()
-        logTime = currTime
-        sys.stdout.write('{} move - time left ({})'.format(self, self.simTime))
-        sys.stdout.flush()
-        nextFivesMark = int(ceil((self.simTime - 5)/5)*5)
-        while currTime - beginTime < self.simTime:
-            # Make a copy of the game
-            #copiedGame = copy.deepcopy(game)
-            copiedGame = game.Copy()
-            self.Simulate(copiedGame)
-            simulationCount += 1
-            if currTime - logTime >= 1:
-                timeLeft = self.simTime - (currTime - beginTime)
-                if timeLeft <= nextFivesMark:
-                    sys.stdout.write('({})'.format(str(nextFivesMark)))
-                    nextFivesMark -= 5
-                else:
-                    sys.stdout.write('.')
-                sys.stdout.flush()
-                logTime = currTime
-            currTime = time.time()
-        print
-                
+        if self.book is not None:
+            move = self.book.GetMove(game)
+            if move is not None:
+                if self.verbose:
+                    logger.info('%s book move %s', self, move)
+                return move
+        
+        budget = None
+        if self.solver is not None:
+            solveTime = monotonic()
+            solution = self.SolveEndgame(game)
+            if solution is None:
+                # the solver's share is taken from the search budget, the move stays within the budget
+                budget = self._BudgetLeft(monotonic() - solveTime, self.solver.nodeCount)
+            else:
+                score, move = solution
+                if self.verbose:
+                    outcome = 'win' if score > 0 else 'loss' if score < 0 else 'draw'
+                    logger.info('%s solved the position in %s nodes: %s - move %s',
+                                self, self.solver.nodeCount, outcome, move)
+                return move
+        
+        if self.cache is not None:
+            # the cache file holds the keys of one board size (see NodeTable.layout)
+            if self.nodes.layout is None:
+                self.nodes.layout = game.layout
+            elif self.nodes.layout is not game.layout:
+                raise Exception('Cache of another board size', self.cache, (game.RowSize(), game.ColumnSize()))
+        
+        if self.reuse and self.cache is None:
+            self.PruneTree(game)
         
-        logging.info('{} simulated {} times in {} seconds'.format(self, simulationCount, self.simTime))
+        simulationCount = self.Search(game, budget)
+        
+        if self.verbose:
+            logger.info('%s simulated %s times in %.2f seconds', self, simulationCount, self.searchTime)
+        if self.statsCallback is not None:
+            self.statsCallback(self, self.stats)
         
         myId = self.GetID()
-        movesStates = [(move, game.GetNextState(myId, move)) for move in validMoves]
-
+        emptyNode = Node()
+        movesNodes = [(move, self.nodes.Lookup(game.GetNextKey(myId, move)) or emptyNode) for move in validMoves]
+        
+        # A proven win is played, proven losses are avoided if possible
+        candidates = [(mv, node) for mv, node in movesNodes if node.proven != LOSE] or movesNodes
+        provenWins = [mv for mv, node in candidates if node.proven == WIN]
                 
         # Pick the move with the highest winning percentage
-        winPercentage, move = max((self.wins.get((myId, state), 0)/self.totals.get((myId,state), 1), mv) for mv, state in movesStates)
-        if winPercentage < 0.2:
-            winDrawPercentage, move2 = max(((self.wins.get((myId, state), 0)+self.draws.get((myId, state), 0))/self.totals.get((myId,state), 1), mv) for mv, state in movesStates)
+        winPercentage, move = max((node.wins/max(node.totals, 1), mv) for mv, node in candidates)
+        if provenWins:
+            move = provenWins[0]
+        elif winPercentage < 0.2:
+            winDrawPercentage, move2 = max(((node.wins+node.draws)/max(node.totals, 1), mv) for mv, node in candidates)
             if move2 != move:
                 move = move2
-                print 'Winning percentage too low. Use win+draw% - move {} - {:.1f}%'.format(move, winDrawPercentage*100)
+                if self.verbose:
+                    print 'Winning percentage too low. Use win+draw% - move {} - {:.1f}%'.format(move, winDrawPercentage*100)
+        
+        if self.verbose:
+            self.PrintStatistics(movesNodes)
         
-        # Print out the winning percentages
+        # clear stored states, unless they are reused by the next search
+        if not self.reuse and self.cache is None:
+            self.nodes.Clear()
+        
+        return move
+    
+    def SolveEndgame(self, game):
+        '''
+        Solve the position with the solver, within the solver's share of the budget unless few enough
+        cells are empty. Returns (score, move) as Solver.Solve, or None if not solved
+        '''
+        empty = game.RowSize() * game.ColumnSize() - sum(game.heights)
+        if empty <= self.solveEmpty:
+            return self.solver.Solve(game)
+        maxNodes = None
+        deadline = None
+        if self.simIterations is not None:
+            maxNodes = int(self.simIterations * self.solveFraction * SOLVER_NODES_PER_SIMULATION)
+        if self.simTime is not None:
+            deadline = monotonic() + self.simTime * self.solveFraction
+        return self.solver.Solve(game, maxNodes, deadline)
+    
+    def _BudgetLeft(self, elapsed, solverNodes):
+        '''
+        The (seconds, iterations) of the search budget left after elapsed seconds and solverNodes positions
+        of the solver
+        '''
+        simTime = self.simTime
+        simIterations = self.simIterations
+        if simTime is not None:
+            simTime = max(simTime - elapsed, 0)
+        if simIterations is not None:
+            simIterations = max(simIterations - int(ceil(solverNodes / SOLVER_NODES_PER_SIMULATION)), 0)
+        return simTime, simIterations
+    
+    def PrintStatistics(self, movesNodes):
+        '''
+        Print the statistics of the search for each (move, node) of the root
+        '''
         for x in sorted(((
-            100 * self.wins.get((myId, state), 0)/self.totals.get((myId, state), 1),
-            self.wins.get((myId, state), 0),
-            self.totals.get((myId, state), 0),
+            100 * node.wins/max(node.totals, 1),
+            node.wins,
+            node.totals,
             mv,
-            100 * self.draws.get((myId, state), 0)/self.totals.get((myId, state), 1),
-            self.draws.get((myId, state), 0),
-            100 * self.loses.get((myId, state), 0)/self.totals.get((myId, state), 1),
-            self.loses.get((myId, state), 0)            
-            ) for mv, state in movesStates), reverse=True):
-            print '{3} : w: {0:.1f}% ({1}/{2}), d: {4:.1f}% ({5}/{2}), l: {6:.1f}% ({7}/{2})'.format(*x)            
+            100 * node.draws/max(node.totals, 1),
+            node.draws,
+            100 * node.loses/max(node.totals, 1),
+            node.loses,
+            {WIN: ' - proven win', LOSE: ' - proven loss'}.get(node.proven, '')
+            ) for mv, node in movesNodes), reverse=True):
+            print '{3} : w: {0:.1f}% ({1}/{2}), d: {4:.1f}% ({5}/{2}), l: {6:.1f}% ({7}/{2}){8}'.format(*x)
+    
+        if self.stats is not None:
+            print 'Max depth = ', self.stats.MaxDepth()
+        print 'Nodes = {}, evictions = {}, hit rate = {:.1f}%'.format(len(self.nodes), self.nodes.evictions, 100 * self.nodes.HitRate())
+    
+    def PruneTree(self, game):
+        '''
+        Keep only the statistics of the states that can be reached from the game, i.e. the subtree under
+        the moves actually played since the last search. In the graph policy, the game's own node holds the
+        edge counts of the root and is kept as well.
+        '''
+        reachable = set()
+        if self.uct == 'graph':
+            reachable.add(game.GetKey())
+        self._AddReachable(game, reachable)
+        self.nodes.Retain(reachable)
+    
+    def _AddReachable(self, game, reachable):
+        '''
+        Add the keys of the nodes reachable from the game to reachable, playing the moves on the game and
+        taking them back
+        '''
+        if game.GetWinner() is not None:
+            return
+        playerId = game.GetCurrentPlayer()
+        for move in game.GetValidMoves():
+            key = game.GetNextKey(playerId, move)
+            if key in self.nodes and key not in reachable:
+                reachable.add(key)
+                game.Move(playerId, move)
+                try:
+                    self._AddReachable(game, reachable)
+                finally:
+                    game.Undo()
+    
+    
+    def Search(self, game, budget=None):
+        '''
+        Run simulations from the game within the search budget, in parallel if workers > 1.
+        budget, (seconds, iterations), replaces the player's budget (time and iterations) if given.
+        Returns the number of simulations.
+        '''
+        simTime, simIterations = budget if budget is not None else (self.simTime, self.simIterations)
+        # the root's children must survive evictions, they are what the move is chosen from
+        self.nodes.Pin(self._RootKeys(game))
+        # the root may have been proven by the previous searches
+        self.rootProven = self.prove and self.IsRootProven(game)
+        if self.collectStats:
+            self.stats = SearchStats()
+            nodeCount = len(self.nodes) + self.nodes.evictions
+        beginTime = monotonic()
+        if self.workers > 1:
+            simulationCount = self._SearchParallel(game, simTime, simIterations)
+        else:
+            simulationCount = self._SearchSequential(game, beginTime, simTime, simIterations)
+        self.searchTime = monotonic() - beginTime
+        if self.collectStats:
+            self.stats.simulations = simulationCount
+            self.stats.searchTime = self.searchTime
+            if self.workers == 1:
+                self.stats.nodesCreated = len(self.nodes) + self.nodes.evictions - nodeCount
+        return simulationCount
+    
+    def _SearchSequential(self, game, beginTime, simTime, simIterations):
+        progress = self.progress
+        # the clock is only read when something needs it
+        useClock = simTime is not None or progress is not None or self.earlyStop
+        
+        simulationCount = 0
+        currTime = logTime = beginTime
+        if progress is not None:
+            progress(self, simulationCount, 0, False)
+        while (simIterations is None or simulationCount < simIterations) and \
+              (simTime is None or currTime - beginTime < simTime) and not self.rootProven:
+            self.Simulate(game)
+            simulationCount += 1
+            if useClock:
+                currTime = monotonic()
+            if progress is not None and currTime - logTime >= self.progressInterval:
+                progress(self, simulationCount, currTime - beginTime, False)
+                logTime = currTime
+            if self.earlyStop and simulationCount % EARLY_STOP_INTERVAL == 0:
+                remaining = self._RemainingSimulations(simulationCount, currTime - beginTime, simTime, simIterations)
+                if self.CanStopEarly(game, remaining):
+                    logger.info('%s stopped early after %s simulations', self, simulationCount)
+                    break
+        if progress is not None:
+            progress(self, simulationCount, monotonic() - beginTime, True)
+        return simulationCount
+    
+    def _RootKeys(self, game):
+        '''
+        The keys of the root's children, and of the root itself in the graph policy (its edge counts)
+        '''
+        playerId = game.GetCurrentPlayer()
+        keys = [game.GetNextKey(playerId, move) for move in game.GetValidMoves()]
+        if self.uct == 'graph':
+            keys.append(game.GetKey())
+        return keys
+    
+    def IsRootProven(self, game):
+        '''
+        Returns True if the result of the game is proven: one of the moves is a proven win, or they are
+        all proven losses
+        '''
+        playerId = game.GetCurrentPlayer()
+        nodes = [self.nodes.nodes.get(game.GetNextKey(playerId, move)) for move in game.GetValidMoves()]
+        if any(node is not None and node.proven == WIN for node in nodes):
+            return True
+        return len(nodes) > 0 and all(node is not None and node.proven == LOSE for node in nodes)
+    
+    def _RemainingSimulations(self, simulationCount, elapsed, simTime, simIterations):
+        '''
+        Estimate how many simulations are left in the budget
+        '''
+        remaining = None
+        if simIterations is not None:
+            remaining = simIterations - simulationCount
+        if simTime is not None:
+            rate = simulationCount / elapsed if elapsed > 0 else float('inf')
+            byTime = int(ceil(rate * (simTime - elapsed)))
+            remaining = byTime if remaining is None else min(remaining, byTime)
+        return max(remaining, 0)
+    
+    def CanStopEarly(self, game, remaining):
+        '''
+        Returns True if the move GetMove would pick can't change within remaining more simulations:
+        the winning percentage of the best move, even if it loses all of them, stays above the one of
+        any other move, even if it wins all of them. As in GetMove, a proven win is played at once, and
+        the proven losses are not candidates unless all the moves are.
+        '''
+        playerId = game.GetCurrentPlayer()
+        nodes = [self.nodes.Lookup(game.GetNextKey(playerId, move)) for move in game.GetValidMoves()]
+        if any(node is not None and node.proven == WIN for node in nodes):
+            return True
+        if len(nodes) < 2 or any(node is None for node in nodes):
+            return False
+        nodes = [node for node in nodes if node.proven != LOSE] or nodes
+        if len(nodes) < 2:
+            # the only move not lost is played whatever the simulations
+            return True
+        best = max(nodes, key=lambda node: node.wins/max(node.totals, 1))
+        worstOfBest = best.wins/(best.totals + remaining) if best.totals + remaining else 0
+        if worstOfBest < 0.2:
+            # GetMove may fall back to the win+draw percentage
+            return False
+        return all(worstOfBest > (node.wins + remaining)/(node.totals + remaining)
+                   for node in nodes if node is not best)
     
-        print 'Max depth = ', self.depth
+    def _SearchParallel(self, game, simTime, simIterations):
+        '''
+        Root parallelization: each worker process searches the game from the same root with its own tree,
+        then the statistics of the root's children are merged into self.nodes
+        '''
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
         
-        # clear stored states
-        self.totals = {}
-        self.wins = {}
+        # The players are not needed to search, and can be expensive to send to the workers
+        searchGame = game.Copy()
+        searchGame.p1 = searchGame.p2 = searchGame.presenter = None
         
-        return move
+        # the workers search with the time budget, and split the iteration budget
+        workerArgs = dict(self.workerArgs, time=simTime, iterations=simIterations)
+        if simIterations is not None:
+            workerArgs['iterations'] = int(ceil(simIterations / self.workers))
+        args = [(self.GetID(), workerArgs, searchGame, random.getrandbits(32)) for _ in xrange(self.workers)]
+        simulationCount = 0
+        for count, children, stats in self.pool.map(_SearchWorker, args):
+            simulationCount += count
+            if stats is not None:
+                self.stats.Merge(stats)
+            for key, wins, draws, loses, totals, proven in children:
+                node = self.nodes.Add(key, wins, draws, loses, totals)
+                if proven is not None:
+                    node.proven = proven
+        return simulationCount
+    
+    def Ponder(self, game):
+        '''
+        Start searching the game, where the opponent is to move, in a background thread, until
+        StopPondering (called by GetMove) or ponderIterations simulations. Does nothing unless pondering
+        is enabled.
+        The thread runs under the interpreter lock: it only uses time the process would spend waiting,
+        for a human or for a bot in another process, and slows down an opponent searching in this one.
+        '''
+        if not self.ponder or not self.reuse or self.ponderThread is not None:
+            return
+        if game.GetWinner() is not None or len(game.GetValidMoves()) == 0:
+            return
+        # the thread plays on its own copy of the game, the caller's changes while it runs
+        ponderGame = game.Copy()
+        ponderGame.p1 = ponderGame.p2 = ponderGame.presenter = None
+        self.nodes.Pin(self._RootKeys(game))
+        # the statistics are the searches' only
+        self.stats = None
+        self.ponderCount = 0
+        self.ponderStop = threading.Event()
+        self.ponderThread = threading.Thread(target=self._PonderLoop, args=(ponderGame, self.ponderStop))
+        self.ponderThread.daemon = True
+        self.ponderThread.start()
+    
+    def _PonderLoop(self, game, stop):
+        while not stop.is_set() and (self.ponderIterations is None or self.ponderCount < self.ponderIterations):
+            self.Simulate(game)
+            self.ponderCount += 1
+    
+    def StopPondering(self):
+        '''
+        Stop the pondering thread, if any, and wait for it. Returns the number of simulations it ran.
+        '''
+        if self.ponderThread is None:
+            return 0
+        self.ponderStop.set()
+        self.ponderThread.join()
+        self.ponderThread = None
+        if self.verbose:
+            logger.info('%s pondered %s simulations', self, self.ponderCount)
+        return self.ponderCount
+    
+    def SaveCache(self):
+        '''
+        Save the node statistics to the cache file, if any
+        '''
+        if self.cache is not None and self.nodes.layout is not None:
+            count = self.nodes.Save(self.cache, self.cacheNodes, self.cacheMinTotals)
+            logger.debug('Player %s: %s nodes saved to %s', self.GetID(), count, self.cache)
+    
+    def Close(self):
+        '''
+        Stop pondering, save the node statistics to the cache file, stop the worker processes, if any,
+        and close the opening book
+        '''
+        self.StopPondering()
+        self.SaveCache()
+        if self.book is not None:
+            self.book.Close()
+            self.book = None
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
     
     
     def Simulate(self, game, randomFunc=choice):
         '''
         Simulate the game
         If randomFunc is provided, it will be called with randomFunc(validMoves) when random moves are desired
+        The moves are played on the game itself, and taken back with game.Undo before returning: the game
+        is left as it was, without being copied
         '''
-        totals = self.totals
-        wins = self.wins
-        loses = self.loses
-        draws = self.draws
+        moveCount = len(game.moves)
+        try:
+            winner = self._Simulate(game, randomFunc)
+            if self.trace:
+                self.traceCount += 1
+                if self.traceCount % self.trace == 0:
+                    traceLogger.info('%s simulation %s: moves %s, winner %s, %s nodes', self, self.traceCount,
+                                     game.moves[moveCount:], winner, len(self.nodes))
+        finally:
+            if len(game.moves) > moveCount:
+                game.Undo(len(game.moves) - moveCount)
+    
+    def _Simulate(self, game, randomFunc):
+        nodes = self.nodes
+        stats = self.stats
+        if stats is not None:
+            beginTime = monotonic()
+            # moves played in the tree, and the times the new node is expanded at
+            treeDepth = None
+            expandTime = expandedTime = None
         
         depth = 0
         winner = game.GetWinner()
         playerId = game.GetCurrentPlayer()
         validMoves = game.GetValidMoves()
         
-        visitedPlayersStates = set()
+        # (player, node) of the visited states, where player is the one whose move results in the state
+        visitedNodes = []
         expandTree = True
+        batchRollout = self.batchRollout
+        heuristic = self.rollout == 'heuristic'
+        
+        graph = self.uct == 'graph'
+        if graph:
+            # (node, move) of the edges followed from the visited states. The root needs a node as well, for
+            # its visit count
+            visitedEdges = []
+            parentNode = nodes.Expand(game.GetKey())
+            visitedNodes.append((game.GetNextPlayer(), parentNode))
+        
+        prove = self.prove
+        if prove:
+            # (node, child keys) of the states from the root while they all have nodes, for the proofs.
+            # The root has no node in the tree policy
+            path = []
+            stateNode = parentNode if graph else None
+            provenNode = None
         
         while winner is None and len(validMoves)>0 and depth < self.simDepth:
-            movesStates = [(move, game.GetNextState(playerId, move)) for move in validMoves]
+            if batchRollout is not None and not expandTree:
+                # the new node is played out by the batch rollout
+                break
+            
+            # after the new node, the heuristic policy plays without looking at the statistics
+            heuristicMove = heuristic and not expandTree
+            candidates = validMoves
+            provenWin = None
+            if prove and path is not None:
+                # proven children are only looked for in the tree, the nodes met after are rare
+                keys = [game.GetNextKey(playerId, move) for move in validMoves]
+                path.append((stateNode, keys))
+                movesNodes = [(move, nodes.Lookup(key)) for move, key in zip(validMoves, keys)]
+                if any(node is not None and node.proven is not None for _, node in movesNodes):
+                    provenWin = next((mv for mv, node in movesNodes if node is not None and node.proven == WIN), None)
+                    notLost = [(mv, node) for mv, node in movesNodes if node is None or node.proven != LOSE]
+                    if notLost:
+                        movesNodes = notLost
+                        candidates = [mv for mv, _ in notLost]
+            elif not heuristicMove:
+                movesNodes = [(move, nodes.Lookup(game.GetNextKey(playerId, move))) for move in validMoves]
             
-            if all(totals.get((playerId, state)) for _, state in movesStates):
+            if provenWin is not None:
+                move = provenWin
+            elif heuristicMove:
+                move = self._HeuristicMove(game, candidates, playerId)
+            elif graph:
+                edges = parentNode.edges if parentNode is not None else None
+                if edges is not None and all(node is not None and edges.get(move) for move, node in movesNodes):
+                    # all edges have been followed, use UCT with the edge counts
+                    N = parentNode.totals
+                    moveScore = max((node.wins/node.totals + sqrt(2*log(N)/edges[move]), move)
+                                   for move, node in movesNodes)
+                    move = moveScore[1]
+                else:
+                    move = randomFunc(candidates)
+            elif all(node is not None and node.totals for _, node in movesNodes):
                 # all child nodes have statistics, use UCT
-                N = sum(totals.get((playerId, state)) for _, state in movesStates)
-                moveScore = max((wins.get((playerId, state))/totals.get((playerId, state)) + sqrt(2*log(N)/totals.get((playerId, state))), move)
-                               for move, state in movesStates)
+                N = sum(node.totals for _, node in movesNodes)
+                moveScore = max((node.wins/node.totals + sqrt(2*log(N)/node.totals), move)
+                               for move, node in movesNodes)
                 move = moveScore[1]
             else:
-                move = randomFunc(validMoves)
+                move = randomFunc(candidates)
             
+            key = game.GetNextKey(playerId, move)
             game.Move(playerId, move)
+            node = nodes.Lookup(key)
             
-            # Add the (player, state) into visited nodes
-            moveState = [item for item in movesStates if item[0]==move]    # find the state corresponding to the move 
-            if len(moveState) != 1:
-                raise Exception('Duplicated move {} {} times: {}'.format(move, len(moveState), validMoves))
-            # first index [0]: first (the only) element
-            # second index [1]: the state
-            state = moveState[0][1] 
-            visitedPlayersStates.add((playerId, state))
-            
-            # Add the (player, state) into the statistics if expandTree is false.
+            # Add the state into the statistics if expandTree is false.
             # Only add the first new node
-            if expandTree:
-                if (playerId, state) not in totals:
-                    expandTree = False
-                    totals[(playerId, state)] = 0
-                    wins[(playerId, state)] = 0
-                    draws[(playerId, state)] = 0
-                    loses[(playerId, state)] = 0
+            if node is None and expandTree:
+                expandTree = False
+                if stats is not None:
+                    treeDepth = depth + 1
+                    expandTime = monotonic()
+                node = nodes.Expand(key)
+                if stats is not None:
+                    expandedTime = monotonic()
+            if node is not None:
+                visitedNodes.append((playerId, node))
+            if graph:
+                if parentNode is not None:
+                    visitedEdges.append((parentNode, move))
+                parentNode = node
 
-            playerId = game.GetCurrentPlayer()
             winner = game.GetWinner()
+            if prove and path is not None:
+                if node is None:
+                    path = None
+                elif node.proven is not None:
+                    # the result is known, no need to play it out
+                    provenNode = node
+                    if winner is None:
+                        winner = playerId if node.proven == WIN else game.GetCurrentPlayer()
+                elif winner is not None:
+                    provenNode = node
+                    node.proven = WIN if winner == playerId else LOSE
+                stateNode = node
+            
+            playerId = game.GetCurrentPlayer()
             validMoves = game.GetValidMoves()
             depth += 1
         
-        for (p, s) in visitedPlayersStates:
-            if (p, s) in totals:
-                totals[(p, s)] += 1
+        if stats is not None:
+            loopTime = monotonic()
+            batchTime = 0
+        
+        if prove and provenNode is not None:
+            self._PropagateProof(path, provenNode)
+        
+        if batchRollout is not None and winner is None and len(validMoves)>0 and depth < self.simDepth:
+            if stats is not None:
+                batchBeginTime = monotonic()
+            wins1, wins2, draws = batchRollout.Run(game, self.simDepth - depth)
+            if stats is not None:
+                batchTime = monotonic() - batchBeginTime
+            for (p, node) in visitedNodes:
+                if p == 1:
+                    nodes.UpdateCounts(node, wins1, draws, wins2)
+                else:
+                    nodes.UpdateCounts(node, wins2, draws, wins1)
+            edgeCount = batchRollout.size
+        else:
+            edgeCount = 1
+            for (p, node) in visitedNodes:
                 if winner is None:
-                    draws[(p,s)] += 1
+                    nodes.Update(node, DRAW)
                 elif p == winner:
-                    wins[(p,s)] += 1
+                    nodes.Update(node, WIN)
                 else:
-                    loses[(p,s)] += 1
-                        
-                        
-        if depth >= self.depth:
-            self.depth = depth
-                    
+                    nodes.Update(node, LOSE)
+        
+        if graph:
+            for (node, move) in visitedEdges:
+                nodes.UpdateEdge(node, move, edgeCount)
+        
+        if nodes.IsFull():
+            nodes.Evict()
+        
+        if stats is not None:
+            endTime = monotonic()
+            if treeDepth is None:
+                # no new node: the game ended, or reached a proven state, within the tree
+                stats.AddSimulation(loopTime - beginTime, 0, batchTime, endTime - loopTime - batchTime,
+                                    depth, None if batchRollout is not None else 0)
+            else:
+                stats.AddSimulation(expandTime - beginTime, expandedTime - expandTime,
+                                    loopTime - expandedTime + batchTime, endTime - loopTime - batchTime,
+                                    treeDepth, None if batchRollout is not None else depth - treeDepth)
+        return winner
+    
+    def _HeuristicMove(self, game, validMoves, playerId):
+        '''
+        Rollout move of the heuristic policy: a move winning now, else a move blocking the opponent's
+        win, else a random move, each weighted by the number of winning segments through the cell it
+        fills (see LineIndex.threatMasks and cellWeights)
+        '''
+        lines = game.lines
+        threatMasks = lines.threatMasks
+        height = game.layout.height
+        heights = game.heights
+        mine = game.masks[playerId]
+        theirs = game.masks[playerId % 2 + 1]
+        block = None
+        for move in validMoves:
+            for mask in threatMasks[move * height + heights[move]]:
+                if mine & mask == mask:
+                    return move
+                if block is None and theirs & mask == mask:
+                    block = move
+        if block is not None:
+            return block
+        
+        cellWeights = lines.cellWeights
+        weights = [cellWeights[move * height + heights[move]] for move in validMoves]
+        total = sum(weights)
+        if total == 0:
+            # no win is possible anywhere
+            return random.choice(validMoves)
+        x = random.random() * total
+        for move, weight in zip(validMoves, weights):
+            x -= weight
+            if x < 0:
+                return move
+        return validMoves[-1]
+    
+    def _PropagateProof(self, path, provenNode):
+        '''
+        Propagate the proof of provenNode, the last state of the path, towards the root: a state is a
+        proven loss for the player moving into it if one of its moves is a proven win, and a proven win
+        if all its moves are proven losses. Sets rootProven when the proof reaches the root.
+        '''
+        child = provenNode
+        for i in xrange(len(path) - 1, -1, -1):
+            stateNode, childKeys = path[i]
+            if child.proven == WIN:
+                result = LOSE
+            else:
+                children = [self.nodes.nodes.get(key) for key in childKeys]
+                if not all(node is not None and node.proven == LOSE for node in children):
+                    return
+                result = WIN
+            if i == 0:
+                self.rootProven = True
+            if stateNode is None:
+                return
+            stateNode.proven = result
+            child = stateNode
+
+
+def _SearchWorker(args):
+    '''
+    Run by the worker processes of a root-parallel MctsPlayer: search the game with a fresh player, and
+    return the simulation count, the (key, wins, draws, loses, totals, proven) of the root's children and
+    the search statistics (None unless collected)
+    '''
+    playerId, kwargs, game, seed = args
+    # the workers are forked with the same random state
+    random.seed(seed)
+    player = MctsPlayer(playerId, **kwargs)
+    simulationCount = player.Search(game)
+    children = []
+    for move in game.GetValidMoves():
+        key = game.GetNextKey(playerId, move)
+        node = player.nodes.Lookup(key)
+        if node is not None:
+            children.append((key, node.wins, node.draws, node.loses, node.totals, node.proven))
+    return simulationCount, children, player.stats
+
+
+class TextProgress(object):
+    '''
+    Progress callback for MctsPlayer writing to stdout: a dot every second, and the time left every 5 seconds
+    '''
+    def __call__(self, player, simulationCount, elapsed, done):
+        if done:
+            print
+            return
+        if simulationCount == 0:
+            if player.simTime is None:
+                sys.stdout.write('{} move - simulations ({})'.format(player, player.simIterations))
+                self.nextFivesMark = None
+            else:
+                sys.stdout.write('{} move - time left ({})'.format(player, player.simTime))
+                self.nextFivesMark = int(ceil((player.simTime - 5)/5)*5)
+        elif self.nextFivesMark is not None and player.simTime - elapsed <= self.nextFivesMark:
+            sys.stdout.write('({})'.format(str(self.nextFivesMark)))
+            self.nextFivesMark -= 5
+        else:
+            sys.stdout.write('.')
+        sys.stdout.flush()
@@ -0,0 +1,43 @@
+#!/usr/bin/python
+
+# MergeNodes.py - merges node statistics files (see NodeTable.Save) written by several players into one
+
+import argparse
+import os
+from NodeTable import NodeTable
+
+
+def MergeNodes(output, inputs, base=None, maxNodes=None, minTotals=1):
+    '''
+    Merge the statistics of the input files into the output file.
+    base is the file the players were started from (their cache file was a copy of it): its statistics
+    are counted once, and only what each player has learned since is added. base may be the output file.
+    Returns the number of nodes written.
+    '''
+    table = NodeTable()
+    baseTable = None
+    if base is not None and os.path.exists(base):
+        baseTable = NodeTable()
+        baseTable.Load(base)
+        table.Merge(base)
+    for path in inputs:
+        table.Merge(path, baseTable)
+    return table.Save(output, maxNodes, minTotals)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Merge the node statistics files of several mcts players.')
+    parser.add_argument('inputs', nargs='+',
+                        help = 'Node statistics files, see the cache option of MctsPlayer')
+    parser.add_argument('--output', required=True,
+                        help = 'Merged file, may be one of the inputs or the base')
+    parser.add_argument('--base',
+                        help = 'File the players started from, counted once')
+    parser.add_argument('--maxnodes', type=int,
+                        help = 'Keep only this number of the most simulated nodes')
+    parser.add_argument('--mintotals', type=int, default=1,
+                        help = 'Keep only the nodes simulated at least this number of times (default=%(default)s)')
+    args = parser.parse_args()
+
+    count = MergeNodes(args.output, args.inputs, args.base, args.maxnodes, args.mintotals)
+    print 'Wrote {} nodes to {}'.format(count, args.output)
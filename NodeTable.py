@@ -0,0 +1,303 @@
+# NodeTable.py - statistics of the states visited by the Monte Carlo tree search
+
+import gc
+import heapq
+import os
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+from itertools import izip
+from Bitboard import GetLayout
+
+# Simulation results, from the point of view of the player whose move results in the state
+WIN = 1
+DRAW = 0
+LOSE = -1
+
+# File layout of NodeTable.Save: a header (magic, number of nodes, rows and columns of the board, checksum of
+# the Zobrist keys: BitboardLayout.checksum), then one column per field, little-endian:
+# key high and low 32 bits, wins, draws, loses (signed 32 bits: arrays of unsigned ones read back as longs)
+# and proven (signed byte, 0 for None)
+FILE_HEADER = struct.Struct('<8sQBB2xI')
+FILE_MAGIC = 'C4NODES2'
+FILE_COLUMNS = 'iiiiib'
+
+
+@contextmanager
+def _GcPaused():
+    '''
+    Pause the cyclic garbage collector: the millions of objects allocated while saving or loading a
+    table would trigger collections that scan every node, and none of them is garbage
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class Node(object):
+    '''
+    Node: statistics of one state
+    wins, draws, loses: the number of times the player whose move results in the state wins, draws or loses
+    totals: the number of times the state has been simulated
+    edges: None, or the number of simulations that went from this state through each move (dictionary
+           from move to count), when the search keeps per-edge counts (see MctsPlayer uct='graph')
+    proven: None, or WIN or LOSE once the game theoretic result of the state is known for the player
+            whose move results in the state (see MctsPlayer prove=True)
+    '''
+    __slots__ = ('wins', 'draws', 'loses', 'totals', 'edges', 'proven')
+
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.loses = 0
+        self.totals = 0
+        self.edges = None
+        self.proven = None
+
+    def __repr__(self):
+        return 'Node(w={}, d={}, l={}, t={}, p={})'.format(self.wins, self.draws, self.loses, self.totals, self.proven)
+
+
+class NodeTable(object):
+    '''
+    NodeTable: one Node per state, indexed by the state key (see Connect4.GetNextKey)
+    
+    If maxNodes is given, the table is bounded: once it holds more than maxNodes nodes, Evict() drops the
+    least visited ones (evictFraction of maxNodes at a time, so that the cost is amortized), but never
+    the pinned ones. Lookup and Evict keep counters for the hit rate and the number of evicted nodes.
+    '''
+    def __init__(self, maxNodes=None, evictFraction=0.1):
+        self.nodes = {}
+        self.maxNodes = maxNodes
+        self.evictFraction = evictFraction
+        self.pinned = frozenset()
+        # the BitboardLayout the keys are the Zobrist keys of, if known: set by the caller or by Merge,
+        # and written to the files of Save
+        self.layout = None
+        
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, key):
+        return key in self.nodes
+
+    def Lookup(self, key):
+        '''
+        Returns the node of the state, or None if the state has not been expanded
+        '''
+        node = self.nodes.get(key)
+        if node is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return node
+
+    def Expand(self, key):
+        '''
+        Returns the node of the state, creating an empty one if needed
+        '''
+        node = self.nodes.get(key)
+        if node is None:
+            node = Node()
+            self.nodes[key] = node
+        return node
+
+    def Update(self, node, result):
+        '''
+        Record one simulation result (WIN, DRAW or LOSE) in the node
+        '''
+        node.totals += 1
+        if result == WIN:
+            node.wins += 1
+        elif result == DRAW:
+            node.draws += 1
+        else:
+            node.loses += 1
+
+    def UpdateCounts(self, node, wins, draws, loses):
+        '''
+        Record the results of a batch of simulations in the node
+        '''
+        node.wins += wins
+        node.draws += draws
+        node.loses += loses
+        node.totals += wins + draws + loses
+
+    def UpdateEdge(self, node, move, count=1):
+        '''
+        Record count simulations going from the node through move
+        '''
+        if node.edges is None:
+            node.edges = {}
+        node.edges[move] = node.edges.get(move, 0) + count
+
+    def Add(self, key, wins, draws, loses, totals):
+        '''
+        Add statistics gathered elsewhere (e.g. by another process) to the node of the state
+        '''
+        node = self.Expand(key)
+        node.wins += wins
+        node.draws += draws
+        node.loses += loses
+        node.totals += totals
+        return node
+
+    def Retain(self, keys):
+        '''
+        Drop all the nodes but those of the given keys
+        '''
+        nodes = self.nodes
+        self.nodes = dict((key, nodes[key]) for key in keys if key in nodes)
+
+    def Clear(self):
+        self.nodes = {}
+    
+    def IsFull(self):
+        return self.maxNodes is not None and len(self.nodes) > self.maxNodes
+    
+    def Pin(self, keys):
+        '''
+        Protect the nodes of the given keys from eviction, replacing the previously pinned keys
+        '''
+        self.pinned = frozenset(keys)
+    
+    def Evict(self):
+        '''
+        Drop the least visited nodes that are not pinned, until the table is evictFraction below maxNodes.
+        Returns the number of nodes dropped.
+        '''
+        if self.maxNodes is None:
+            return 0
+        count = len(self.nodes) - int(self.maxNodes * (1 - self.evictFraction))
+        if count <= 0:
+            return 0
+        pinned = self.pinned
+        victims = heapq.nsmallest(count, ((node.totals, key) for key, node in self.nodes.iteritems() if key not in pinned))
+        for _, key in victims:
+            del self.nodes[key]
+        self.evictions += len(victims)
+        return len(victims)
+    
+    def Save(self, path, maxNodes=None, minTotals=1):
+        '''
+        Write the nodes simulated at least minTotals times, only the maxNodes most simulated ones if given.
+        The keys must be the Zobrist keys of the layout (see Connect4.GetKey), and the per-edge counts are not
+        saved.
+        The file is written aside then renamed, so that a reader never sees a partial file.
+        Returns the number of nodes written.
+        '''
+        with _GcPaused():
+            return self._Save(path, maxNodes, minTotals)
+
+    def _Save(self, path, maxNodes, minTotals):
+        if self.layout is None:
+            raise Exception('Unknown layout of the keys, the node statistics cannot be saved')
+        items = [(key, node) for key, node in self.nodes.iteritems() if node.totals >= minTotals]
+        if maxNodes is not None and len(items) > maxNodes:
+            items = heapq.nlargest(maxNodes, items, key=lambda item: item[1].totals)
+        keys = [key for key, _ in items]
+        nodes = [node for _, node in items]
+        columns = [
+            array('i', [key >> 32 for key in keys]),
+            array('i', [(key & 0xffffffff) - (key & 0x80000000) * 2 for key in keys]),
+            array('i', [node.wins for node in nodes]),
+            array('i', [node.draws for node in nodes]),
+            array('i', [node.loses for node in nodes]),
+            array('b', [node.proven or 0 for node in nodes]),
+        ]
+        tempPath = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tempPath, 'wb') as f:
+            f.write(FILE_HEADER.pack(FILE_MAGIC, len(items), self.layout.rows, self.layout.columns,
+                                     self.layout.checksum))
+            for column in columns:
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                column.tofile(f)
+        os.rename(tempPath, path)
+        return len(items)
+
+    def Merge(self, path, base=None):
+        '''
+        Add the statistics of a file written by Save to the nodes (read as whole columns, not node by node).
+        If base, a NodeTable, is given, its statistics are subtracted from the file's first: the file was
+        written by a player started from base, and only what it has learned since is added.
+        The file must have been written with the Zobrist keys of this process, for the layout of the nodes
+        if it is known, which it then becomes.
+        Returns the number of nodes read.
+        '''
+        with _GcPaused():
+            return self._Merge(path, base)
+
+    def _Merge(self, path, base):
+        with open(path, 'rb') as f:
+            magic, count, rows, columns, checksum = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != FILE_MAGIC:
+                raise Exception('Not a node statistics file', path)
+            layout = GetLayout(rows, columns)
+            if checksum != layout.checksum:
+                raise Exception('Node statistics written with other Zobrist keys', path)
+            if self.layout is not None and self.layout is not layout:
+                raise Exception('Node statistics of another board size', path, (rows, columns))
+            self.layout = layout
+            columns = []
+            for typecode in FILE_COLUMNS:
+                column = array(typecode)
+                column.fromfile(f, count)
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                columns.append(column)
+        
+        nodes = self.nodes
+        baseNodes = base.nodes if base is not None else {}
+        newNode = Node.__new__
+        for hi, lo, wins, draws, loses, proven in izip(*columns):
+            key = hi << 32 | (lo & 0xffffffff)
+            baseNode = baseNodes.get(key)
+            if baseNode is not None:
+                wins = max(wins - baseNode.wins, 0)
+                draws = max(draws - baseNode.draws, 0)
+                loses = max(loses - baseNode.loses, 0)
+            node = nodes.get(key)
+            if node is None:
+                # the common case, loading into an empty table: skip Node.__init__
+                node = newNode(Node)
+                node.wins = wins
+                node.draws = draws
+                node.loses = loses
+                node.totals = wins + draws + loses
+                node.edges = None
+                node.proven = proven or None
+                nodes[key] = node
+                continue
+            node.wins += wins
+            node.draws += draws
+            node.loses += loses
+            node.totals += wins + draws + loses
+            if proven:
+                node.proven = proven
+        return count
+
+    def Load(self, path):
+        '''
+        Replace the nodes by the ones of a file written by Save
+        '''
+        self.Clear()
+        self.layout = None
+        return self.Merge(path)
+    
+    def HitRate(self):
+        '''
+        The fraction of the lookups that found the node
+        '''
+        lookups = self.hits + self.misses
+        return self.hits / float(lookups) if lookups else 0.0
@@ -0,0 +1,85 @@
+# OpeningBook.py - precomputed moves for the first plies, built offline (see BuildBook.py) and memory-mapped
+# by the players
+
+import mmap
+import struct
+from Bitboard import GetLayout
+
+# File layout: a header, then one fixed-width record per position, sorted by key
+# header: magic, rows, columns, number of pieces in a row to win, checksum of the Zobrist keys
+# (BitboardLayout.checksum)
+HEADER = struct.Struct('<8sBBBxI')
+MAGIC = 'C4BOOK02'
+# record: position key (Connect4.GetKey), wins, draws and totals of the book move, the book move
+RECORD = struct.Struct('<QIIIB3x')
+KEY = struct.Struct('<Q')
+
+
+def WriteBook(path, entries, rows, columns, n):
+    '''
+    Write the book file from (key, move, wins, draws, totals) entries, one per position
+    '''
+    entries = sorted(entries)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, rows, columns, n, GetLayout(rows, columns).checksum))
+        for key, move, wins, draws, totals in entries:
+            f.write(RECORD.pack(key, wins, draws, totals, move))
+
+
+class OpeningBook(object):
+    '''
+    OpeningBook: read-only view of a book file.
+
+    The file is memory-mapped and searched in place with a binary search over the sorted keys, so opening
+    it is instant whatever its size, and the records are never loaded on the heap.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, rows, columns, n, checksum = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise Exception('Not an opening book', path)
+        if checksum != GetLayout(rows, columns).checksum:
+            raise Exception('Opening book written with other Zobrist keys', path)
+        self.size = (rows, columns, n)
+        self.count = (len(self.map) - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def Lookup(self, key):
+        '''
+        Returns (move, wins, draws, totals) for the position of the key, or None if it is not in the book
+        '''
+        data = self.map
+        unpack = KEY.unpack_from
+        recordSize = RECORD.size
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * recordSize
+            midKey = unpack(data, offset)[0]
+            if midKey < key:
+                lo = mid + 1
+            elif midKey > key:
+                hi = mid
+            else:
+                _, wins, draws, totals, move = RECORD.unpack_from(data, offset)
+                return move, wins, draws, totals
+        return None
+
+    def GetMove(self, game):
+        '''
+        Returns the book move for the game, or None if the position is not in the book
+        '''
+        if self.size != (game.RowSize(), game.ColumnSize(), game.GetNConscecutivesToWin()):
+            return None
+        entry = self.Lookup(game.GetKey())
+        if entry is None or not game.IsValidMove(entry[0]):
+            return None
+        return entry[0]
+
+    def Close(self):
+        self.map.close()
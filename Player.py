@@ -13,4 +13,29 @@ class Player(object):
     
     def GetMove(self, game, validMove):
         raise NotImplemented('Concrete class must implement this method')
+    
+    def Ponder(self, game):
+        '''
+        Called when the opponent is about to think about its move in the game: the player may think
+        meanwhile, until StopPondering. Nothing to do by default.
+        '''
+        pass
+    
+    def StopPondering(self):
+        '''
+        Stop thinking on the opponent's time, see Ponder. Nothing to do by default.
+        '''
+        pass
+    
+    def GetSearchStats(self):
+        '''
+        Returns the statistics of the search of the last move (see SearchStats), or None
+        '''
+        return None
+    
+    def Close(self):
+        '''
+        Release the resources held by the player (e.g. worker processes). Nothing to do by default.
+        '''
+        pass
     
\ No newline at end of file
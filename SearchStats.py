@@ -0,0 +1,104 @@
+# SearchStats.py - instrumentation of the MCTS search: phase timers, throughput, node and depth statistics
+
+import json
+
+PHASES = ('selection', 'expansion', 'rollout', 'backprop')
+
+
+class SearchStats(object):
+    '''
+    SearchStats: statistics of one search of MctsPlayer (see the stats option), filled by MctsPlayer.Simulate.
+
+    The phases of a simulation are the selection (down the tree to the new node), the expansion (adding the
+    new node), the rollout (playing the game out from it) and the backpropagation (updating the statistics
+    of the visited nodes and the proofs). phaseTimes holds the seconds spent in each, over all simulations.
+    treeDepths and rolloutLengths are histograms, from the number of moves played in the tree (including
+    the move to the new node) or in the rollout, to the number of simulations. Batch rollouts play several
+    games of their own length, they are not counted in rolloutLengths.
+    '''
+    def __init__(self):
+        self.simulations = 0
+        self.searchTime = 0.0
+        self.nodesCreated = 0
+        self.phaseTimes = dict((phase, 0.0) for phase in PHASES)
+        self.treeDepths = {}
+        self.rolloutLengths = {}
+
+    def AddSimulation(self, selection, expansion, rollout, backprop, treeDepth, rolloutLength):
+        '''
+        Record one simulation: the seconds spent in each phase, and its depth in the tree and its rollout
+        length (None for batch rollouts)
+        '''
+        phaseTimes = self.phaseTimes
+        phaseTimes['selection'] += selection
+        phaseTimes['expansion'] += expansion
+        phaseTimes['rollout'] += rollout
+        phaseTimes['backprop'] += backprop
+        self.treeDepths[treeDepth] = self.treeDepths.get(treeDepth, 0) + 1
+        if rolloutLength is not None:
+            self.rolloutLengths[rolloutLength] = self.rolloutLengths.get(rolloutLength, 0) + 1
+
+    def Merge(self, other):
+        '''
+        Add the statistics of another search, e.g. the one of a worker process searching at the same time
+        (the search time is the longest of the two)
+        '''
+        self.simulations += other.simulations
+        self.searchTime = max(self.searchTime, other.searchTime)
+        self.nodesCreated += other.nodesCreated
+        for phase in PHASES:
+            self.phaseTimes[phase] += other.phaseTimes[phase]
+        for histogram, otherHistogram in ((self.treeDepths, other.treeDepths),
+                                          (self.rolloutLengths, other.rolloutLengths)):
+            for value, count in otherHistogram.iteritems():
+                histogram[value] = histogram.get(value, 0) + count
+
+    def SimulationsPerSecond(self):
+        return self.simulations / self.searchTime if self.searchTime > 0 else 0.0
+
+    def MaxDepth(self):
+        '''
+        Returns the longest simulation, tree and rollout moves, as a lower bound when rollouts are batched
+        '''
+        if not self.treeDepths:
+            return 0
+        return max(self.treeDepths) + max(self.rolloutLengths or [0])
+
+    def ToDict(self):
+        '''
+        Returns the statistics as a dictionary of plain values (histogram keys as strings, as in JSON)
+        '''
+        return {
+            'simulations': self.simulations,
+            'searchTime': self.searchTime,
+            'simsPerSecond': self.SimulationsPerSecond(),
+            'nodesCreated': self.nodesCreated,
+            'phaseTimes': dict(self.phaseTimes),
+            'treeDepths': dict((str(depth), count) for depth, count in self.treeDepths.iteritems()),
+            'rolloutLengths': dict((str(length), count) for length, count in self.rolloutLengths.iteritems()),
+        }
+
+    def ToJson(self, **extra):
+        '''
+        Returns the statistics as one line of JSON, with the extra fields given
+        '''
+        values = self.ToDict()
+        values.update(extra)
+        return json.dumps(values, sort_keys=True)
+
+
+class JsonLineWriter(object):
+    '''
+    Stats callback for MctsPlayer writing the statistics of each search as a line of JSON to a file
+    (an open file object, or a path appended to)
+    '''
+    def __init__(self, output):
+        self.output = output
+
+    def __call__(self, player, stats):
+        line = stats.ToJson(player=str(player)) + '\n'
+        if isinstance(self.output, basestring):
+            with open(self.output, 'a') as f:
+                f.write(line)
+        else:
+            self.output.write(line)
@@ -0,0 +1,198 @@
+# Solver.py - exact search of Connect4 positions with negamax and alpha-beta pruning
+
+from Clock import monotonic
+
+# number of nodes between two checks of the time and node budgets
+BUDGET_CHECK_INTERVAL = 1000
+
+# default bound of the transposition table, about 30 MB
+MAX_ENTRIES = 200000
+
+# transposition table entry kinds
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class _OutOfBudget(Exception):
+    pass
+
+
+class Solver(object):
+    '''
+    Solver: finds the game theoretic value of a Connect4 position and a move achieving it.
+
+    The search is a negamax with alpha-beta pruning over the bitboards of the position
+    (see Bitboard.BitboardLayout), with:
+    - move ordering: winning moves first, forced blocks, then the best move found previously for the
+      position and the center columns before the outer ones,
+    - a transposition table keyed by the pieces of the player to move plus all the pieces, which is
+      unique per position and side to move,
+    - iterative deepening: the depth limit grows one ply at a time, until the value is known. A position
+      where a player wins within the limit is solved even if the board is not full.
+
+    Values searched to the end of the game are exact and used by every later search. Values cut by the
+    depth limit are only used within the same iteration: mixed with deeper results they could show a
+    slow win beyond the limit while a faster one is missed. They still order the moves of later searches.
+
+    Scores are from the point of view of the player to move: winning scores the number of empty cells
+    left before the winning move (so faster wins score higher), losing the opposite, and a draw 0.
+    The table persists between calls, positions of the next moves are often already in it. It is
+    cleared whenever it reaches maxEntries, in the middle of a search as well, so that its memory stays
+    bounded (an entry takes about 150 bytes).
+    '''
+    def __init__(self, maxEntries=MAX_ENTRIES):
+        self.maxEntries = maxEntries
+        self.table = {}
+        self.tableSize = None
+        # iteration number, stored in the table entries cut by the depth limit
+        self.generation = 0
+        # number of positions searched by the last Solve
+        self.nodeCount = 0
+
+    def Solve(self, game, maxNodes=None, deadline=None):
+        '''
+        Solve the game position for the current player.
+        The search gives up after maxNodes positions or at the deadline (a Clock.monotonic time),
+        None meaning no limit. Returns (score, move), or None if the position is not solved within the
+        budget or the game is over.
+        '''
+        validMoves = game.GetValidMoves()
+        if game.GetWinner() is not None or len(validMoves) == 0:
+            return None
+
+        layout = game.layout
+        n = game.GetNConscecutivesToWin()
+        if self.tableSize != (layout.rows, layout.columns, n):
+            self.table.clear()
+            self.tableSize = (layout.rows, layout.columns, n)
+
+        self.layout = layout
+        self.n = n
+        center = (layout.columns - 1) / 2.0
+        self.order = sorted(xrange(layout.columns), key=lambda c: abs(c - center))
+        self.maxNodes = maxNodes
+        self.deadline = deadline
+        self.nodeCount = 0
+        self._NextCheck()
+
+        player = game.GetCurrentPlayer()
+        mine = game.masks[player]
+        theirs = game.masks[player % 2 + 1]
+        heights = game.heights[:]
+        empty = layout.rows * layout.columns - sum(heights)
+        try:
+            for depth in xrange(1, empty + 1):
+                # set when a position is evaluated at the depth limit, i.e. when a score of 0 is not a draw
+                self.horizon = False
+                self.generation += 1
+                score = self._Negamax(mine, theirs, heights, -empty, empty, depth, empty)
+                if score != 0 or not self.horizon:
+                    return score, self.bestMove
+        except _OutOfBudget:
+            pass
+        return None
+
+    def _CheckBudget(self):
+        if self.maxNodes is not None and self.nodeCount >= self.maxNodes:
+            raise _OutOfBudget()
+        if self.deadline is not None and monotonic() >= self.deadline:
+            raise _OutOfBudget()
+        self._NextCheck()
+
+    def _NextCheck(self):
+        # the node budget is checked exactly, the caller counts the nodes searched against its own budget
+        self.nextCheck = self.nodeCount + BUDGET_CHECK_INTERVAL
+        if self.maxNodes is not None:
+            self.nextCheck = min(self.nextCheck, self.maxNodes)
+
+    def _OrderMoves(self, mine, theirs, heights, empty, bestMove):
+        '''
+        Returns (score, [move]) if the player to move wins now, or loses whatever the move,
+        otherwise (None, the moves to search in order)
+        '''
+        layout = self.layout
+        n = self.n
+        rows = layout.rows
+        height = layout.height
+        playable = []
+        threats = []
+        for c in self.order:
+            row = heights[c]
+            if row < rows:
+                bit = 1 << (c * height + row)
+                if layout.HasLineThrough(mine | bit, bit, n):
+                    return empty, [c]
+                if layout.HasLineThrough(theirs | bit, bit, n):
+                    threats.append(c)
+                playable.append(c)
+        if len(threats) > 1:
+            # the opponent wins on the next move
+            return -(empty - 1), threats[:1]
+        if threats:
+            return None, threats
+        if bestMove is not None and bestMove != playable[0]:
+            playable.remove(bestMove)
+            playable.insert(0, bestMove)
+        return None, playable
+
+    def _Negamax(self, mine, theirs, heights, alpha, beta, depth, empty):
+        '''
+        Returns the score of the position for the player to move, searched depth plies deep, and sets
+        self.bestMove to the move achieving it (None if unknown)
+        '''
+        self.nodeCount += 1
+        if self.nodeCount >= self.nextCheck:
+            self._CheckBudget()
+        if empty == 0:
+            self.bestMove = None
+            return 0
+
+        key = mine + (mine | theirs)
+        entry = self.table.get(key)
+        bestMove = None
+        if entry is not None:
+            generation, kind, score, bestMove = entry
+            if (generation is None or generation == self.generation) and (
+                    kind == EXACT or (kind == LOWER and score >= beta) or (kind == UPPER and score <= alpha)):
+                if generation is not None:
+                    self.horizon = True
+                self.bestMove = bestMove
+                return score
+
+        score, moves = self._OrderMoves(mine, theirs, heights, empty, bestMove)
+        if score is not None:
+            self.bestMove = moves[0]
+            return score
+        if depth == 0:
+            self.horizon = True
+            self.bestMove = None
+            return 0
+
+        height = self.layout.height
+        alphaOrig = alpha
+        best = None
+        for c in moves:
+            bit = 1 << (c * height + heights[c])
+            heights[c] += 1
+            score = -self._Negamax(theirs, mine | bit, heights, -beta, -alpha, depth - 1, empty - 1)
+            heights[c] -= 1
+            if best is None or score > best:
+                best = score
+                bestMove = c
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if best <= alphaOrig:
+            kind = UPPER
+        elif best >= beta:
+            kind = LOWER
+        else:
+            kind = EXACT
+        table = self.table
+        if len(table) >= self.maxEntries:
+            table.clear()
+        # None: searched to the end of the game
+        table[key] = (None if depth >= empty else self.generation, kind, best, bestMove)
+        self.bestMove = bestMove
+        return best
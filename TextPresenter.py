@@ -7,20 +7,23 @@ class TextPresenter(Presenter):
     def Present(self, game):
         colSize = game.ColumnSize()
         rowSize = game.RowSize()
+        # widths of the column and row numbers, boards with 10 or more columns or rows get wider cells
+        colWidth = len(str(colSize - 1))
+        rowWidth = len(str(rowSize - 1))
         
         # first line
-        print ' ',
+        print ' ' * rowWidth,
         for i in xrange(colSize):
-            print ' ', i,
+            print ' ', str(i).rjust(colWidth),
         print
         
         lastMove = game.GetLastMove()
         
         for i in reversed(xrange(rowSize)):
-            print i,
+            print str(i).rjust(rowWidth),
             row = game.GetRow(i)
             for j in xrange(len(row)):
-                s = self._GetSymbol(row[j])
+                s = self._GetSymbol(row[j]).rjust(colWidth)
                 if lastMove is not None and (i, j) == lastMove:
                     print '>',s,
                 else:
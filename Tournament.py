@@ -0,0 +1,213 @@
+#!/usr/bin/python
+
+# Tournament.py - headless MCTS vs MCTS games across a process pool
+
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import time
+from Connect4 import Connect4
+from GameRecord import GameRecordWriter
+from LogConfig import ConfigureLogging
+from MctsPlayer import MctsPlayer
+
+
+def PlayGame(args):
+    '''
+    Play one headless game between the players A and B, each given as MctsPlayer keyword arguments,
+    on the board given by the Connect4 keyword arguments gameOptions (rows, columns and n).
+    A moves first in the even games, B in the odd ones.
+    Returns the game result: {'game', 'first', 'winner' ('A', 'B' or None), 'moves', 'seconds', 'record'},
+    record being the GameRecord of the game, with the names of player 1 and 2 as 'labels'
+    '''
+    gameIndex, optionsA, optionsB, seed, gameOptions = args
+    random.seed(seed)
+    if gameIndex % 2 == 0:
+        names = ('A', 'B')
+        p1 = MctsPlayer(1, **dict(optionsA, verbose=False))
+        p2 = MctsPlayer(2, **dict(optionsB, verbose=False))
+    else:
+        names = ('B', 'A')
+        p1 = MctsPlayer(1, **dict(optionsB, verbose=False))
+        p2 = MctsPlayer(2, **dict(optionsA, verbose=False))
+
+    game = Connect4(p1, p2, **gameOptions)
+    beginTime = time.time()
+    records = []
+    try:
+        winnerId = game.Play(verbose=False, recorder=records.append)
+    finally:
+        p1.Close()
+        p2.Close()
+    record = records[0]
+    record['labels'] = list(names)
+    return {
+        'type': 'game',
+        'game': gameIndex,
+        'first': names[0],
+        'winner': None if winnerId is None else names[winnerId - 1],
+        'moves': sum(game.heights),
+        'seconds': round(time.time() - beginTime, 3),
+        'record': record,
+    }
+
+
+def EloFromScore(score):
+    '''
+    Elo difference corresponding to an expected score (0 to 1). The score is clamped so that the
+    difference stays finite when one player wins every game.
+    '''
+    score = min(max(score, 1e-3), 1 - 1e-3)
+    return -400 * math.log10(1 / score - 1)
+
+
+def Summarize(records, z=1.96):
+    '''
+    Summarize game records from A's point of view: win/draw/loss rates, score (win=1, draw=0.5),
+    Elo difference of A over B, and their confidence intervals (Wilson score interval, z=1.96 for 95%).
+    Counting draws as half a win in the Wilson interval overestimates the variance a little, so the
+    intervals are on the conservative side.
+    '''
+    games = len(records)
+    winsA = sum(1 for r in records if r['winner'] == 'A')
+    winsB = sum(1 for r in records if r['winner'] == 'B')
+    draws = games - winsA - winsB
+    summary = {'type': 'summary', 'games': games, 'winsA': winsA, 'winsB': winsB, 'draws': draws}
+    if games == 0:
+        return summary
+
+    score = (winsA + 0.5 * draws) / float(games)
+    z2 = z * z / games
+    center = (score + z2 / 2) / (1 + z2)
+    margin = z * math.sqrt(score * (1 - score) / games + z2 / (4 * games)) / (1 + z2)
+    low, high = max(center - margin, 0), min(center + margin, 1)
+    summary.update({
+        'winRateA': winsA / float(games),
+        'drawRate': draws / float(games),
+        'winRateB': winsB / float(games),
+        'scoreA': score,
+        'scoreA_ci': [low, high],
+        'eloA': EloFromScore(score),
+        'eloA_ci': [EloFromScore(low), EloFromScore(high)],
+    })
+    return summary
+
+
+def CheckOptions(options):
+    '''
+    Raise an exception if the MctsPlayer keyword arguments can't be played in a tournament: the games run
+    in the daemonic processes of a pool, which can't start the worker processes of a root-parallel player,
+    and both players of a game share a process, where pondering only takes time from the opponent's search
+    (see MctsPlayer.Ponder)
+    '''
+    if options.get('workers', 1) > 1:
+        raise Exception('MctsPlayer workers > 1 is not supported by the tournament, the games already run '
+                        'in parallel (see --processes)', options)
+    if options.get('ponder'):
+        raise Exception('MctsPlayer ponder is not supported by the tournament, both players of a game run in '
+                        'the same process', options)
+
+
+def RunTournament(games, optionsA, optionsB, output, processes=None, seed=None, gameOptions=None, records=None):
+    '''
+    Play the games in a pool of processes, write one JSON line per game to output as they finish,
+    then a summary line. Returns the summary.
+    If records is given, the game records (moves, times, search statistics) are appended to that file
+    (see GameRecord), and the players collect the statistics of their searches for them.
+    '''
+    CheckOptions(optionsA)
+    CheckOptions(optionsB)
+    if gameOptions is None:
+        gameOptions = {}
+    playerA, playerB = optionsA, optionsB
+    if records is not None:
+        playerA = dict(optionsA, stats=True)
+        playerB = dict(optionsB, stats=True)
+    rand = random.Random(seed)
+    tasks = [(i, playerA, playerB, rand.getrandbits(32), gameOptions) for i in xrange(games)]
+    results = []
+    recorder = GameRecordWriter(records) if records is not None else None
+    pool = multiprocessing.Pool(processes)
+    try:
+        with open(output, 'w') as f:
+            f.write(json.dumps({'type': 'config', 'games': games, 'A': optionsA, 'B': optionsB, 'seed': seed,
+                                'board': gameOptions}) + '\n')
+            for result in pool.imap_unordered(PlayGame, tasks):
+                record = result.pop('record')
+                if recorder is not None:
+                    recorder(record)
+                results.append(result)
+                f.write(json.dumps(result) + '\n')
+                f.flush()
+            summary = Summarize(results)
+            f.write(json.dumps(summary) + '\n')
+    finally:
+        pool.terminate()
+        pool.join()
+        if recorder is not None:
+            recorder.Close()
+    return summary
+
+
+def PlayerOptions(timeAllowed, iterations, options):
+    '''
+    MctsPlayer keyword arguments from the command line options of a player
+    '''
+    kwargs = json.loads(options) if options else {}
+    if timeAllowed is not None:
+        kwargs['time'] = timeAllowed
+    if iterations is not None:
+        kwargs['iterations'] = iterations
+    if 'time' not in kwargs and 'iterations' not in kwargs:
+        kwargs['time'] = 1
+    CheckOptions(kwargs)
+    return kwargs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Play headless MCTS vs MCTS games and estimate the strength difference.')
+    parser.add_argument('--games', type=int, default=100,
+                        help = 'Number of games, the players alternate moving first (default=%(default)s)')
+    parser.add_argument('--processes', type=int,
+                        help = 'Number of games played in parallel (default: number of CPUs)')
+    parser.add_argument('--atime', type=float,
+                        help = 'Time allowed per move in seconds for player A (default=1 unless --aiterations is given)')
+    parser.add_argument('--aiterations', type=int,
+                        help = 'Number of simulations per move for player A')
+    parser.add_argument('--aoptions',
+                        help = 'Other MctsPlayer options for player A, as JSON, e.g. \'{"rollout": "batch"}\'')
+    parser.add_argument('--btime', type=float,
+                        help = 'Time allowed per move in seconds for player B (default=1 unless --biterations is given)')
+    parser.add_argument('--biterations', type=int,
+                        help = 'Number of simulations per move for player B')
+    parser.add_argument('--boptions',
+                        help = 'Other MctsPlayer options for player B, as JSON')
+    parser.add_argument('--rows', type=int, default=6,
+                        help = 'Number of rows of the board (default=%(default)s)')
+    parser.add_argument('--columns', type=int, default=7,
+                        help = 'Number of columns of the board (default=%(default)s)')
+    parser.add_argument('--connect', type=int, default=4,
+                        help = 'Number of pieces in a row to win (default=%(default)s)')
+    parser.add_argument('--output', default='Tournament.jsonl',
+                        help = 'JSON lines result file (default=%(default)s)')
+    parser.add_argument('--records',
+                        help = 'File the game records are appended to, as JSON lines (see GameRecord.py)')
+    parser.add_argument('--seed', type=int,
+                        help = 'Random seed')
+    args = parser.parse_args()
+    ConfigureLogging()
+
+    optionsA = PlayerOptions(args.atime, args.aiterations, args.aoptions)
+    optionsB = PlayerOptions(args.btime, args.biterations, args.boptions)
+    gameOptions = {'rows': args.rows, 'columns': args.columns, 'n': args.connect}
+    summary = RunTournament(args.games, optionsA, optionsB, args.output, args.processes, args.seed, gameOptions,
+                            args.records)
+    print 'A: {}'.format(optionsA)
+    print 'B: {}'.format(optionsB)
+    print 'Games: {games}, A wins: {winsA}, B wins: {winsB}, draws: {draws}'.format(**summary)
+    if summary['games'] > 0:
+        print 'Score A: {:.3f} [{:.3f}, {:.3f}], Elo A-B: {:+.0f} [{:+.0f}, {:+.0f}]'.format(
+            summary['scoreA'], summary['scoreA_ci'][0], summary['scoreA_ci'][1],
+            summary['eloA'], summary['eloA_ci'][0], summary['eloA_ci'][1])
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+import unittest
+import random
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from Connect4 import Connect4
+from BatchEval import BatchEval, Pack, PackGames
+
+@unittest.skipIf(numpy is None, 'BatchEval requires numpy')
+class Test_BatchEval(unittest.TestCase):
+    def RandomGames(self, count, seed, rows=6, columns=7, n=4):
+        '''
+        Positions of random games, every ply of each game, up to the end of the game
+        '''
+        rand = random.Random(seed)
+        games = []
+        for _ in xrange(count):
+            game = Connect4(None, None, rows=rows, columns=columns, n=n)
+            games.append(game.Copy())
+            while game.GetWinner() is None and game.HasSpaceToMove():
+                game.Move(game.GetCurrentPlayer(), rand.choice(game.GetValidMoves()))
+                games.append(game.Copy())
+        return games
+    def CheckGames(self, games):
+        game = games[0]
+        boards, players = PackGames(games)
+        # small blocks, so that Evaluate goes through several
+        evaluator = BatchEval(game.RowSize(), game.ColumnSize(), game.GetNConscecutivesToWin(), blockSize=100)
+        self.assertEqual(list(players), list(evaluator.Players(boards)))
+        winners, valid, nextKeys, threats = evaluator.Evaluate(boards)
+        self.assertEqual(winners.tolist(), evaluator.Winners(boards).tolist())
+        self.assertEqual(valid.tolist(), evaluator.ValidMoves(boards).tolist())
+        self.assertEqual(nextKeys.tolist(), evaluator.NextKeys(boards).tolist())
+        self.assertEqual(threats.tolist(), evaluator.Threats(boards).tolist())
+        self.assertEqual([game.GetKey() for game in games], list(evaluator.Keys(boards)))
+        for i, game in enumerate(games):
+            self.assertEqual(game.GetWinner() or 0, winners[i])
+            validMoves = game.GetValidMoves()
+            self.assertEqual(validMoves, list(numpy.flatnonzero(valid[i])))
+            player = game.GetCurrentPlayer()
+            self.assertEqual([game.GetNextKey(player, c) if c in validMoves else 0 for c in xrange(game.ColumnSize())],
+                             list(nextKeys[i]))
+            self.assertEqual([len(game.GetWinningMoves(1)), len(game.GetWinningMoves(2))], list(threats[i]))
+    def test_Evaluate_RandomGames(self):
+        self.CheckGames(self.RandomGames(100, 1))
+    def test_Evaluate_Sizes(self):
+        self.CheckGames(self.RandomGames(30, 2, rows=7, columns=8, n=4))
+        self.CheckGames(self.RandomGames(30, 3, rows=5, columns=6, n=3))
+        self.CheckGames(self.RandomGames(30, 4, rows=8, columns=7, n=5))
+    def test_Threats(self):
+        # player 1 wins in column 0 or 2, player 2 in column 6
+        board = [[1,1,1], [], [], [1], [1], [1], [2,2,2]]
+        game = Connect4(None, None, board, current_player=2)
+        evaluator = BatchEval()
+        self.assertEqual([[2, 1]], evaluator.Threats(Pack([game.masks[1]], [game.masks[2]])).tolist())
+    def test_Players(self):
+        # the player to move defaults to the one of a game started by player 1
+        game = Connect4(None, None, [[1,2], [1], [], [], [], [], []], current_player=1)
+        boards, _ = PackGames([game])
+        self.assertEqual([2], list(BatchEval().Players(boards)))
+        _, _, nextKeys, _ = BatchEval().Evaluate(boards, [1])
+        self.assertEqual(game.GetNextKey(1, 2), nextKeys[0][2])
+    def test_TooLarge(self):
+        self.assertRaises(Exception, BatchEval, 8, 9, 4)
+        # 7x9: 72 bits, the boards can't be packed in uint64
+        game = Connect4(None, None, rows=7, columns=9)
+        for column in (0, 8):
+            for _ in xrange(7):
+                game.Move(game.GetCurrentPlayer(), column)
+        self.assertRaises(ValueError, PackGames, [game])
+        self.assertRaises(ValueError, Pack, [game.masks[1]], [game.masks[2]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/python
+
+import unittest
+import random
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from Connect4 import Connect4
+from BatchRollout import BatchRollout, HasLines
+from MctsPlayer import MctsPlayer
+
+@unittest.skipIf(numpy is None, 'BatchRollout requires numpy')
+class Test_BatchRollout(unittest.TestCase):
+    def setUp(self):
+        # Full columns without any 4 in a line
+        self.A = [1,1,2,2,1,1]
+        self.B = [2,2,1,1,2,2]
+    def test_HasLines(self):
+        rand = random.Random(3)
+        layout = Connect4(None, None).layout
+        masks = [rand.getrandbits(64) & layout.fullMask & rand.getrandbits(64) for _ in xrange(500)]
+        found = HasLines(numpy.array(masks, dtype=numpy.uint64), layout, 4)
+        self.assertEqual([layout.HasLine(m, 4) for m in masks], list(found))
+    def test_Run_Win(self):
+        # Only column 0 can be played, and player 1 wins there
+        board = [[1,1,1], self.A, self.B, self.A, self.B, self.A, self.B]
+        game = Connect4(None, None, board, current_player=1)
+        self.assertEqual((32, 0, 0), BatchRollout(32, seed=1).Run(game))
+    def test_Run_Draw(self):
+        board = [[2,1,2,1,2], self.B, self.A, self.B, self.A, self.B, self.A]
+        game = Connect4(None, None, board, current_player=1)
+        self.assertEqual((0, 0, 32), BatchRollout(32, seed=1).Run(game))
+    def test_Run_MaxDepth(self):
+        game = Connect4(None, None)
+        self.assertEqual((0, 0, 16), BatchRollout(16, seed=1).Run(game, maxDepth=3))
+        wins1, wins2, draws = BatchRollout(1000, seed=1).Run(game)
+        self.assertEqual(1000, wins1 + wins2 + draws)
+        # the first player has the advantage with random moves
+        self.assertTrue(wins1 > wins2)
+    def test_MctsPlayer_BatchRollout(self):
+        # Player 2 wins by playing column 3
+        board = [[1], [1], [1], [2,2,2], [1], [], []]
+        game = Connect4(None, None, board, current_player=2)
+        player = MctsPlayer(2, time=0.5, rollout='batch', batchSize=16)
+        self.assertEqual(3, player.GetMove(game, game.GetValidMoves()))
+        
+if __name__ == '__main__':
+    unittest.main()
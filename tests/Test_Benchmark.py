@@ -0,0 +1,39 @@
+#!/usr/bin/python
+
+import unittest
+import argparse
+import json
+import os
+import tempfile
+from Benchmark import CompareResults, SaveResults, MakeReferencePosition, REFERENCE_POSITIONS
+
+class Test_Benchmark(unittest.TestCase):
+    def test_Compare(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            SaveResults(path, [('Copy', 1000.0, 'ops/s'), ('GetMove', 200.0, 'ms'), ('Gone', 1.0, 'ops/s')],
+                        argparse.Namespace(seed=1))
+            with open(path) as f:
+                baseline = json.load(f)
+        finally:
+            os.remove(path)
+        self.assertEqual({'seed': 1}, baseline['settings'])
+        comparison = CompareResults([('Copy', 850.0, 'ops/s'), ('GetMove', 190.0, 'ms'), ('New', 1.0, 'ops/s')],
+                                    baseline, 0.1)
+        self.assertEqual(2, len(comparison))
+        name, value, base, change, regressed = comparison[0]
+        self.assertEqual(('Copy', 850.0, 1000.0, True), (name, value, base, regressed))
+        self.assertAlmostEqual(-0.15, change)
+        # lower is better for latencies
+        name, value, base, change, regressed = comparison[1]
+        self.assertEqual(('GetMove', False), (name, regressed))
+        self.assertAlmostEqual(0.05, change)
+    def test_ReferencePositions(self):
+        for name, moves in REFERENCE_POSITIONS:
+            game = MakeReferencePosition(moves)
+            self.assertEqual(None, game.GetWinner())
+            self.assertEqual(len(moves), sum(game.heights))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
 #!/usr/bin/python
 
 import unittest
+import logging
+import os
+import random
+import subprocess
+import sys
 from HumanPlayer import HumanPlayer
 from Connect4 import Connect4
 
@@ -290,6 +295,163 @@ class Test_Connect4_GetNextState(unittest.TestCase):
         # Make sure the original game hasn't been changed
         self.assertEqual(board, game.board)
         self.assertEqual(1, game.GetCurrentPlayer())
+
+class Test_Connect4_Bitboard(unittest.TestCase):
+    def test_Board_RoundTrip(self):
+        board = [[1,2,2,1,2,1], [2,1,2,1], [1,2,2,2,1], [2,1,2,1,2,1], [1,1,1], [2,1], [2]]
+        game = Connect4(HumanPlayer(1), HumanPlayer(2), board)
+        self.assertEqual(board, game.board)
+        copiedGame = game.Copy()
+        copiedGame.Move(1, 6)
+        self.assertEqual(board, game.board)
+        self.assertEqual([2,1], copiedGame.GetColumn(6))
+    def test_GetWinner_RandomGames(self):
+        rand = random.Random(42)
+        for _ in xrange(200):
+            game = Connect4(HumanPlayer(1), HumanPlayer(2))
+            while True:
+                self.assertEqual(game.GetWinnerFullScan(), game.GetWinner())
+                self.assertEqual(game._ComputeWinner(), game.GetWinner())
+                validMoves = game.GetValidMoves()
+                if game.GetWinner() is not None or len(validMoves) == 0:
+                    break
+                game.Move(game.GetCurrentPlayer(), rand.choice(validMoves))
+    def test_GetNextKey(self):
+        rand = random.Random(7)
+        game = Connect4(HumanPlayer(1), HumanPlayer(2))
+        keys = set([game.GetKey()])
+        while game.GetWinner() is None and game.HasSpaceToMove():
+            player = game.GetCurrentPlayer()
+            move = rand.choice(game.GetValidMoves())
+            nextKey = game.GetNextKey(player, move)
+            game.Move(player, move)
+            self.assertEqual(nextKey, game.GetKey())
+            self.assertEqual(game.layout.GetKey(game.masks), game.GetKey())
+            self.assertFalse(nextKey in keys)
+            keys.add(nextKey)
+        # Same position reached by a different move order
+        game1 = Connect4(HumanPlayer(1), HumanPlayer(2), [[1], [2], [1], [], [], [], []])
+        game2 = Connect4(HumanPlayer(1), HumanPlayer(2), [[], [2], [1], [], [], [], []])
+        self.assertEqual(game1.GetKey(), game2.GetNextKey(1, 0))
+    def test_GetWinningMoves(self):
+        # player 1 wins in column 0 (vertical) or 2 (row 0), player 2 in column 6
+        board = [[1,1,1], [], [], [1], [1], [1], [2,2,2]]
+        game = Connect4(HumanPlayer(1), HumanPlayer(2), board, current_player=2)
+        self.assertEqual([0, 2], game.GetWinningMoves(1))
+        self.assertEqual([6], game.GetWinningMoves(2))
+        game.Move(2, 0)
+        self.assertEqual([2], game.GetWinningMoves(1))
+
+
+class Test_Connect4_Undo(unittest.TestCase):
+    def State(self, game):
+        return (game.board, game.masks[:], game.heights[:], game.GetKey(), game.GetWinner(),
+                game.GetCurrentPlayer(), game.GetLastMove(), game.moves[:])
+    def test_Undo_RandomGames(self):
+        rand = random.Random(3)
+        for _ in xrange(50):
+            game = Connect4(HumanPlayer(1), HumanPlayer(2))
+            states = []
+            while game.GetWinner() is None and game.HasSpaceToMove():
+                states.append(self.State(game))
+                game.Move(game.GetCurrentPlayer(), rand.choice(game.GetValidMoves()))
+            while states:
+                game.Undo()
+                self.assertEqual(states.pop(), self.State(game))
+            self.assertRaises(Exception, game.Undo)
+    def test_Undo_Count(self):
+        rand = random.Random(4)
+        for _ in xrange(50):
+            game = Connect4(HumanPlayer(1), HumanPlayer(2))
+            states = []
+            while game.GetWinner() is None and game.HasSpaceToMove():
+                states.append(self.State(game))
+                game.Move(game.GetCurrentPlayer(), rand.choice(game.GetValidMoves()))
+            count = rand.randint(1, len(states))
+            game.Undo(count)
+            self.assertEqual(states[-count], self.State(game))
+    def test_Undo_InvalidCount(self):
+        game = Connect4(HumanPlayer(1), HumanPlayer(2))
+        game.Move(1, 3)
+        self.assertRaises(Exception, game.Undo, 0)
+        self.assertRaises(Exception, game.Undo, -1)
+        self.assertEqual([3], game.moves)
+    def test_Undo_Board(self):
+        # the moves of the initial board can't be undone, its winner stays
+        board = [[1,1,1,1], [2,2,2], [], [], [], [], []]
+        game = Connect4(HumanPlayer(1), HumanPlayer(2), board, current_player=2)
+        game.Move(2, 1)
+        self.assertEqual(1, game.Undo())
+        self.assertEqual(1, game.GetWinner())
+        self.assertEqual(board, game.board)
+        self.assertRaises(Exception, game.Undo)
+    def test_Undo_Copy(self):
+        game = Connect4(HumanPlayer(1), HumanPlayer(2))
+        game.Move(1, 3)
+        copiedGame = game.Copy()
+        copiedGame.Move(2, 3)
+        self.assertEqual(3, copiedGame.Undo())
+        self.assertEqual(3, copiedGame.Undo())
+        self.assertEqual([3], game.moves)
+        self.assertEqual([[]] * 7, copiedGame.board)
+
+class Test_Connect4_Logging(unittest.TestCase):
+    def test_Move_NoLogging(self):
+        # Move is on the simulation hot path: it never creates a log record, whatever the level
+        game = Connect4(HumanPlayer(1), HumanPlayer(2))
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('connect4')
+        level = logger.level
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        try:
+            game.Move(1, 3)
+            game.Move(2, 3)
+            game.Undo()
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        self.assertEqual([], records)
+
+class Test_Connect4_Keys(unittest.TestCase):
+    def test_Keys_HashRandomization(self):
+        # the Zobrist keys, stored in the opening books and node files, don't depend on the hash seed
+        script = 'from Bitboard import GetLayout; print GetLayout(6, 7).checksum'
+        checksums = set()
+        for seed in ('0', '1', '2'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            checksums.add(int(subprocess.check_output([sys.executable, '-R', '-c', script], env=env)))
+        self.assertEqual(set([Connect4(HumanPlayer(1), HumanPlayer(2)).layout.checksum]), checksums)
+
+class Test_Connect4_Sizes(unittest.TestCase):
+    def test_Size(self):
+        game = Connect4(HumanPlayer(1), HumanPlayer(2), rows=7, columns=8, n=5)
+        self.assertEqual((7, 8, 5), (game.RowSize(), game.ColumnSize(), game.GetNConscecutivesToWin()))
+        self.assertEqual(range(8), game.GetValidMoves())
+        copiedGame = game.Copy()
+        self.assertEqual((7, 8, 5), (copiedGame.RowSize(), copiedGame.ColumnSize(), copiedGame.GetNConscecutivesToWin()))
+        self.assertRaises(Exception, Connect4, HumanPlayer(1), HumanPlayer(2), [[]] * 7, rows=7, columns=8)
+        self.assertRaises(Exception, Connect4, HumanPlayer(1), HumanPlayer(2), [[1] * 8] + [[]] * 7, rows=7, columns=8)
+    def test_ConnectN(self):
+        game = Connect4(HumanPlayer(1), HumanPlayer(2), [[1], [1], [1], [1], [], [], [], []], rows=7, columns=8, n=5)
+        self.assertEqual(None, game.GetWinner())
+        self.assertEqual(None, game.GetWinnerInLine([1, 1, 1, 1, ' ']))
+        game.Move(1, 4)
+        self.assertEqual(1, game.GetWinner())
+        self.assertEqual(1, game.GetWinnerInLine(game.GetRow(0)))
+    def test_GetWinner_RandomGames(self):
+        rand = random.Random(42)
+        for rows, columns, n in [(7, 8, 4), (8, 9, 5), (4, 5, 3), (11, 12, 4)]:
+            for _ in xrange(50):
+                game = Connect4(HumanPlayer(1), HumanPlayer(2), rows=rows, columns=columns, n=n)
+                while True:
+                    self.assertEqual(game.GetWinnerFullScan(), game.GetWinner())
+                    validMoves = game.GetValidMoves()
+                    if game.GetWinner() is not None or len(validMoves) == 0:
+                        break
+                    game.Move(game.GetCurrentPlayer(), rand.choice(validMoves))
             
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+
+import unittest
+import multiprocessing
+import os
+import random
+import tempfile
+from Connect4 import Connect4, MakePlayer
+from MctsPlayer import MctsPlayer
+from GameRecord import GameRecordWriter, ReadGameRecords, Replay
+
+def WriteRecords(path, writer, count):
+    recorder = GameRecordWriter(path, bufferSize=7)
+    for i in xrange(count):
+        # long enough records, so that a write is not trivially atomic
+        recorder({'writer': writer, 'index': i, 'moves': range(400)})
+    recorder.Close()
+
+class Test_GameRecord(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        os.remove(self.path)
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+    def test_Play(self):
+        random.seed(2)
+        records = []
+        game = Connect4(MctsPlayer(1, iterations=20, stats=True, verbose=False),
+                        MctsPlayer(2, iterations=20, verbose=False))
+        winner = game.Play(verbose=False, recorder=records.append)
+        self.assertEqual(1, len(records))
+        record = records[0]
+        self.assertEqual(winner, record['winner'])
+        self.assertEqual(game.moves, record['moves'])
+        self.assertEqual({'rows': 6, 'columns': 7, 'n': 4}, record['board'])
+        self.assertEqual(len(game.moves), len(record['moveTimes']))
+        # only player 1 collects statistics, the solver's share of the budget is taken from the search
+        self.assertTrue(0 < record['moveStats'][0]['simulations'] <= 20)
+        self.assertEqual(None, record['moveStats'][1])
+        self.assertEqual(game.board, Replay(record).board)
+    def test_MakePlayer_Record(self):
+        # the command line players collect their search statistics when the game is recorded
+        self.assertTrue(MakePlayer('m', None, 1, iterations=10, record=True).collectStats)
+        self.assertFalse(MakePlayer('m', None, 1, iterations=10).collectStats)
+    def test_Replay_Board(self):
+        board = [[1,2], [1], [2], [], [], [], []]
+        game = Connect4(MctsPlayer(1, iterations=20, verbose=False), MctsPlayer(2, iterations=20, verbose=False),
+                        board, current_player=2)
+        records = []
+        game.Play(verbose=False, recorder=records.append)
+        self.assertEqual(board, records[0]['start'])
+        self.assertEqual(2, records[0]['first'])
+        replayed = Replay(records[0])
+        self.assertEqual(game.board, replayed.board)
+        self.assertEqual(game.GetWinner(), replayed.GetWinner())
+    def test_Writer_Buffer(self):
+        recorder = GameRecordWriter(self.path, bufferSize=3)
+        recorder({'index': 0})
+        recorder({'index': 1})
+        self.assertFalse(os.path.exists(self.path))
+        recorder({'index': 2})
+        recorder({'index': 3})
+        self.assertEqual([0, 1, 2], [record['index'] for record in ReadGameRecords(self.path)])
+        recorder.Close()
+        with GameRecordWriter(self.path) as recorder:
+            recorder({'index': 4})
+        self.assertEqual(range(5), [record['index'] for record in ReadGameRecords(self.path)])
+    def test_Writer_Processes(self):
+        processes = [multiprocessing.Process(target=WriteRecords, args=(self.path, writer, 100))
+                     for writer in xrange(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        records = list(ReadGameRecords(self.path))
+        self.assertEqual(400, len(records))
+        for writer in xrange(4):
+            self.assertEqual(range(100), [r['index'] for r in records if r['writer'] == writer])
+    def test_Read_PartialLine(self):
+        with open(self.path, 'w') as f:
+            f.write('{"index": 0}\n\n{"index": 1}\n{"ind')
+        self.assertEqual([0, 1], [record['index'] for record in ReadGameRecords(self.path)])
+
+if __name__ == '__main__':
+    unittest.main()
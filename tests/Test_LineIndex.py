@@ -0,0 +1,59 @@
+#!/usr/bin/python
+
+import unittest
+import random
+from LineIndex import LineIndex, GetLineIndex
+from Connect4 import Connect4
+from Bitboard import GetLayout
+
+class Test_LineIndex(unittest.TestCase):
+    def test_Lines(self):
+        lines = LineIndex(6, 7, 4)
+        self.assertEqual([(0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (0, 5), (0, 6)], lines.rows[0])
+        self.assertEqual([(5, 0)], lines.diags[-5])
+        self.assertEqual([(0, 2), (1, 3), (2, 4), (3, 5), (4, 6)], lines.diags[2])
+        self.assertEqual([(0, 0)], lines.antiDiags[-5])
+        self.assertEqual([(5, 1), (4, 2), (3, 3), (2, 4), (1, 5), (0, 6)], lines.antiDiags[1])
+        self.assertEqual([(5, 6)], lines.antiDiags[6])
+    def test_Segments(self):
+        lines = LineIndex(6, 7, 4)
+        # 24 horizontal, 21 vertical and 12 in each diagonal direction
+        self.assertEqual(69, len(lines.segments))
+        self.assertEqual(3, len(lines.cellSegments[(0, 0)]))
+        self.assertEqual(13, len(lines.cellSegments[(2, 3)]))
+        self.assertEqual(69 * 4, sum(len(s) for s in lines.cellSegments.values()))
+        for i, segment in enumerate(lines.segments):
+            for cell in segment:
+                self.assertTrue(i in lines.cellSegments[cell])
+    def test_OtherSizes(self):
+        lines = LineIndex(5, 8, 3)
+        self.assertEqual(8 * 3 + 5 * 6 + 2 * 18, len(lines.segments))
+        self.assertEqual([(4, 0), (3, 1), (2, 2), (1, 3), (0, 4)], lines.antiDiags[0])
+        self.assertEqual(sorted(lines.diags), range(-4, 8))
+    def test_Threats(self):
+        lines = LineIndex(6, 7, 4)
+        layout = GetLayout(6, 7)
+        # the classic weights of the standard board, by row from the bottom
+        self.assertEqual([3, 4, 5, 7, 5, 4, 3], [lines.cellWeights[layout.Index(0, c)] for c in xrange(7)])
+        self.assertEqual([5, 8, 11, 13, 11, 8, 5], [lines.cellWeights[layout.Index(2, c)] for c in xrange(7)])
+        # padding bits
+        self.assertEqual(0, lines.cellWeights[layout.Index(6, 0)])
+        # a move wins exactly when the player owns the rest of a segment through the cell
+        rand = random.Random(9)
+        for _ in xrange(100):
+            game = Connect4(None, None)
+            while game.GetWinner() is None and game.GetValidMoves():
+                player = game.GetCurrentPlayer()
+                for c in game.GetValidMoves():
+                    mine = game.masks[player]
+                    threat = any(mine & mask == mask for mask in lines.threatMasks[layout.Index(game.heights[c], c)])
+                    nextGame = game.Copy()
+                    nextGame.Move(player, c)
+                    self.assertEqual(nextGame.GetWinner() == player, threat)
+                game.Move(player, rand.choice(game.GetValidMoves()))
+    def test_Cache(self):
+        self.assertTrue(GetLineIndex(6, 7, 4) is GetLineIndex(6, 7, 4))
+        self.assertFalse(GetLineIndex(6, 7, 4) is GetLineIndex(6, 7, 5))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,19 @@
 
 import unittest
 import copy
+import os
+import random
+import tempfile
+import json
+import logging
+import time
+import StringIO
+from math import ceil
+import BatchRollout
 from MctsPlayer import MctsPlayer
+from SearchStats import JsonLineWriter, PHASES
+from Connect4 import Connect4
+from NodeTable import WIN, LOSE
 
 class Test_Mcts_Player_kwArgs(unittest.TestCase):
     def test_kwArgs_default(self):
@@ -11,6 +23,92 @@ class Test_Mcts_Player_kwArgs(unittest.TestCase):
         p = MctsPlayer(1, time=60, depth=2000)
         self.assertEqual(60, p.simTime)
         self.assertEqual(2000, p.simDepth)
+        self.assertEqual(1, p.workers)
+        p = MctsPlayer(1, iterations=100)
+        self.assertEqual(None, p.simTime)
+        self.assertEqual(100, p.simIterations)
+        self.assertRaises(Exception, MctsPlayer, 1, time=None)
+
+class Test_Mcts_Player_Heuristic(unittest.TestCase):
+    def test_Win(self):
+        # Player 2 wins in column 3, and must block player 1 in column 0 otherwise
+        board = [[1,1,1], [2], [1], [2,2,2], [1], [], []]
+        game = Connect4(None, None, board, current_player=2)
+        player = MctsPlayer(2, rollout='heuristic')
+        for _ in xrange(20):
+            self.assertEqual(3, player._HeuristicMove(game, game.GetValidMoves(), 2))
+    def test_Block(self):
+        board = [[1,1,1], [2], [1], [2,2], [1], [], []]
+        game = Connect4(None, None, board, current_player=2)
+        player = MctsPlayer(2, rollout='heuristic')
+        for _ in xrange(20):
+            self.assertEqual(0, player._HeuristicMove(game, game.GetValidMoves(), 2))
+    def test_Weights(self):
+        # from the empty board, the center column is played 7/3 times as often as the side ones
+        random.seed(3)
+        game = Connect4(None, None)
+        player = MctsPlayer(1, rollout='heuristic')
+        counts = [0] * 7
+        for _ in xrange(3000):
+            counts[player._HeuristicMove(game, game.GetValidMoves(), 1)] += 1
+        self.assertTrue(counts[3] > 1.8 * counts[0])
+        self.assertTrue(counts[3] > 1.8 * counts[6])
+        self.assertTrue(counts[3] < 3 * counts[0])
+        self.assertTrue(min(counts) > 0)
+    def test_Search(self):
+        random.seed(4)
+        board = [[1], [1], [], [2,2,2], [], [], [1]]
+        game = Connect4(None, None, board, current_player=1)
+        player = MctsPlayer(1, iterations=300, solve=False, verbose=False, rollout='heuristic', stats=True)
+        self.assertEqual(300, player.Search(game))
+        self.assertEqual(300, sum(player.stats.rolloutLengths.values()))
+        self.assertEqual(3, player.GetMove(game, game.GetValidMoves()))
+        self.assertRaises(Exception, MctsPlayer, 1, rollout='smart')
+
+class Test_Mcts_Player_Sizes(unittest.TestCase):
+    def test_SmallBoard(self):
+        # connect 3 on 3 rows by 4 columns: player 2 must block the bottom row
+        random.seed(3)
+        game = Connect4(None, None, rows=3, columns=4, n=3)
+        game.Move(1, 1)
+        game.Move(2, 0)
+        game.Move(1, 2)
+        p = MctsPlayer(2, iterations=2000, verbose=False, solve=False)
+        self.assertEqual(3, p.GetMove(game, game.GetValidMoves()))
+
+class Test_Mcts_Player_Solver(unittest.TestCase):
+    def test_Endgame(self):
+        # 12 empty cells: solved without searching. Column 3 is player 1's only winning move,
+        # the others lose, a single simulation would not find it
+        board = [[2,1,2], [2,1,2,1], [1,1,1,2,1], [1,2,1,2], [2,1,2,1,2,2], [2,1,2], [2,1,1,2,1]]
+        game = Connect4(None, None, board, current_player=1)
+        player = MctsPlayer(1, iterations=1, verbose=False)
+        self.assertEqual(3, player.GetMove(game, game.GetValidMoves()))
+        self.assertEqual(0, len(player.nodes))
+    def test_Budget(self):
+        # the empty board is not solved within the solver's share of the budget, the search runs
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=50, verbose=False)
+        self.assertEqual(None, player.SolveEndgame(game))
+        self.assertTrue(player.solver.nodeCount <= 50 * 0.1 * 100)
+        player.GetMove(game, game.GetValidMoves())
+        self.assertTrue(len(player.nodes) > 0)
+    def test_TimeBudget(self):
+        # the solver's share comes out of the time budget: the whole move takes the time given
+        game = Connect4(None, None)
+        player = MctsPlayer(1, time=1, solveFraction=0.5, verbose=False)
+        beginTime = time.time()
+        player.GetMove(game, game.GetValidMoves())
+        elapsed = time.time() - beginTime
+        self.assertTrue(player.solver.nodeCount > 0)
+        self.assertTrue(elapsed < 1.2, elapsed)
+        self.assertTrue(player.searchTime < 0.6, player.searchTime)
+    def test_IterationBudget(self):
+        # the solver's positions are counted as simulations (SOLVER_NODES_PER_SIMULATION each)
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=200, solveFraction=0.5, stats=True, verbose=False)
+        player.GetMove(game, game.GetValidMoves())
+        self.assertEqual(200 - int(ceil(player.solver.nodeCount / 100.0)), player.stats.simulations)
 
 class TestGame1(object):
     '''
@@ -24,6 +122,8 @@ class TestGame1(object):
         self.state = 's1'
         self.winning_table = {'s1':None, 's2':1, 's3':2, 's4':1}
         self.state_transitions = {('s1', 'm1'):'s2', ('s1', 'm2'):'s3', ('s1', 'm3'):'s4'}
+        # the states before each move, see Undo
+        self.moves = []
     
     def Copy(self):
         return copy.deepcopy(self)
@@ -42,8 +142,14 @@ class TestGame1(object):
     def Move(self, playerId, move):
         if self.current_player != playerId:
             raise Exception('TestGame1 - invalid move')
+        self.moves.append(self.state)
         self.state = self.state_transitions[(self.state, move)]
         self.current_player = self.GetNextPlayer()
+    
+    def Undo(self, count=1):
+        for _ in xrange(count):
+            self.state = self.moves.pop()
+            self.current_player = self.GetNextPlayer()
         
     def GetNextPlayer(self):
         if self.current_player == 1:
@@ -55,6 +161,12 @@ class TestGame1(object):
         if playerId == self.current_player:
             return self.state_transitions[(self.state, move)]
         raise Exception ('TestGame1 - GetNextState invalid player')
+    
+    def GetNextKey(self, playerId, move):
+        return self.GetNextState(playerId, move)
+    
+    def GetKey(self):
+        return self.state
            
     # static variable to keep moving state
     moveCount = 0
@@ -66,38 +178,399 @@ class TestGame1(object):
         
             
         
+def GetStats(player, name):
+    '''
+    Returns a dictionary from state key to the named statistic ('wins', 'totals', ...) of the player
+    '''
+    return dict((key, getattr(node, name)) for key, node in player.nodes.nodes.items())
+        
 class Test_Mcts_Player_Simulation_1(unittest.TestCase):
     def test_sim1(self):  
         game = TestGame1()
-        player = MctsPlayer(2)
+        player = MctsPlayer(2, prove=False)
         
         copiedGame = copy.deepcopy(game)
         player.Simulate(copiedGame, TestGame1.ControlledMove)
-        self.assertEqual(player.wins, {(2,'s2'):0})
-        self.assertEqual(player.totals, {(2,'s2'):1})
+        self.assertEqual(GetStats(player, 'wins'), {'s2':0})
+        self.assertEqual(GetStats(player, 'totals'), {'s2':1})
         
         copiedGame = copy.deepcopy(game)
         player.Simulate(copiedGame, TestGame1.ControlledMove)
         self.assertEqual(2, TestGame1.moveCount)
-        self.assertEqual(player.wins, {(2,'s2'):0,(2, 's3'):1})
-        self.assertEqual(player.totals, {(2,'s2'):1,(2, 's3'):1})
+        self.assertEqual(GetStats(player, 'wins'), {'s2':0,'s3':1})
+        self.assertEqual(GetStats(player, 'totals'), {'s2':1,'s3':1})
         
         copiedGame = copy.deepcopy(game)
         player.Simulate(copiedGame, TestGame1.ControlledMove)
         self.assertEqual(3, TestGame1.moveCount)
-        self.assertEqual(player.wins, {(2,'s2'):0,(2, 's3'):1,(2, 's4'):0})
-        self.assertEqual(player.totals, {(2,'s2'):1,(2, 's3'):1,(2, 's4'):1})
+        self.assertEqual(GetStats(player, 'wins'), {'s2':0,'s3':1,'s4':0})
+        self.assertEqual(GetStats(player, 'totals'), {'s2':1,'s3':1,'s4':1})
         
         # Now all the child nodes have statistics
         copiedGame = copy.deepcopy(game)
         player.Simulate(copiedGame, TestGame1.ControlledMove)
-        self.assertEqual(player.wins, {(2,'s2'):0,(2, 's3'):2,(2, 's4'):0})
-        self.assertEqual(player.totals, {(2,'s2'):1,(2, 's3'):2,(2, 's4'):1})
+        self.assertEqual(GetStats(player, 'wins'), {'s2':0,'s3':2,'s4':0})
+        self.assertEqual(GetStats(player, 'totals'), {'s2':1,'s3':2,'s4':1})
     def test_GetMove(self):
         game = TestGame1()
-        player = MctsPlayer(2, time=0.5)    # 0.5 second
+        player = MctsPlayer(2, time=0.5, solve=False)    # 0.5 second
         move = player.GetMove(game, game.GetValidMoves())
         self.assertEqual('m2', move)
+
+class Test_Mcts_Player_Simulation_Undo(unittest.TestCase):
+    def test_GameRestored(self):
+        # the simulations play on the game and take their moves back
+        for options in ({}, {'uct': 'graph'}, {'prove': False}):
+            random.seed(2)
+            board = [[1], [1], [1], [2,2,2], [1], [], []]
+            game = Connect4(None, None, board, current_player=2)
+            game.Move(2, 0)
+            copiedGame = game.Copy()
+            player = MctsPlayer(1, iterations=300, solve=False, verbose=False, **options)
+            player.Search(game)
+            for name in ('board', 'masks', 'heights', 'key', 'winner', 'current_player', 'lastMove', 'moves'):
+                self.assertEqual(getattr(copiedGame, name), getattr(game, name))
+
+class Test_Mcts_Player_Budget(unittest.TestCase):
+    def test_Iterations(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=123)
+        self.assertEqual(123, player.Search(game))
+        self.assertEqual(123, sum(player.nodes.Lookup(game.GetNextKey(1, m)).totals for m in game.GetValidMoves()))
+    def test_FractionalTime(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, time=0.2)
+        player.Search(game)
+        self.assertTrue(0.2 <= player.searchTime < 0.5)
+    def test_CanStopEarly(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=1000)
+        for move in game.GetValidMoves():
+            if move == 3:
+                player.nodes.Add(game.GetNextKey(1, move), 900, 0, 100, 1000)
+            else:
+                player.nodes.Add(game.GetNextKey(1, move), 10, 0, 90, 100)
+        # 900/1100 > (10+100)/(100+100)
+        self.assertTrue(player.CanStopEarly(game, 100))
+        # 900/1400 < (10+400)/(100+400)
+        self.assertFalse(player.CanStopEarly(game, 400))
+    def test_CanStopEarly_Proven(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=1000)
+        for move in game.GetValidMoves():
+            player.nodes.Add(game.GetNextKey(1, move), 10, 0, 90, 100)
+        # the best percentage is a proven loss, GetMove won't play it: the other moves need the simulations
+        best = player.nodes.Lookup(game.GetNextKey(1, 3))
+        best.wins, best.loses, best.totals = 900, 100, 1000
+        best.proven = LOSE
+        self.assertFalse(player.CanStopEarly(game, 100))
+        # a proven win is played at once
+        player.nodes.Lookup(game.GetNextKey(1, 0)).proven = WIN
+        self.assertTrue(player.CanStopEarly(game, 100))
+    def test_CanStopEarly_OneLeft(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=1000)
+        for move in game.GetValidMoves():
+            player.nodes.Add(game.GetNextKey(1, move), 10, 0, 90, 100)
+        for move in game.GetValidMoves()[1:]:
+            player.nodes.Lookup(game.GetNextKey(1, move)).proven = LOSE
+        self.assertTrue(player.CanStopEarly(game, 100))
+    def test_EarlyStop(self):
+        # Player 2 wins by playing column 3, the other moves let player 1 win
+        random.seed(1)
+        board = [[1], [1], [1], [2,2,2], [1], [], []]
+        game = Connect4(None, None, board, current_player=2)
+        player = MctsPlayer(2, iterations=3000, earlyStop=True)
+        simulationCount = player.Search(game)
+        self.assertTrue(simulationCount < 3000)
+        self.assertEqual(3, player.GetMove(game, game.GetValidMoves()))
+    def test_Progress(self):
+        calls = []
+        def Progress(player, simulationCount, elapsed, done):
+            calls.append((simulationCount, done))
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=50, progress=Progress, progressInterval=0)
+        player.Search(game)
+        self.assertEqual((0, False), calls[0])
+        self.assertEqual((50, True), calls[-1])
+        self.assertEqual(52, len(calls))
+
+class Test_Mcts_Player_Graph(unittest.TestCase):
+    def test_sim_graph(self):
+        game = TestGame1()
+        player = MctsPlayer(2, uct='graph', prove=False)
+        moves = iter(['m1', 'm2', 'm3'])
+        for _ in xrange(3):
+            player.Simulate(copy.deepcopy(game), lambda validMoves: next(moves))
+        root = player.nodes.Lookup('s1')
+        self.assertEqual(3, root.totals)
+        self.assertEqual({'m1':1, 'm2':1, 'm3':1}, root.edges)
+        # All edges followed: UCT picks the winning move, without calling the random function
+        player.Simulate(copy.deepcopy(game), None)
+        self.assertEqual({'m1':1, 'm2':2, 'm3':1}, root.edges)
+        self.assertEqual({'s1':4, 's2':1, 's3':2, 's4':1}, GetStats(player, 'totals'))
+    def test_EdgeCounts(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=300, uct='graph')
+        player.Search(game)
+        root = player.nodes.Lookup(game.GetKey())
+        self.assertEqual(300, root.totals)
+        self.assertEqual(300, sum(root.edges.values()))
+        for node in player.nodes.nodes.values():
+            if node.edges is not None:
+                self.assertTrue(sum(node.edges.values()) <= node.totals)
+    def test_Reuse(self):
+        # the root's node, and its edge counts, are kept by the tree reuse and never evicted
+        random.seed(4)
+        game = Connect4(None, None)
+        game.Move(1, 3)
+        player = MctsPlayer(2, iterations=200, uct='graph', solve=False, verbose=False, maxNodes=50)
+        player.GetMove(game, game.GetValidMoves())
+        root = player.nodes.Lookup(game.GetKey())
+        self.assertEqual(200, sum(root.edges.values()))
+        player.PruneTree(game)
+        self.assertTrue(player.nodes.Lookup(game.GetKey()) is root)
+        player.GetMove(game, game.GetValidMoves())
+        self.assertEqual(400, sum(root.edges.values()))
+
+class Test_Mcts_Player_Proofs(unittest.TestCase):
+    def test_ProvenWin(self):
+        # Player 2 wins by playing column 3: once the move is simulated, the root is proven
+        for uct in ('tree', 'graph'):
+            random.seed(4)
+            board = [[1], [1], [1], [2,2,2], [1], [], []]
+            game = Connect4(None, None, board, current_player=2)
+            player = MctsPlayer(2, iterations=1000, solve=False, uct=uct)
+            self.assertTrue(player.Search(game) < 100)
+            self.assertTrue(player.rootProven)
+            self.assertEqual(WIN, player.nodes.Lookup(game.GetNextKey(2, 3)).proven)
+            self.assertEqual(0, player.Search(game))
+            self.assertEqual(3, player.GetMove(game, game.GetValidMoves()))
+    def test_ProvenLosses(self):
+        # Player 1 must block column 3, every other move is a proven loss
+        random.seed(5)
+        board = [[1], [1], [], [2,2,2], [], [], [1]]
+        game = Connect4(None, None, board, current_player=1)
+        player = MctsPlayer(1, iterations=1000, solve=False, verbose=False)
+        player.Search(game)
+        for move in game.GetValidMoves():
+            node = player.nodes.Lookup(game.GetNextKey(1, move))
+            self.assertEqual(None if move == 3 else LOSE, node.proven)
+        self.assertFalse(player.rootProven)
+        self.assertEqual(3, player.GetMove(game, game.GetValidMoves()))
+
+class Test_Mcts_Player_TreeReuse(unittest.TestCase):
+    def test_PruneTree(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, time=0.3)
+        move = player.GetMove(game, game.GetValidMoves())
+        game.Move(1, move)
+        # The replies to the move played are kept, with their statistics
+        replies = dict((m, player.nodes.Lookup(game.GetNextKey(2, m))) for m in game.GetValidMoves())
+        self.assertTrue(all(node is not None for node in replies.values()))
+        siblingGame = Connect4(None, None)
+        siblingGame.Move(1, (move + 1) % 7)
+        siblingKey = siblingGame.GetNextKey(2, 0)
+        
+        game.Move(2, 0)
+        player.PruneTree(game)
+        self.assertTrue(0 < len(player.nodes) < sum(node.totals for node in replies.values()))
+        self.assertEqual(None, player.nodes.Lookup(game.GetKey()))
+        self.assertEqual(None, player.nodes.Lookup(siblingKey))
+        # Everything left is under the new root
+        for key in player.nodes.nodes:
+            self.assertTrue(player.nodes.Lookup(key).totals <= replies[0].totals)
+    def test_NoReuse(self):
+        game = TestGame1()
+        player = MctsPlayer(2, time=0.1, reuse=False, solve=False)
+        player.GetMove(game, game.GetValidMoves())
+        self.assertEqual(0, len(player.nodes))
+
+class Test_Mcts_Player_Cache(unittest.TestCase):
+    def test_WarmStart(self):
+        fd, path = tempfile.mkstemp(suffix='.bin')
+        os.close(fd)
+        os.remove(path)
+        try:
+            root = Connect4(None, None)
+            game = root.Copy()
+            player = MctsPlayer(1, iterations=200, solve=False, verbose=False, cache=path)
+            self.assertEqual(0, len(player.nodes))
+            game.Move(1, player.GetMove(game, game.GetValidMoves()))
+            game.Move(2, 0)
+            player.GetMove(game, game.GetValidMoves())
+            # the nodes are kept across moves with a cache
+            self.assertEqual(200, sum(player.nodes.Lookup(root.GetNextKey(1, m)).totals
+                                      for m in root.GetValidMoves()))
+            player.Close()
+            
+            warmPlayer = MctsPlayer(1, iterations=200, solve=False, verbose=False, cache=path)
+            self.assertEqual(len(player.nodes), len(warmPlayer.nodes))
+            self.assertEqual(200, sum(warmPlayer.nodes.Lookup(root.GetNextKey(1, m)).totals
+                                      for m in root.GetValidMoves()))
+            warmPlayer.GetMove(root, root.GetValidMoves())
+            self.assertEqual(400, sum(warmPlayer.nodes.Lookup(root.GetNextKey(1, m)).totals
+                                      for m in root.GetValidMoves()))
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+class Test_Mcts_Player_Stats(unittest.TestCase):
+    def test_Disabled(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=50, solve=False, verbose=False)
+        player.GetMove(game, game.GetValidMoves())
+        self.assertEqual(None, player.stats)
+    def test_Stats(self):
+        # the batch rollouts require numpy
+        rollouts = ('random', 'batch') if BatchRollout.numpy is not None else ('random',)
+        for rollout in rollouts:
+            game = Connect4(None, None)
+            player = MctsPlayer(1, iterations=200, solve=False, verbose=False, stats=True, rollout=rollout)
+            player.GetMove(game, game.GetValidMoves())
+            stats = player.stats
+            self.assertEqual(200, stats.simulations)
+            self.assertEqual(len(player.nodes), stats.nodesCreated)
+            self.assertEqual(200, sum(stats.treeDepths.values()))
+            self.assertEqual(200 if rollout == 'random' else 0, sum(stats.rolloutLengths.values()))
+            self.assertTrue(all(stats.phaseTimes[phase] >= 0 for phase in PHASES))
+            self.assertTrue(stats.phaseTimes['rollout'] > 0)
+            self.assertTrue(sum(stats.phaseTimes.values()) <= stats.searchTime)
+            self.assertTrue(stats.SimulationsPerSecond() > 0)
+            # the first simulations add the root's children
+            self.assertEqual(7, stats.treeDepths[1])
+    def test_JsonLines(self):
+        game = Connect4(None, None)
+        output = StringIO.StringIO()
+        player = MctsPlayer(1, iterations=100, solve=False, verbose=False, stats=JsonLineWriter(output))
+        game.Move(1, player.GetMove(game, game.GetValidMoves()))
+        game.Move(2, 0)
+        player.GetMove(game, game.GetValidMoves())
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(2, len(lines))
+        for values in lines:
+            self.assertEqual(str(player), values['player'])
+            self.assertEqual(100, values['simulations'])
+            self.assertEqual(100, sum(values['treeDepths'].values()))
+            self.assertEqual(set(PHASES), set(values['phaseTimes']))
+    def test_Workers(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=200, solve=False, verbose=False, workers=2, stats=True)
+        try:
+            player.Search(game)
+        finally:
+            player.Close()
+        self.assertEqual(200, player.stats.simulations)
+        self.assertEqual(200, sum(player.stats.treeDepths.values()))
+        self.assertTrue(player.stats.nodesCreated >= 14)
+
+class Test_Mcts_Player_Ponder(unittest.TestCase):
+    def test_Disabled(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(2, iterations=100, verbose=False)
+        player.Ponder(game)
+        self.assertEqual(None, player.ponderThread)
+        self.assertEqual(0, player.StopPondering())
+    def test_Adopted(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(2, iterations=200, solve=False, verbose=False, ponder=True)
+        player.Ponder(game)
+        time.sleep(0.3)
+        game.Move(1, 3)
+        count = player.StopPondering()
+        self.assertTrue(count > 0)
+        self.assertEqual(None, player.ponderThread)
+        # the game the opponent moved in was not touched by the pondering
+        self.assertEqual([3], game.moves)
+        pondered = player.nodes.Lookup(game.GetKey()).totals
+        self.assertTrue(pondered > 0)
+        # the search goes on from the statistics of the pondered subtree (all but the simulation that
+        # added the state went on to its children)
+        player.GetMove(game, game.GetValidMoves())
+        self.assertEqual(200 + pondered - 1, sum(player.nodes.Lookup(game.GetNextKey(2, m)).totals
+                                             for m in game.GetValidMoves()))
+    def test_PonderIterations(self):
+        random.seed(5)
+        game = Connect4(None, None)
+        player = MctsPlayer(2, iterations=100, solve=False, verbose=False, ponder=True, ponderIterations=30)
+        player.Ponder(game)
+        player.ponderThread.join()
+        self.assertEqual(30, player.StopPondering())
+        # 30 simulations may leave a child of the root without a node
+        nodes = [player.nodes.Lookup(game.GetNextKey(1, m)) for m in game.GetValidMoves()]
+        self.assertEqual(30, sum(node.totals if node else 0 for node in nodes))
+    def test_Play(self):
+        random.seed(6)
+        p1 = MctsPlayer(1, iterations=30, verbose=False, ponder=True)
+        p2 = MctsPlayer(2, iterations=30, verbose=False, ponder=True)
+        game = Connect4(p1, p2, rows=4, columns=5)
+        self.assertTrue(game.Play(verbose=False) in (1, 2, None))
+        self.assertEqual(None, p1.ponderThread)
+        self.assertEqual(None, p2.ponderThread)
+
+class RecordsHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+    def emit(self, record):
+        self.records.append(record)
+
+class Test_Mcts_Player_Trace(unittest.TestCase):
+    def setUp(self):
+        self.handler = RecordsHandler()
+        self.logger = logging.getLogger('connect4.trace')
+        self.level = self.logger.level
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+    def test_Trace(self):
+        random.seed(7)
+        game = Connect4(None, None)
+        player = MctsPlayer(1, iterations=20, trace=5, verbose=False, solve=False)
+        player.Search(game)
+        self.assertEqual(4, len(self.handler.records))
+        self.assertEqual([5, 10, 15, 20], [record.args[1] for record in self.handler.records])
+        for record in self.handler.records:
+            moves, winner = record.args[2], record.args[3]
+            self.assertTrue(len(moves) > 0)
+            self.assertTrue(winner in (1, 2, None))
+        # the game is left as it was
+        self.assertEqual([], game.moves)
+    def test_NoTrace(self):
+        player = MctsPlayer(1, iterations=20, verbose=False, solve=False)
+        player.Search(Connect4(None, None))
+        self.assertEqual([], self.handler.records)
+
+class Test_Mcts_Player_Bounded(unittest.TestCase):
+    def test_MaxNodes(self):
+        game = Connect4(None, None)
+        player = MctsPlayer(1, time=0.3, maxNodes=50)
+        player.Search(game)
+        self.assertTrue(len(player.nodes) <= 50)
+        self.assertTrue(player.nodes.evictions > 0)
+        # the root's children are never evicted
+        for move in game.GetValidMoves():
+            self.assertTrue(game.GetNextKey(1, move) in player.nodes)
+
+class Test_Mcts_Player_Parallel(unittest.TestCase):
+    def test_GetMove_Workers(self):
+        # Player 2 wins by playing column 3
+        board = [[1], [1], [1], [2,2,2], [1], [], []]
+        game = Connect4(None, None, board, current_player=2)
+        player = MctsPlayer(2, time=0.5, workers=2)
+        try:
+            simulationCount = player.Search(game)
+            self.assertTrue(simulationCount > 0)
+            # the children statistics of both workers are merged
+            node = player.nodes.Lookup(game.GetNextKey(2, 3))
+            self.assertTrue(node.totals > 0)
+            self.assertEqual(node.totals, node.wins)
+            player.nodes.Clear()
+            self.assertEqual(3, player.GetMove(game, game.GetValidMoves()))
+        finally:
+            player.Close()
         
         
         
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import tempfile
+from Bitboard import GetLayout
+from NodeTable import NodeTable, WIN, DRAW, LOSE, FILE_HEADER
+from MergeNodes import MergeNodes
+
+class Test_NodeTable(unittest.TestCase):
+    def test_LookupExpand(self):
+        table = NodeTable()
+        self.assertEqual(None, table.Lookup(12))
+        node = table.Expand(12)
+        self.assertTrue(node is table.Lookup(12))
+        self.assertTrue(node is table.Expand(12))
+        self.assertEqual(1, len(table))
+        self.assertTrue(12 in table)
+        table.Clear()
+        self.assertEqual(0, len(table))
+    def test_Update(self):
+        table = NodeTable()
+        node = table.Expand(12)
+        table.Update(node, WIN)
+        table.Update(node, WIN)
+        table.Update(node, DRAW)
+        table.Update(node, LOSE)
+        self.assertEqual((2, 1, 1, 4), (node.wins, node.draws, node.loses, node.totals))
+    def test_Counters(self):
+        table = NodeTable()
+        table.Expand(1)
+        table.Lookup(1)
+        table.Lookup(2)
+        table.Lookup(3)
+        self.assertEqual((1, 2), (table.hits, table.misses))
+        self.assertAlmostEqual(1/3.0, table.HitRate())
+
+class Test_NodeTable_Bounded(unittest.TestCase):
+    def test_Evict(self):
+        table = NodeTable(maxNodes=10, evictFraction=0.5)
+        for key in xrange(11):
+            node = table.Expand(key)
+            for _ in xrange(key):
+                table.Update(node, WIN)
+        # 0 is the least visited node, but it is pinned
+        table.Pin([0])
+        self.assertTrue(table.IsFull())
+        self.assertEqual(6, table.Evict())
+        self.assertEqual(6, table.evictions)
+        self.assertEqual(set([0, 7, 8, 9, 10]), set(table.nodes))
+        self.assertFalse(table.IsFull())
+        self.assertEqual(0, table.Evict())
+    def test_Unbounded(self):
+        table = NodeTable()
+        for key in xrange(100):
+            table.Expand(key)
+        self.assertFalse(table.IsFull())
+        self.assertEqual(0, table.Evict())
+
+class Test_NodeTable_File(unittest.TestCase):
+    def setUp(self):
+        self.paths = []
+        for _ in xrange(3):
+            fd, path = tempfile.mkstemp(suffix='.bin')
+            os.close(fd)
+            self.paths.append(path)
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+    def MakeTable(self, keys):
+        table = NodeTable()
+        table.layout = GetLayout(6, 7)
+        for key in keys:
+            table.Add(key, key % 5, key % 3, 1, key % 5 + key % 3 + 1)
+        return table
+    def test_SaveLoad(self):
+        keys = [(1 << 62) + 12345, 7, 0xffffffff, 1 << 32]
+        table = self.MakeTable(keys)
+        table.Lookup(7).proven = LOSE
+        table.Lookup(1 << 32).proven = WIN
+        self.assertEqual(4, table.Save(self.paths[0]))
+        loaded = NodeTable()
+        loaded.Expand(99)
+        self.assertEqual(4, loaded.Load(self.paths[0]))
+        self.assertEqual(set(keys), set(loaded.nodes))
+        for key in keys:
+            self.assertEqual(repr(table.Lookup(key)), repr(loaded.Lookup(key)))
+    def test_Prune(self):
+        table = self.MakeTable(xrange(100))
+        self.assertEqual(10, table.Save(self.paths[0], maxNodes=10))
+        loaded = NodeTable()
+        loaded.Load(self.paths[0])
+        self.assertEqual(10, len(loaded))
+        self.assertEqual(sorted(node.totals for node in table.nodes.itervalues())[-10:],
+                         sorted(node.totals for node in loaded.nodes.itervalues()))
+        self.assertEqual(len([key for key in xrange(100) if key % 5 + key % 3 >= 5]),
+                         table.Save(self.paths[0], minTotals=6))
+    def test_Merge(self):
+        base = self.MakeTable([1, 2])
+        base.Save(self.paths[0])
+        # two players started from base, each simulated more
+        for path, extra in zip(self.paths[1:], [(2, 3), (3, 4)]):
+            table = self.MakeTable([1, 2])
+            for key in extra:
+                node = table.Expand(key)
+                table.Update(node, WIN)
+            table.Update(table.Lookup(2), DRAW)
+            table.Save(path)
+        self.assertEqual(4, MergeNodes(self.paths[0], self.paths[1:], base=self.paths[0]))
+        merged = NodeTable()
+        merged.Load(self.paths[0])
+        self.assertEqual(set([1, 2, 3, 4]), set(merged.nodes))
+        self.assertEqual((1, 1, 1, 3), self._Counts(merged.Lookup(1)))
+        # base (2, 2, 1), plus a win and a draw from the first player, a draw from the second
+        self.assertEqual((3, 4, 1, 8), self._Counts(merged.Lookup(2)))
+        self.assertEqual((2, 0, 0, 2), self._Counts(merged.Lookup(3)))
+        self.assertEqual((1, 0, 0, 1), self._Counts(merged.Lookup(4)))
+    def _Counts(self, node):
+        return node.wins, node.draws, node.loses, node.totals
+    def test_NotANodeFile(self):
+        with open(self.paths[0], 'wb') as f:
+            f.write('x' * 64)
+        self.assertRaises(Exception, NodeTable().Load, self.paths[0])
+    def test_Layout(self):
+        self.assertRaises(Exception, NodeTable().Save, self.paths[0])
+        self.MakeTable([1, 2]).Save(self.paths[0])
+        loaded = NodeTable()
+        loaded.Load(self.paths[0])
+        self.assertTrue(loaded.layout is GetLayout(6, 7))
+        # the statistics of another board size are not mixed in
+        other = NodeTable()
+        other.layout = GetLayout(7, 8)
+        self.assertRaises(Exception, other.Merge, self.paths[0])
+    def test_OtherKeys(self):
+        self.MakeTable([1, 2]).Save(self.paths[0])
+        # a file written with other Zobrist keys: same size, another checksum
+        with open(self.paths[0], 'r+b') as f:
+            header = list(FILE_HEADER.unpack(f.read(FILE_HEADER.size)))
+            header[-1] ^= 1
+            f.seek(0)
+            f.write(FILE_HEADER.pack(*header))
+        self.assertRaises(Exception, NodeTable().Load, self.paths[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import tempfile
+from Connect4 import Connect4
+from MctsPlayer import MctsPlayer
+from OpeningBook import OpeningBook, WriteBook, HEADER
+from BuildBook import BuildBook, EnumeratePositions, SearchPosition
+
+class Test_OpeningBook(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.bin')
+        os.close(fd)
+    def tearDown(self):
+        os.remove(self.path)
+    def test_Lookup(self):
+        entries = [(key * 7919, key % 7, key, 1, 2 * key) for key in xrange(1, 500)]
+        WriteBook(self.path, reversed(entries), 6, 7, 4)
+        book = OpeningBook(self.path)
+        self.assertEqual(499, len(book))
+        self.assertEqual((6, 7, 4), book.size)
+        for key, move, wins, draws, totals in entries:
+            self.assertEqual((move, wins, draws, totals), book.Lookup(key))
+        self.assertEqual(None, book.Lookup(0))
+        self.assertEqual(None, book.Lookup(7920))
+        self.assertEqual(None, book.Lookup(2 ** 63))
+        book.Close()
+    def test_Empty(self):
+        WriteBook(self.path, [], 6, 7, 4)
+        book = OpeningBook(self.path)
+        self.assertEqual(0, len(book))
+        self.assertEqual(None, book.Lookup(1))
+        book.Close()
+    def test_OtherKeys(self):
+        WriteBook(self.path, [(1, 3, 0, 0, 0)], 6, 7, 4)
+        # a book written with other Zobrist keys: same size, another checksum
+        with open(self.path, 'r+b') as f:
+            header = list(HEADER.unpack(f.read(HEADER.size)))
+            header[-1] ^= 1
+            f.seek(0)
+            f.write(HEADER.pack(*header))
+        self.assertRaises(Exception, OpeningBook, self.path)
+    def test_GetMove(self):
+        game = Connect4(None, None)
+        WriteBook(self.path, [(game.GetKey(), 2, 0, 0, 0)], 6, 7, 4)
+        book = OpeningBook(self.path)
+        self.assertEqual(2, book.GetMove(game))
+        game.Move(1, 2)
+        self.assertEqual(None, book.GetMove(game))
+        # another board size
+        self.assertEqual(None, book.GetMove(Connect4(None, None, rows=7, columns=8)))
+        book.Close()
+    def test_MctsPlayer(self):
+        game = Connect4(None, None)
+        WriteBook(self.path, [(game.GetKey(), 2, 0, 0, 0)], 6, 7, 4)
+        player = MctsPlayer(1, iterations=100, book=self.path, verbose=False)
+        self.assertEqual(2, player.GetMove(game, game.GetValidMoves()))
+        self.assertEqual(0, len(player.nodes))
+        game.Move(1, 2)
+        game.Move(2, 3)
+        player.GetMove(game, game.GetValidMoves())
+        self.assertTrue(len(player.nodes) > 0)
+        player.Close()
+    def test_BuildBook(self):
+        self.assertEqual(1 + 4 + 16, len(EnumeratePositions(2, 4, 4, 3)))
+        self.assertEqual(8, BuildBook(self.path, 1, {'iterations': 20}, processes=1, seed=1))
+        book = OpeningBook(self.path)
+        for game in EnumeratePositions(1):
+            self.assertTrue(game.IsValidMove(book.GetMove(game)))
+        book.Close()
+    def test_SearchPosition_Verbose(self):
+        # the positions are searched quietly, whatever the options say
+        game = Connect4(None, None)
+        key, move, wins, draws, totals = SearchPosition((game, {'iterations': 20, 'verbose': True}, 1))
+        self.assertEqual(game.GetKey(), key)
+        self.assertTrue(game.IsValidMove(move))
+
+if __name__ == '__main__':
+    unittest.main()
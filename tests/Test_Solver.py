@@ -0,0 +1,91 @@
+#!/usr/bin/python
+
+import unittest
+import random
+from Connect4 import Connect4
+from Solver import Solver
+
+def Minimax(game, memo):
+    '''
+    Plain minimax with the scores of Solver, as the reference on small boards
+    '''
+    key = (game.masks[1], game.masks[2])
+    if key not in memo:
+        empty = game.RowSize() * game.ColumnSize() - sum(game.heights)
+        best = None
+        for move in game.GetValidMoves():
+            nextGame = game.Copy()
+            nextGame.Move(nextGame.GetCurrentPlayer(), move)
+            if nextGame.GetWinner() is not None:
+                score = empty
+            elif empty == 1:
+                score = 0
+            else:
+                score = -Minimax(nextGame, memo)
+            best = score if best is None else max(best, score)
+        memo[key] = best
+    return memo[key]
+
+class Test_Solver(unittest.TestCase):
+    def test_ImmediateWin(self):
+        game = Connect4(None, None, [[1], [1], [1], [2,2,2], [1], [], []], current_player=2)
+        self.assertEqual((35, 3), Solver().Solve(game))
+    def test_Block(self):
+        # player 1 must block column 3, then player 2 wins with the double threat on the bottom row
+        game = Connect4(None, None, [[], [], [2], [2,2,2], [1], [1], [1]], current_player=1)
+        score, move = Solver().Solve(game)
+        self.assertEqual(3, move)
+        self.assertTrue(score < 0)
+    def test_GameOver(self):
+        game = Connect4(None, None, [[1,1,1,1], [2,2,2], [], [], [], [], []], current_player=2)
+        self.assertEqual(None, Solver().Solve(game))
+    def test_Budget(self):
+        solver = Solver()
+        self.assertEqual(None, solver.Solve(Connect4(None, None), maxNodes=5000))
+        self.assertTrue(solver.nodeCount <= 6000)
+    def test_SmallBoards(self):
+        # same scores as minimax, and the moves achieve them. The table is kept between positions
+        rand = random.Random(2)
+        for rows, columns, n in [(4, 4, 3), (3, 5, 3), (3, 4, 3)]:
+            solver = Solver()
+            memo = {}
+            for _ in xrange(60):
+                game = Connect4(None, None, rows=rows, columns=columns, n=n)
+                for _ in xrange(rand.randint(0, 10)):
+                    if game.GetWinner() is not None or not game.HasSpaceToMove():
+                        break
+                    game.Move(game.GetCurrentPlayer(), rand.choice(game.GetValidMoves()))
+                if game.GetWinner() is not None or not game.HasSpaceToMove():
+                    continue
+                score, move = solver.Solve(game)
+                self.assertEqual(Minimax(game, memo), score)
+                nextGame = game.Copy()
+                nextGame.Move(nextGame.GetCurrentPlayer(), move)
+                empty = rows * columns - sum(game.heights)
+                if nextGame.GetWinner() is not None:
+                    self.assertEqual(empty, score)
+                elif empty > 1:
+                    self.assertEqual(score, -Minimax(nextGame, memo))
+    def test_MaxEntries(self):
+        # the table is cleared as it fills up, during a search as well: same scores, bounded memory
+        rand = random.Random(3)
+        solver = Solver(maxEntries=50)
+        memo = {}
+        maxNodeCount = 0
+        for _ in xrange(30):
+            game = Connect4(None, None, rows=4, columns=4, n=3)
+            for _ in xrange(rand.randint(0, 4)):
+                if game.GetWinner() is not None:
+                    break
+                game.Move(game.GetCurrentPlayer(), rand.choice(game.GetValidMoves()))
+            if game.GetWinner() is not None:
+                continue
+            score, move = solver.Solve(game)
+            self.assertEqual(Minimax(game, memo), score)
+            self.assertTrue(len(solver.table) <= 50)
+            maxNodeCount = max(maxNodeCount, solver.nodeCount)
+        # the searches did overflow the table
+        self.assertTrue(maxNodeCount > 50)
+
+if __name__ == '__main__':
+    unittest.main()
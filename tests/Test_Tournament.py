@@ -0,0 +1,97 @@
+#!/usr/bin/python
+
+import unittest
+import json
+import os
+import tempfile
+from Tournament import Summarize, EloFromScore, PlayGame, RunTournament, PlayerOptions
+from GameRecord import ReadGameRecords
+
+class Test_Tournament_Summary(unittest.TestCase):
+    def test_EloFromScore(self):
+        self.assertAlmostEqual(0, EloFromScore(0.5))
+        self.assertAlmostEqual(-EloFromScore(0.25), EloFromScore(0.75))
+        self.assertAlmostEqual(400 * 0.47712125, EloFromScore(0.75), places=3)
+        # a perfect score gives a finite estimate
+        self.assertTrue(EloFromScore(1) < 1500)
+    def test_Summarize(self):
+        records = [{'winner': 'A'}] * 6 + [{'winner': 'B'}] * 2 + [{'winner': None}] * 2
+        summary = Summarize(records)
+        self.assertEqual((10, 6, 2, 2), (summary['games'], summary['winsA'], summary['winsB'], summary['draws']))
+        self.assertAlmostEqual(0.7, summary['scoreA'])
+        self.assertAlmostEqual(0.6, summary['winRateA'])
+        low, high = summary['scoreA_ci']
+        self.assertTrue(low < 0.7 < high)
+        low, high = summary['eloA_ci']
+        self.assertTrue(low < summary['eloA'] < high)
+    def test_Summarize_AllWins(self):
+        summary = Summarize([{'winner': 'A'}] * 10)
+        low, high = summary['scoreA_ci']
+        self.assertTrue(0.6 < low < 1)
+        self.assertEqual(1, high)
+    def test_Summarize_Empty(self):
+        self.assertEqual(0, Summarize([])['games'])
+
+class Test_Tournament_Games(unittest.TestCase):
+    def test_PlayGame(self):
+        record = PlayGame((1, {'iterations': 20}, {'iterations': 20}, 5, {}))
+        self.assertEqual('B', record['first'])
+        self.assertTrue(record['winner'] in ('A', 'B', None))
+        self.assertTrue(7 <= record['moves'] <= 42)
+        record = PlayGame((0, {'iterations': 20}, {'iterations': 20}, 5, {'rows': 4, 'columns': 5, 'n': 3}))
+        self.assertTrue(5 <= record['moves'] <= 20)
+        # the games are headless, whatever the options say
+        record = PlayGame((0, {'iterations': 20, 'verbose': True}, {'iterations': 20}, 5, {}))
+        self.assertTrue(7 <= record['moves'] <= 42)
+    def test_RunTournament(self):
+        fd, output = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        try:
+            summary = RunTournament(2, {'iterations': 10}, {'iterations': 10}, output, processes=1, seed=3)
+            with open(output) as f:
+                lines = [json.loads(line) for line in f]
+        finally:
+            os.remove(output)
+        self.assertEqual(['config', 'game', 'game', 'summary'], [line['type'] for line in lines])
+        self.assertEqual(summary, lines[-1])
+        self.assertEqual(2, summary['games'])
+    def test_Workers(self):
+        # the games run in pool processes, which can't start the processes of a parallel player
+        self.assertRaises(Exception, PlayerOptions, None, 10, '{"workers": 2}')
+        self.assertEqual({'iterations': 10, 'workers': 1}, PlayerOptions(None, 10, '{"workers": 1}'))
+        self.assertRaises(Exception, RunTournament, 2, {'iterations': 10, 'workers': 2}, {'iterations': 10},
+                          os.devnull, processes=1)
+    def test_Ponder(self):
+        # both players of a game share a process, pondering would only slow the opponent down
+        self.assertRaises(Exception, PlayerOptions, None, 10, '{"ponder": true}')
+        self.assertRaises(Exception, RunTournament, 2, {'iterations': 10}, {'iterations': 10, 'ponder': True},
+                          os.devnull, processes=1)
+    def test_RunTournament_Records(self):
+        fd, output = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        records = output + '.records'
+        try:
+            RunTournament(2, {'iterations': 10}, {'iterations': 10}, output, processes=1, seed=3, records=records)
+            with open(output) as f:
+                lines = [json.loads(line) for line in f]
+            gameRecords = list(ReadGameRecords(records))
+        finally:
+            os.remove(output)
+            if os.path.exists(records):
+                os.remove(records)
+        self.assertEqual(2, len(gameRecords))
+        self.assertEqual(sorted([['A', 'B'], ['B', 'A']]), sorted(record['labels'] for record in gameRecords))
+        results = [line for line in lines if line['type'] == 'game']
+        self.assertEqual(sorted(len(record['moves']) for record in gameRecords),
+                         sorted(result['moves'] for result in results))
+        self.assertFalse('record' in results[0])
+        # the players collect the statistics of their searches for the records
+        for record in gameRecords:
+            searched = [stats for stats in record['moveStats'] if stats is not None]
+            self.assertTrue(len(searched) > 0)
+            self.assertTrue(all(stats['simulations'] <= 10 for stats in searched))
+        # the configuration line keeps the options given
+        self.assertEqual({'iterations': 10}, lines[0]['A'])
+        
+if __name__ == '__main__':
+    unittest.main()